@@ -0,0 +1,145 @@
+"""
+Warm-container span accumulation: the count, size and age thresholds, the
+memory cap and drop accounting, export failures, the SIGTERM flush, and the
+cost of buffering a span.
+"""
+
+import os
+import signal
+import threading
+import time
+
+import pytest
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+from conftest import Clock
+from otel_sqs import accumulating
+from otel_sqs.accumulating import AccumulatingSpanProcessor, estimate_span_bytes, flush_on_shutdown
+
+
+class _RecordingExporter(SpanExporter):
+    def __init__(self, result=SpanExportResult.SUCCESS):
+        self.result = result
+        self.batches = []
+        self.exported = threading.Event()
+        self.shut_down = False
+
+    def export(self, spans):
+        self.batches.append(list(spans))
+        self.exported.set()
+        return self.result
+
+    def shutdown(self):
+        self.shut_down = True
+
+
+@pytest.fixture
+def spans(tracer, span_exporter):
+    for i in range(10):
+        with tracer.start_as_current_span(f"span-{i}") as span:
+            span.set_attribute("messaging.system", "sqs")
+    return span_exporter.get_finished_spans()
+
+
+def _processor(exporter, **kwargs) -> AccumulatingSpanProcessor:
+    kwargs.setdefault("max_spans", 1000)
+    kwargs.setdefault("max_bytes", 10**6)
+    kwargs.setdefault("max_age_s", 60)
+    kwargs.setdefault("memory_cap_bytes", 10**7)
+    return AccumulatingSpanProcessor(exporter, **kwargs)
+
+
+def test_count_threshold_exports_off_the_request_path(spans):
+    exporter = _RecordingExporter()
+    processor = _processor(exporter, max_spans=3)
+    for span in spans[:2]:
+        processor.on_end(span)
+    assert not processor.is_due() and not exporter.batches
+    processor.on_end(spans[2])
+    # The background thread exports; on_end only wakes it
+    assert exporter.exported.wait(5)
+    assert [len(batch) for batch in exporter.batches] == [3]
+    assert processor.exported_spans == 3 and processor.buffered_spans == 0
+
+
+def test_byte_threshold(spans):
+    exporter = _RecordingExporter()
+    processor = _processor(exporter, max_bytes=estimate_span_bytes(spans[0]) * 2)
+    processor.on_end(spans[0])
+    assert not processor.is_due()
+    processor.on_end(spans[1])
+    assert exporter.exported.wait(5)
+    assert len(exporter.batches[0]) == 2
+
+
+def test_age_threshold_on_force_flush(spans):
+    clock = Clock()
+    exporter = _RecordingExporter()
+    processor = _processor(exporter, max_age_s=60, clock=clock)
+    processor.on_end(spans[0])
+    clock.now = 30.0
+    processor.on_end(spans[1])
+    # End of an invocation below every threshold: nothing is sent
+    assert processor.force_flush() and not exporter.batches
+    clock.now = 60.0
+    assert processor.force_flush()
+    assert [len(batch) for batch in exporter.batches] == [2]
+
+
+def test_memory_cap_and_failed_exports_are_counted(monkeypatch, spans):
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter("benchmarks")
+    monkeypatch.setattr(accumulating, "_dropped_counter", meter.create_counter("telemetry.accumulator.spans_dropped"))
+    exporter = _RecordingExporter(SpanExportResult.FAILURE)
+    processor = _processor(exporter, memory_cap_bytes=estimate_span_bytes(spans[0]) * 3)
+    for span in spans[:5]:
+        processor.on_end(span)
+    assert processor.buffered_spans == 3 and processor.dropped_spans == 2
+
+    assert not processor.export_now()
+    assert processor.dropped_spans == 5 and processor.exported_spans == 0
+    [metric] = reader.get_metrics_data().resource_metrics[0].scope_metrics[0].metrics
+    assert {point.attributes["reason"]: point.value for point in metric.data.data_points} == {
+        "memory_cap": 2, "export_failed": 3,
+    }
+
+
+def test_shutdown_exports_and_stops_buffering(spans):
+    exporter = _RecordingExporter()
+    processor = _processor(exporter)
+    processor.on_end(spans[0])
+    processor.shutdown()
+    assert [len(batch) for batch in exporter.batches] == [1] and exporter.shut_down
+    processor.on_end(spans[1])
+    assert processor.buffered_spans == 0
+
+
+def test_flush_on_shutdown(spans):
+    exporter = _RecordingExporter()
+    processor = _processor(exporter)
+    processor.on_end(spans[0])
+
+    class _Provider:
+        def shutdown(self):
+            processor.shutdown()
+
+    chained = []
+    original = signal.signal(signal.SIGTERM, lambda signum, frame: chained.append(signum))
+    try:
+        assert flush_on_shutdown(_Provider())
+        os.kill(os.getpid(), signal.SIGTERM)
+        deadline = time.monotonic() + 5
+        while not chained and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        signal.signal(signal.SIGTERM, original)
+    # Buffered spans are exported, then the previous handler still runs
+    assert [len(batch) for batch in exporter.batches] == [1]
+    assert chained == [signal.SIGTERM]
+
+
+def test_on_end_overhead(benchmark, spans):
+    processor = _processor(_RecordingExporter(), max_spans=10**9, max_bytes=10**12, memory_cap_bytes=10**12)
+    benchmark(processor.on_end, spans[0])
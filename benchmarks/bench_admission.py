@@ -0,0 +1,140 @@
+"""
+Queue-depth admission control: policy decisions, the per-container depth
+cache, the per-request overhead, and the API handler under a sustained
+overload.
+"""
+
+import json
+import random
+
+import pytest
+
+from conftest import Clock, FakeLambdaContext, load_handler
+from otel_sqs.admission import AdmissionController
+from otel_sqs.lanes import PriorityRouter
+
+DEFAULT_URL = "https://sqs.eu-central-1.amazonaws.com/123456789012/otel-alml-poc-queue"
+LOW_URL = "https://sqs.eu-central-1.amazonaws.com/123456789012/otel-alml-poc-low"
+
+
+class _DepthSQS:
+    """GetQueueAttributes from a settable depth per queue; sends grow the depth"""
+
+    def __init__(self, **depths):
+        self.depths = {DEFAULT_URL: depths.get("default", 0), LOW_URL: depths.get("low", 0)}
+        self.attribute_calls = 0
+        self.sent = []
+        self.fail = False
+
+    def get_queue_attributes(self, QueueUrl, AttributeNames):
+        self.attribute_calls += 1
+        if self.fail:
+            raise ConnectionError("endpoint unreachable")
+        return {"Attributes": {"ApproximateNumberOfMessages": str(self.depths[QueueUrl])}}
+
+    def send_message(self, **kwargs):
+        self.sent.append(kwargs)
+        self.depths[kwargs["QueueUrl"]] += 1
+        return {"MessageId": f"msg-{len(self.sent)}"}
+
+
+def _controller(policy, sqs, **kwargs) -> AdmissionController:
+    kwargs.setdefault("clock", Clock())
+    router = PriorityRouter(DEFAULT_URL, {"low": LOW_URL})
+    return AdmissionController(policy, max_depth=100, router=router, sqs_client=sqs, **kwargs)
+
+
+def test_reject():
+    sqs = _DepthSQS(default=99)
+    controller = _controller("reject", sqs, refresh_s=0)
+    assert controller.decide("default", DEFAULT_URL).action == "admit"
+    sqs.depths[DEFAULT_URL] = 100
+    decision = controller.decide("default", DEFAULT_URL)
+    assert (decision.action, decision.queue_depth, decision.retry_after_s) == ("reject", 100, 30)
+    assert not decision.admitted
+
+
+def test_shed_probability():
+    sqs = _DepthSQS(default=75)
+    controller = _controller("shed", sqs, soft_depth=50, rng=lambda: 0.4)
+    assert controller.shed_probability(50) == 0.0
+    assert controller.shed_probability(75) == 0.5
+    assert controller.shed_probability(150) == 1.0
+    decision = controller.decide("default", DEFAULT_URL)
+    assert (decision.action, decision.shed_probability) == ("shed", 0.5)
+    assert _controller("shed", sqs, soft_depth=50, rng=lambda: 0.6).decide("default", DEFAULT_URL).action == "admit"
+
+
+def test_degrade_to_low_lane():
+    sqs = _DepthSQS(default=500, low=10)
+    controller = _controller("degrade", sqs, refresh_s=0)
+    decision = controller.decide("default", DEFAULT_URL)
+    assert (decision.action, decision.lane, decision.queue_url) == ("degrade", "low", LOW_URL)
+    assert decision.admitted
+    # Once the low lane is full too, requests are refused
+    sqs.depths[LOW_URL] = 100
+    assert controller.decide("default", DEFAULT_URL).action == "reject"
+    assert controller.decide("low", LOW_URL).action == "reject"
+
+
+def test_depth_cache_and_fail_open():
+    clock = Clock()
+    sqs = _DepthSQS(default=500)
+    controller = _controller("reject", sqs, clock=clock, refresh_s=5)
+    sqs.fail = True
+    # Never seen the queue: admit rather than take the API down
+    assert controller.decide("default", DEFAULT_URL).action == "admit"
+    sqs.fail = False
+    for _ in range(10):
+        assert controller.decide("default", DEFAULT_URL).action == "reject"
+    assert sqs.attribute_calls == 2
+    clock.now = 5.0
+    sqs.fail = True
+    # The last known depth still applies while SQS cannot be asked
+    assert controller.decide("default", DEFAULT_URL).action == "reject"
+    assert controller.cached_depths() == {DEFAULT_URL: 500}
+
+
+def test_disabled_skips_sqs():
+    sqs = _DepthSQS(default=10**6)
+    assert _controller(None, sqs).decide("default", DEFAULT_URL).action == "admit"
+    assert sqs.attribute_calls == 0
+    with pytest.raises(ValueError):
+        _controller("drop", sqs)
+
+
+def test_decide_overhead(benchmark):
+    controller = _controller("shed", _DepthSQS(default=75), soft_depth=50)
+    benchmark(controller.decide, "default", DEFAULT_URL)
+
+
+def _request(api, message: str) -> dict:
+    event = {"httpMethod": "POST", "path": "/process", "body": json.dumps({"message": message})}
+    return api.handler(event, FakeLambdaContext())
+
+
+@pytest.mark.parametrize("policy", ["reject", "shed"])
+def test_handler_under_overload(monkeypatch, span_exporter, policy):
+    api = load_handler("lambda1")
+    sqs = _DepthSQS()
+    monkeypatch.setattr(api, "test_connectivity", lambda: True)
+    monkeypatch.setattr(api, "sqs", sqs)
+    monkeypatch.setattr(api, "priority_router", PriorityRouter(DEFAULT_URL))
+    # Seeded: shedding below max_depth is random, and the last request must find a full queue
+    controller = AdmissionController(policy, max_depth=100, refresh_s=0, sqs_client=sqs, rng=random.Random(7).random)
+    monkeypatch.setattr(api, "admission_control", controller)
+
+    statuses = [_request(api, f"request-{i}")["statusCode"] for i in range(300)]
+
+    # The worker is gone: the backlog stops at the limit instead of growing with the load
+    assert sqs.depths[DEFAULT_URL] <= 100
+    assert statuses.count(200) == len(sqs.sent)
+    assert statuses.count(429) == 300 - len(sqs.sent)
+
+    response = _request(api, "one more")
+    assert response["statusCode"] == 429
+    assert response["headers"]["Retry-After"] == "30"
+    span = span_exporter.get_finished_spans()[-1]
+    assert span.attributes["http.admission.decision"] in ("reject", "shed")
+    assert span.attributes["http.admission.queue_depth"] == sqs.depths[DEFAULT_URL]
+    assert span.attributes["http.status_code"] == 429
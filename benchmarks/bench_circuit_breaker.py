@@ -0,0 +1,180 @@
+"""
+Telemetry circuit breaker: closed -> open -> half-open -> closed, slow calls
+counting as failures, breakers shared per collector host, skipped batches being
+counted, and the spool replayed by the probe once the endpoint recovers.
+"""
+
+import threading
+
+import pytest
+from opentelemetry.context import _SUPPRESS_INSTRUMENTATION_KEY, get_value
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+from conftest import Clock
+from otel_sqs import circuit_breaker
+from otel_sqs.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitBreakerSpanExporter,
+    get_breaker,
+)
+
+ENDPOINT = "http://collector:4318"
+
+
+class _FlakyExporter(SpanExporter):
+    """Raises while ``healthy`` is False; records every batch it was asked to send"""
+
+    def __init__(self):
+        self.healthy = False
+        self.batches = []
+        self.suppressed = []
+
+    def export(self, spans):
+        self.batches.append(list(spans))
+        self.suppressed.append(get_value(_SUPPRESS_INSTRUMENTATION_KEY))
+        if not self.healthy:
+            raise ConnectionError("collector unreachable")
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    breaker = CircuitBreaker(ENDPOINT, failure_threshold=3, reset_timeout_s=30, clock=clock)
+    monkeypatch.setattr(circuit_breaker, "_breakers", {ENDPOINT: breaker})
+    return breaker
+
+
+@pytest.fixture
+def skipped(monkeypatch):
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter("benchmarks")
+    monkeypatch.setattr(circuit_breaker, "_skipped_counter", meter.create_counter("telemetry.exporter.circuit.skipped"))
+
+    def points():
+        data = reader.get_metrics_data()
+        if data is None:
+            return {}
+        [metric] = data.resource_metrics[0].scope_metrics[0].metrics
+        return {point.attributes["signal"]: point.value for point in metric.data.data_points}
+
+    return points
+
+
+def _join_probe():
+    for thread in threading.enumerate():
+        if thread.name.startswith("otel-circuit-probe-"):
+            thread.join(5)
+
+
+def test_state_transitions(breaker, clock):
+    for _ in range(2):
+        breaker.record(False, 10.0)
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record(False, 10.0)
+    assert breaker.state == OPEN and not breaker.allow()
+
+    # Stays open until the reset timeout, then exactly one caller gets the probe
+    clock.now = 29.0
+    assert not breaker.try_begin_probe()
+    clock.now = 30.0
+    assert breaker.try_begin_probe() and breaker.state == HALF_OPEN
+    assert not breaker.try_begin_probe() and not breaker.allow()
+
+    # A failed probe reopens for another full timeout
+    breaker.record(False, 10.0)
+    assert breaker.state == OPEN
+    clock.now = 59.0
+    assert not breaker.try_begin_probe()
+    clock.now = 60.0
+    assert breaker.try_begin_probe()
+    breaker.record(True, 10.0)
+    assert breaker.state == CLOSED and breaker.consecutive_failures == 0
+
+
+def test_slow_calls_count_as_failures(breaker):
+    for _ in range(3):
+        breaker.record(True, breaker.slow_call_ms)
+    assert breaker.state == OPEN
+    # One success in between resets the streak
+    breaker.record(True, 10.0)
+    breaker.record(False, 10.0)
+    breaker.record(False, 10.0)
+    breaker.record(True, 10.0)
+    assert breaker.state == CLOSED and breaker.consecutive_failures == 0
+
+
+def test_breakers_are_shared_per_host(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setenv("TELEMETRY_CIRCUIT_FAILURE_THRESHOLD", "5")
+    traces = get_breaker(ENDPOINT + "/v1/traces")
+    assert get_breaker(ENDPOINT + "/v1/metrics") is traces
+    assert get_breaker("http://other:4318/v1/traces") is not traces
+    assert traces.endpoint == ENDPOINT and traces.failure_threshold == 5
+
+
+def test_open_circuit_skips_batches(breaker, skipped):
+    exporter = _FlakyExporter()
+    wrapped = CircuitBreakerSpanExporter(exporter, ENDPOINT + "/v1/traces", spool_batches=0)
+    for i in range(3):
+        assert wrapped.export([f"span-{i}"]) == SpanExportResult.FAILURE
+    assert breaker.state == OPEN and len(exporter.batches) == 3 and skipped() == {}
+
+    # Fails fast without calling the exporter
+    for i in range(3, 5):
+        assert wrapped.export([f"span-{i}"]) == SpanExportResult.FAILURE
+    assert len(exporter.batches) == 3
+    assert skipped() == {"traces": 2}
+
+
+def test_spool_replayed_after_recovery(breaker, clock, skipped):
+    exporter = _FlakyExporter()
+    wrapped = CircuitBreakerSpanExporter(exporter, ENDPOINT + "/v1/traces", spool_batches=3)
+    for i in range(3):
+        wrapped.export([f"failed-{i}"])
+    assert breaker.state == OPEN
+
+    # Spooled while open; the oldest falls out once the spool is full
+    for name in ("a", "b", "c", "d"):
+        assert wrapped.export([name]) == SpanExportResult.FAILURE
+    assert len(exporter.batches) == 3
+
+    # The probe takes the oldest spooled batch and fails: the rest stay spooled
+    clock.now = 30.0
+    wrapped.export(["e"])
+    _join_probe()
+    assert exporter.batches[3:] == [["c"]] and breaker.state == OPEN
+
+    exporter.healthy = True
+    clock.now = 60.0
+    wrapped.export(["f"])
+    _join_probe()
+    assert breaker.state == CLOSED
+    assert exporter.batches[4:] == [["d"], ["e"], ["f"]]
+    # Probe and replay run with instrumentation suppressed
+    assert exporter.suppressed[3:] == [True] * 4
+    assert skipped() == {"traces": 6}
+
+    # Closed again: batches go straight through
+    assert wrapped.export(["g"]) == SpanExportResult.SUCCESS
+    assert exporter.batches[-1] == ["g"]
+
+
+def test_export_overhead_when_open(benchmark, breaker):
+    breaker.record(False, 10.0)
+    breaker.record(False, 10.0)
+    breaker.record(False, 10.0)
+    wrapped = CircuitBreakerSpanExporter(_FlakyExporter(), ENDPOINT + "/v1/traces", spool_batches=0)
+    benchmark(wrapped.export, ["span"])
@@ -0,0 +1,131 @@
+"""
+Claim-check offload and resolution against the in-process S3 stand-in:
+producer upload (single PUT and concurrent multipart), worker streaming
+resolution, and the full worker handler deleting objects after success, or
+leaving them to the lifecycle rule when the delete fails.
+"""
+
+import base64
+import json
+import random
+
+import pytest
+
+from conftest import FakeLambdaContext, load_handler, make_sqs_record
+from local_s3 import LocalS3
+from otel_sqs.claim_check import CLAIM_CHECK_ATTRIBUTE, POINTER_KEY, ClaimCheckStore, claim_checks
+from otel_sqs.codec import BodyCodec
+
+BUCKET = "otel-alml-poc-claim-check"
+# One PUT just above the SQS limit, and a multipart upload (8 MiB parts)
+PAYLOAD_SIZES = {"300kb": 300 * 1024, "20mb": 20 * 1024 * 1024}
+
+
+@pytest.fixture(scope="module")
+def local_s3():
+    s3 = LocalS3().start()
+    yield s3
+    s3.stop()
+
+
+@pytest.fixture
+def store(local_s3):
+    return ClaimCheckStore(bucket=BUCKET, s3_client=local_s3.client())
+
+
+def _body(size: int) -> str:
+    # Random base64 does not compress, so the codec leaves it at full size
+    rng = random.Random(size)
+    blob = base64.b64encode(rng.getrandbits(size * 6).to_bytes(size * 3 // 4, "big")).decode()
+    return json.dumps({"requestId": "bench", "data": {"blob": blob}})
+
+
+def _sqs_record(body: str, message_attributes: dict) -> dict:
+    record = make_sqs_record({}, {})
+    record["body"] = body
+    record["messageAttributes"] = {
+        name: {"stringValue": a["StringValue"], "dataType": a["DataType"]} for name, a in message_attributes.items()
+    }
+    return record
+
+
+@pytest.mark.parametrize("payload", list(PAYLOAD_SIZES))
+def test_offload(benchmark, local_s3, store, payload):
+    body = BodyCodec().encode_message(_body(PAYLOAD_SIZES[payload]), {})
+    uploads_before = local_s3.multipart_uploads
+
+    def offload():
+        message_attributes = {}
+        return store.offload(body, message_attributes), message_attributes
+
+    pointer_body, message_attributes = benchmark.pedantic(offload, rounds=3, iterations=1)
+    pointer = json.loads(pointer_body)[POINTER_KEY]
+    assert len(pointer_body) < 256
+    assert message_attributes[CLAIM_CHECK_ATTRIBUTE]["StringValue"] == "s3"
+    assert local_s3.objects[(BUCKET, pointer["key"])] == body.encode()
+    assert (local_s3.multipart_uploads > uploads_before) == (len(body) >= 8 * 1024 * 1024)
+
+
+@pytest.mark.parametrize("payload", list(PAYLOAD_SIZES))
+def test_resolve(benchmark, store, payload):
+    codec = BodyCodec()
+    original = _body(PAYLOAD_SIZES[payload])
+    message_attributes = {}
+    pointer_body = json.loads(store.offload(codec.encode_message(original, message_attributes), message_attributes))
+
+    payload_json = benchmark.pedantic(store.load_json, args=(pointer_body, codec), rounds=3, iterations=1)
+    assert payload_json == json.loads(original)
+
+
+def test_compressed_payload_roundtrip(store):
+    # Compressible bodies keep their content-encoding on the pointer, not on the message
+    codec = BodyCodec()
+    rng = random.Random(0)
+    items = [{"sku": f"SKU-{rng.randint(1, 99999):05d}", "price": round(rng.uniform(1, 500), 2)} for _ in range(40_000)]
+    original = json.dumps({"data": items})
+    message_attributes = {}
+    encoded = codec.encode_message(original, message_attributes)
+    assert len(encoded) > store.threshold
+    pointer_body = json.loads(store.offload(encoded, message_attributes))
+    assert "content-encoding" not in message_attributes
+    assert pointer_body[POINTER_KEY]["contentEncoding"] == codec.encoding
+    assert store.load_json(pointer_body, codec) == json.loads(original)
+
+
+def test_worker_handler_resolves_and_deletes(monkeypatch, local_s3, store, span_exporter):
+    worker = load_handler("lambda2")
+    monkeypatch.setattr(claim_checks, "_client", store.client)
+
+    original = _body(PAYLOAD_SIZES["300kb"])
+    message_attributes = {}
+    pointer_body = store.offload(original, message_attributes)
+    key = json.loads(pointer_body)[POINTER_KEY]["key"]
+
+    result = worker.handler({"Records": [_sqs_record(pointer_body, message_attributes)]}, FakeLambdaContext())
+    assert result == {"batchItemFailures": []}
+    assert (BUCKET, key) not in local_s3.objects
+
+
+class _DeleteDeniedS3:
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def delete_objects(self, **kwargs):
+        raise RuntimeError("AccessDenied")
+
+
+def test_failed_delete_does_not_fail_batch(monkeypatch, local_s3, store, span_exporter):
+    worker = load_handler("lambda2")
+    monkeypatch.setattr(claim_checks, "_client", _DeleteDeniedS3(store.client))
+
+    message_attributes = {}
+    pointer_body = store.offload(_body(PAYLOAD_SIZES["300kb"]), message_attributes)
+    key = json.loads(pointer_body)[POINTER_KEY]["key"]
+
+    result = worker.handler({"Records": [_sqs_record(pointer_body, message_attributes)]}, FakeLambdaContext())
+    assert result == {"batchItemFailures": []}
+    # Left for the lifecycle rule
+    assert (BUCKET, key) in local_s3.objects
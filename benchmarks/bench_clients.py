@@ -0,0 +1,105 @@
+"""
+Client factory: the tuned botocore config, connections primed before the
+first request, pool hit/miss accounting, and first-request latency of a
+primed against a cold client on the in-process SQS stand-in.
+"""
+
+import types
+import uuid
+
+import pytest
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from otel_sqs import clients
+from otel_sqs.clients import client_config, create_client, pool_stats, prime
+
+
+def _client(local_sqs, **kwargs):
+    return create_client(
+        "sqs", endpoint_url=local_sqs.endpoint_url, region_name="eu-central-1",
+        aws_access_key_id="local", aws_secret_access_key="local", **kwargs,
+    )
+
+
+def test_client_config(monkeypatch):
+    monkeypatch.setenv("AWS_CLIENT_RETRY_MODE", "adaptive")
+    config = client_config(max_pool_connections=32)
+    assert config.max_pool_connections == 32
+    assert config.retries == {"mode": "adaptive", "max_attempts": 3}
+    assert (config.connect_timeout, config.read_timeout) == (2.0, 10.0)
+    assert config.tcp_keepalive is True
+    # Long polling needs reads longer than the wait
+    assert client_config(read_timeout_s=30).read_timeout == 30
+
+
+def test_primed_client_skips_connect(local_sqs):
+    queue_url = local_sqs.create_queue(f"otel-alml-poc-queue-{uuid.uuid4().hex[:8]}")
+    cold = _client(local_sqs)
+    cold.send_message(QueueUrl=queue_url, MessageBody="{}")
+    assert pool_stats(cold) == (0, 1)
+
+    primed = _client(local_sqs, prime_connections=2)
+    assert pool_stats(primed) == (0, 0)
+    for _ in range(5):
+        primed.send_message(QueueUrl=queue_url, MessageBody="{}")
+    assert pool_stats(primed) == (5, 0)
+
+
+def test_prime_fails_open():
+    client = create_client(
+        "sqs", endpoint_url="http://127.0.0.1:9", region_name="eu-central-1",
+        aws_access_key_id="local", aws_secret_access_key="local",
+    )
+    assert prime(client, 2) == 0
+
+
+def test_failed_priming_counts_as_miss(monkeypatch, local_sqs):
+    queue_url = local_sqs.create_queue(f"otel-alml-poc-queue-{uuid.uuid4().hex[:8]}")
+    monkeypatch.setattr(clients, "_connect", lambda connection: connection.close() or False)
+    client = _client(local_sqs, prime_connections=1)
+    # The first request reconnects the connection that failed to prime
+    client.send_message(QueueUrl=queue_url, MessageBody="{}")
+    assert pool_stats(client) == (0, 1)
+
+
+def test_unknown_internals_mean_no_stats(monkeypatch, local_sqs):
+    client = _client(local_sqs)
+    monkeypatch.setattr(clients, "_pool", lambda client: types.SimpleNamespace(pool=types.SimpleNamespace(maxsize=10)))
+    assert prime(client, 2) == 0
+    monkeypatch.setattr(client._endpoint, "http_session", object())
+    assert pool_stats(client) is None
+    monkeypatch.setattr(clients, "_clients", clients.weakref.WeakSet([client]))
+    assert list(clients._observe_hits(None)) == [] and list(clients._observe_misses(None)) == []
+
+
+def test_pool_counters(monkeypatch, local_sqs):
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter("benchmarks")
+    monkeypatch.setattr(clients, "_clients", clients.weakref.WeakSet())
+    meter.create_observable_counter("aws.client.connection_pool.hits", callbacks=[clients._observe_hits])
+    meter.create_observable_counter("aws.client.connection_pool.misses", callbacks=[clients._observe_misses])
+    queue_url = local_sqs.create_queue(f"otel-alml-poc-queue-{uuid.uuid4().hex[:8]}")
+    client = _client(local_sqs)
+    for _ in range(3):
+        client.send_message(QueueUrl=queue_url, MessageBody="{}")
+
+    values = {
+        metric.name: {point.attributes["service"]: point.value for point in metric.data.data_points}
+        for metric in reader.get_metrics_data().resource_metrics[0].scope_metrics[0].metrics
+    }
+    assert values == {"aws.client.connection_pool.hits": {"sqs": 2}, "aws.client.connection_pool.misses": {"sqs": 1}}
+
+
+@pytest.mark.parametrize("primed", [False, True], ids=["cold", "primed"])
+def test_first_request_latency(benchmark, local_sqs, primed):
+    queue_url = local_sqs.create_queue(f"otel-alml-poc-queue-{uuid.uuid4().hex[:8]}")
+
+    def setup():
+        client = _client(local_sqs, prime_connections=1 if primed else 0)
+        return (client,), {}
+
+    def first_send(client):
+        return client.send_message(QueueUrl=queue_url, MessageBody="{}")
+
+    benchmark.pedantic(first_send, setup=setup, rounds=20)
@@ -0,0 +1,90 @@
+"""
+SQS body codec throughput and compression ratio on order-like JSON payloads,
+with and without a preset dictionary. Ratios are stored in each result's
+``extra_info``.
+"""
+
+import json
+import random
+
+import pytest
+
+from otel_sqs.codec import CONTENT_ENCODING_ATTRIBUTE, BodyCodec
+
+# Approximate serialized sizes: below the threshold, one SQS billing chunk, close to the 256 KB cap
+PAYLOAD_ITEMS = {"600b": 4, "16kb": 145, "200kb": 1800}
+
+
+def _order(items: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    return {
+        "requestId": f"{rng.getrandbits(128):032x}",
+        "timestamp": 1700000000000 + seed,
+        "data": {
+            "customer": {"id": f"C-{rng.randint(1, 10**6):07d}", "tier": rng.choice(["gold", "silver", "bronze"])},
+            "currency": "EUR",
+            "items": [
+                {
+                    "sku": f"SKU-{rng.randint(1, 5000):05d}",
+                    "name": rng.choice(["Widget", "Gadget", "Sprocket", "Flange"]) + f" {rng.randint(1, 99)}",
+                    "quantity": rng.randint(1, 20),
+                    "unitPrice": round(rng.uniform(1, 500), 2),
+                    "warehouse": rng.choice(["eu-central-1a", "eu-central-1b", "eu-central-1c"]),
+                }
+                for _ in range(items)
+            ],
+        },
+    }
+
+
+# A sample order shares keys and common values with the benchmarked ones, as a real dictionary would
+DICTIONARY = json.dumps(_order(8, seed=0)).encode("utf-8")
+
+CODECS = {"zlib": BodyCodec(), "zlib_dict": BodyCodec(dictionary=DICTIONARY)}
+
+
+@pytest.mark.parametrize("codec_name", list(CODECS))
+@pytest.mark.parametrize("payload", list(PAYLOAD_ITEMS))
+def test_encode(benchmark, payload, codec_name):
+    codec = CODECS[codec_name]
+    body = json.dumps(_order(PAYLOAD_ITEMS[payload], seed=1))
+
+    def encode():
+        message_attributes = {}
+        return codec.encode_message(body, message_attributes), message_attributes
+
+    encoded, message_attributes = benchmark(encode)
+    benchmark.extra_info["raw_bytes"] = len(body)
+    benchmark.extra_info["sent_bytes"] = len(encoded)
+    benchmark.extra_info["ratio"] = round(len(body) / len(encoded), 2)
+
+    if len(body) < codec.threshold:
+        assert encoded == body and not message_attributes
+    else:
+        assert len(encoded) < len(body) / 2
+        assert message_attributes[CONTENT_ENCODING_ATTRIBUTE]["StringValue"] == codec.encoding
+
+
+@pytest.mark.parametrize("codec_name", list(CODECS))
+@pytest.mark.parametrize("payload", list(PAYLOAD_ITEMS))
+def test_decode(benchmark, payload, codec_name):
+    codec = CODECS[codec_name]
+    body = json.dumps(_order(PAYLOAD_ITEMS[payload], seed=1))
+    message_attributes = {}
+    encoded = codec.encode_message(body, message_attributes)
+    # Lambda event shape, as lambda2 receives it
+    record = {
+        "body": encoded,
+        "messageAttributes": {
+            name: {"stringValue": a["StringValue"], "dataType": a["DataType"]} for name, a in message_attributes.items()
+        },
+    }
+
+    assert benchmark(codec.decode_record, record) == body
+
+
+def test_dictionary_mismatch_is_rejected():
+    message_attributes = {}
+    encoded = CODECS["zlib_dict"].encode_message(json.dumps(_order(80, seed=1)), message_attributes)
+    with pytest.raises(ValueError):
+        CODECS["zlib"].decode(encoded, message_attributes[CONTENT_ENCODING_ATTRIBUTE]["StringValue"])
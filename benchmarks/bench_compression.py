@@ -0,0 +1,117 @@
+"""
+Streaming gzip exporters against a local OTLP/HTTP stub: posted bodies
+decompressing to exactly what the stock encoders serialize, the reused
+compressor template, the retry loop, and compression cost per batch.
+"""
+
+import gzip
+import io
+import time
+import types
+import zlib
+
+import pytest
+from opentelemetry.exporter.otlp.proto.common.metrics_encoder import encode_metrics
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader, MetricExportResult
+from opentelemetry.sdk.trace.export import SpanExportResult
+
+from conftest import HTTPStub
+from otel_sqs import compression
+from otel_sqs.compression import GzipOTLPMetricExporter, GzipOTLPSpanExporter, GzipStage, request_chunks
+
+
+@pytest.fixture
+def collector():
+    statuses = []
+    stub = HTTPStub(lambda method, path, headers, body: (statuses.pop(0) if statuses else 200, {}, b""))
+    stub.statuses = statuses
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(compression, "time", types.SimpleNamespace(perf_counter=time.perf_counter, sleep=delays.append))
+    return delays
+
+
+@pytest.fixture
+def spans(tracer, span_exporter):
+    for i in range(20):
+        with tracer.start_as_current_span(f"sqs_message_processing-{i}") as span:
+            span.set_attribute("messaging.system", "sqs")
+            span.set_attribute("messaging.message.id", f"msg-{i}")
+    return span_exporter.get_finished_spans()
+
+
+def _gunzip(body: bytes) -> bytes:
+    return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+
+
+def test_posted_spans_match_stock_encoding(collector, spans):
+    exporter = GzipOTLPSpanExporter(endpoint=collector.url + "/v1/traces")
+    assert exporter.export(spans) == SpanExportResult.SUCCESS
+    [(method, path, headers, body)] = collector.requests
+    assert (method, path) == ("POST", "/v1/traces")
+    assert headers["Content-Encoding"] == "gzip" and headers["Content-Type"] == "application/x-protobuf"
+    assert _gunzip(body) == encode_spans(spans).SerializeToString()
+
+
+def test_posted_metrics_match_stock_encoding(collector):
+    reader = InMemoryMetricReader()
+    counter = MeterProvider(metric_readers=[reader]).get_meter("benchmarks").create_counter("sqs.messages")
+    counter.add(3, {"queue": "otel-alml-poc-queue"})
+    metrics_data = reader.get_metrics_data()
+    exporter = GzipOTLPMetricExporter(endpoint=collector.url + "/v1/metrics")
+    assert exporter.export(metrics_data) == MetricExportResult.SUCCESS
+    assert _gunzip(collector.requests[0][3]) == encode_metrics(metrics_data).SerializeToString()
+
+
+def test_template_is_reused(spans):
+    stage = GzipStage("traces", level=6)
+    resource_spans = encode_spans(spans).resource_spans
+    first = stage.compress(request_chunks(resource_spans))
+    # Each batch compresses from a copy: the template itself is never fed
+    assert stage.compress(request_chunks(resource_spans)) == first
+    assert _gunzip(stage.compress(request_chunks([]))) == b""
+
+
+def test_retry_posts_the_same_body(collector, sleeps, spans):
+    exporter = GzipOTLPSpanExporter(endpoint=collector.url + "/v1/traces")
+    collector.statuses.extend([503, 408])
+    assert exporter.export(spans) == SpanExportResult.SUCCESS
+    bodies = [body for _, _, _, body in collector.requests]
+    assert len(bodies) == 3 and len(set(bodies)) == 1
+    assert sleeps == [1, 2]
+
+    # Non-retryable status: one attempt, no sleep
+    collector.requests.clear()
+    collector.statuses.append(400)
+    assert exporter.export(spans) == SpanExportResult.FAILURE
+    assert len(collector.requests) == 1 and sleeps == [1, 2]
+
+    # Transient errors until the backoff reaches its cap
+    collector.requests.clear()
+    collector.statuses.extend([503] * 10)
+    assert exporter.export(spans) == SpanExportResult.FAILURE
+    assert sleeps[2:] == [1, 2, 4, 8, 16, 32] and len(collector.requests) == 6
+
+
+def _stock_gzip(spans) -> bytes:
+    # What the stock exporter does on every attempt
+    data = io.BytesIO()
+    with gzip.GzipFile(fileobj=data, mode="w", compresslevel=6) as gzip_stream:
+        gzip_stream.write(encode_spans(spans).SerializeToString())
+    return data.getvalue()
+
+
+def test_stock_gzip_per_batch(benchmark, spans):
+    benchmark(_stock_gzip, spans)
+
+
+def test_streaming_gzip_per_batch(benchmark, spans):
+    stage = GzipStage("traces", level=6)
+    benchmark(lambda: stage.compress(request_chunks(encode_spans(spans).resource_spans)))
@@ -0,0 +1,176 @@
+"""
+Standalone long-polling consumer against the in-process SQS stand-in:
+end-to-end throughput through the worker's process_records, span parity with
+the Lambda path, failed batches, the bounded buffer, the SIGTERM drain and
+worker threads sharing the extraction and idempotency caches.
+"""
+
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+
+import pytest
+
+from conftest import load_handler
+from otel_sqs import extraction
+from otel_sqs.consumer import SQSConsumer
+from otel_sqs.extraction import ContextCache
+from otel_sqs.idempotency import LRUCache
+
+MESSAGE_COUNTS = [100, 1000]
+
+
+@pytest.fixture
+def queue_url(local_sqs):
+    return local_sqs.create_queue(f"otel-alml-poc-queue-{uuid.uuid4().hex[:8]}")
+
+
+def _send(client, queue_url: str, count: int, carrier: dict):
+    message_attributes = {key: {"StringValue": value, "DataType": "String"} for key, value in carrier.items()}
+    for start in range(0, count, 10):
+        entries = []
+        for i in range(start, min(start + 10, count)):
+            body = {"requestId": str(uuid.uuid4()), "message": "Testing trace propagation", "test_id": f"bench-{i}"}
+            entries.append({"Id": str(i - start), "MessageBody": json.dumps(body), "MessageAttributes": message_attributes})
+        client.send_message_batch(QueueUrl=queue_url, Entries=entries)
+
+
+def _wait_until(predicate, timeout_s: float = 30.0):
+    deadline = time.monotonic() + timeout_s
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _consumer(local_sqs, queue_url: str, process_batch=None, **kwargs) -> SQSConsumer:
+    worker = load_handler("lambda2")
+    kwargs.setdefault("wait_time_s", 1)
+    kwargs.setdefault("drain_timeout_s", 10)
+    return SQSConsumer(queue_url, process_batch or worker.process_records, sqs_client=local_sqs.client(), **kwargs)
+
+
+@pytest.mark.parametrize("message_count", MESSAGE_COUNTS)
+def test_consumer_throughput(benchmark, local_sqs, span_exporter, trace_carrier, message_count):
+    client = local_sqs.client()
+    rounds = []
+
+    def fill_queue():
+        span_exporter.clear()
+        queue_url = local_sqs.create_queue(f"otel-alml-poc-queue-{uuid.uuid4().hex[:8]}")
+        _send(client, queue_url, message_count, trace_carrier)
+        consumer = _consumer(local_sqs, queue_url)
+        rounds.append((consumer, local_sqs.queue(queue_url)))
+        return (consumer, local_sqs.queue(queue_url)), {}
+
+    def consume(consumer, queue):
+        consumer.start()
+        _wait_until(lambda: len(queue) == 0)
+
+    benchmark.pedantic(consume, setup=fill_queue, rounds=3, iterations=1)
+    for consumer, queue in rounds:
+        assert consumer.drain()
+        assert queue.deleted == message_count
+    # Deletes are coalesced into batches, not sent per message
+    assert consumer.delete_calls < message_count / 5
+    assert len(span_exporter.get_finished_spans()) == message_count
+
+
+def test_consumer_spans_match_lambda_path(local_sqs, queue_url, span_exporter, trace_carrier):
+    _send(local_sqs.client(), queue_url, 1, trace_carrier)
+    span_exporter.clear()
+    consumer = _consumer(local_sqs, queue_url).start()
+    _wait_until(lambda: len(local_sqs.queue(queue_url)) == 0)
+    assert consumer.drain()
+
+    [span] = span_exporter.get_finished_spans()
+    assert span.name == "sqs_message_processing"
+    assert span.context.trace_id == int(trace_carrier["traceparent"].split("-")[1], 16)
+    assert span.parent.span_id == int(trace_carrier["traceparent"].split("-")[2], 16)
+    assert span.attributes["messaging.operation"] == "process"
+    assert span.attributes["message.test_id"] == "bench-0"
+    assert "faas.execution" not in span.attributes
+
+
+def test_failed_batch_is_not_deleted(local_sqs, queue_url):
+    local_sqs.client().send_message(QueueUrl=queue_url, MessageBody="not json")
+    consumer = _consumer(local_sqs, queue_url).start()
+    queue = local_sqs.queue(queue_url)
+    _wait_until(lambda: queue.in_flight() == 1)
+    assert consumer.drain()
+    # Left for redelivery after the visibility timeout
+    assert len(queue) == 1 and queue.deleted == 0
+
+
+def test_buffer_bounds_received_messages(local_sqs, queue_url, trace_carrier):
+    _send(local_sqs.client(), queue_url, 300, trace_carrier)
+    release = threading.Event()
+
+    def blocked(records):
+        release.wait()
+        return {"batchItemFailures": []}
+
+    consumer = _consumer(local_sqs, queue_url, blocked, pollers=2, workers=1, buffer_batches=2).start()
+    queue = local_sqs.queue(queue_url)
+    # One batch in the worker, two buffered, one held by each blocked poller
+    _wait_until(lambda: queue.in_flight() == 50)
+    time.sleep(0.3)
+    assert queue.in_flight() == 50
+    release.set()
+    _wait_until(lambda: len(queue) == 0)
+    assert consumer.drain()
+
+
+def test_sigterm_drains_buffered_messages(local_sqs, queue_url, trace_carrier):
+    _send(local_sqs.client(), queue_url, 500, trace_carrier)
+    worker = load_handler("lambda2")
+    queue = local_sqs.queue(queue_url)
+
+    def slow(records):
+        # 50 batches on 2 workers take 2.5s, well past the signal at 0.5s
+        time.sleep(0.1)
+        return worker.process_records(records)
+
+    consumer = _consumer(local_sqs, queue_url, slow, pollers=2, workers=2)
+    previous_handler = signal.getsignal(signal.SIGTERM)
+    threading.Timer(0.5, os.kill, args=(os.getpid(), signal.SIGTERM)).start()
+    assert consumer.run() is True
+
+    # Everything received before the signal was processed and deleted; the rest is still queued
+    assert 0 < queue.deleted < 500
+    assert queue.in_flight() == 0
+    assert len(queue) + queue.deleted == 500
+    assert signal.getsignal(signal.SIGTERM) == previous_handler
+
+
+def test_workers_share_caches(monkeypatch, local_sqs, queue_url, span_exporter):
+    # Six trace contexts through four cache slots: eight workers hit and evict the same entries
+    worker = load_handler("lambda2")
+    monkeypatch.setattr(worker.idempotency, "cache", LRUCache(4, 3600))
+    monkeypatch.setattr(extraction, "context_cache", ContextCache(4))
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        client = local_sqs.client()
+        traceparents = [f"00-{uuid.uuid4().hex}-{uuid.uuid4().hex[:16]}-01" for _ in range(6)]
+        for start in range(0, 400, 10):
+            entries = []
+            for i in range(start, start + 10):
+                traceparent = traceparents[i % 6]
+                entries.append({
+                    "Id": str(i - start),
+                    "MessageBody": json.dumps({"requestId": str(uuid.uuid4()), "message": "hi", "test_id": f"bench-{i}"}),
+                    "MessageAttributes": {"traceparent": {"StringValue": traceparent, "DataType": "String"}},
+                })
+            client.send_message_batch(QueueUrl=queue_url, Entries=entries)
+        span_exporter.clear()
+        consumer = _consumer(local_sqs, queue_url, worker.process_records, pollers=2, workers=8).start()
+        queue = local_sqs.queue(queue_url)
+        _wait_until(lambda: queue.deleted == 400)
+        assert consumer.drain()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert len(span_exporter.get_finished_spans()) == 400
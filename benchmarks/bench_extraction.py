@@ -0,0 +1,83 @@
+"""
+Worker-side trace-context extraction: the former per-record priority chain
+against ``otel_sqs.extraction.extract_batch``, for batches sharing one header
+(the common case behind one API request) and batches where every record
+carries its own header.
+"""
+
+import json
+import os
+
+import pytest
+from opentelemetry import propagate, trace
+
+from conftest import make_sqs_record
+from otel_sqs.extraction import context_cache, extract_batch
+
+BATCH_SIZES = [10, 10_000]
+
+
+def _legacy_extract(record, message_body):
+    """The chain lambda2's handler ran for every record before extract_batch"""
+    trace_context = {}
+    if "messageAttributes" in record:
+        msg_attrs = record["messageAttributes"]
+        for field in ("X-Amzn-Trace-Id", "traceparent", "tracestate"):
+            if field in msg_attrs:
+                trace_context[field] = msg_attrs[field]["stringValue"]
+    if "attributes" in record and "AWSTraceHeader" in record["attributes"]:
+        if "X-Amzn-Trace-Id" not in trace_context:
+            trace_context["X-Amzn-Trace-Id"] = record["attributes"]["AWSTraceHeader"]
+    if not trace_context:
+        trace_context.update(message_body.get("traceContext", {}))
+    if not trace_context:
+        trace_header = os.environ.get("_X_AMZN_TRACE_ID")
+        if trace_header:
+            trace_context["X-Amzn-Trace-Id"] = trace_header
+    return propagate.extract(trace_context) if trace_context else None
+
+
+def _batch(tracer, batch_size, distinct):
+    records, bodies = [], []
+    carrier = {}
+    for i in range(batch_size):
+        if distinct or not carrier:
+            carrier = {}
+            with tracer.start_as_current_span("api_request_processing"):
+                propagate.inject(carrier)
+        body = {"requestId": f"bench-{i}", "data": {}}
+        records.append(make_sqs_record(body, carrier))
+        bodies.append(body)
+    # The event delivers bodies as strings; both paths start from the parsed JSON
+    return records, [json.loads(record["body"]) for record in records]
+
+
+def _span_context(parent):
+    return trace.get_current_span(parent).get_span_context()
+
+
+@pytest.mark.parametrize("distinct", [False, True], ids=["shared_header", "distinct_headers"])
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+def test_extract_legacy_chain(benchmark, tracer, batch_size, distinct):
+    records, bodies = _batch(tracer, batch_size, distinct)
+
+    def run():
+        return [_legacy_extract(record, body) for record, body in zip(records, bodies)]
+
+    contexts = benchmark.pedantic(run, rounds=5, iterations=1)
+    assert all(_span_context(c).is_valid for c in contexts)
+
+
+@pytest.mark.parametrize("distinct", [False, True], ids=["shared_header", "distinct_headers"])
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+def test_extract_batch(benchmark, tracer, batch_size, distinct):
+    records, bodies = _batch(tracer, batch_size, distinct)
+
+    def run():
+        # Cold cache every round: a shared header is parsed once per batch, not once per process
+        context_cache.clear()
+        return extract_batch(records, bodies)
+
+    contexts = benchmark.pedantic(run, rounds=5, iterations=1)
+    expected = [_legacy_extract(record, body) for record, body in zip(records, bodies)]
+    assert [_span_context(c) for c in contexts] == [_span_context(c) for c in expected]
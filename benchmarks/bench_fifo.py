@@ -0,0 +1,161 @@
+"""
+FIFO queues: group and deduplication id derivation, batched sends, strict
+order within a message group with groups processed in parallel, a failure
+holding back only its own group, and the group-parallel speedup.
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from conftest import CapturingSQS, FakeLambdaContext, load_handler, make_sqs_record
+from otel_sqs.fifo import FifoAttributes, MAX_ID_LENGTH, process_groups, send_batch
+from otel_sqs.lanes import PriorityRouter
+
+FIFO_QUEUE_URL = "https://sqs.eu-central-1.amazonaws.com/123456789012/otel-alml-poc-queue.fifo"
+
+
+def _fifo_records(groups: int, per_group: int) -> list:
+    """Interleaved groups, as SQS delivers them: g0-0, g1-0, ..., g0-1, ..."""
+    records = []
+    for seq in range(per_group):
+        for group in range(groups):
+            record = make_sqs_record({"message": "hi", "test_id": f"g{group}-{seq}"}, {})
+            record["attributes"]["MessageGroupId"] = f"g{group}"
+            records.append(record)
+    return records
+
+
+def test_attribute_derivation():
+    fifo = FifoAttributes(group_field="customer.id", dedup_field="orderId")
+    body = {"customer": {"id": "c-7"}, "orderId": "ord-1", "message": "hi"}
+    assert fifo.send_args(FIFO_QUEUE_URL, body) == {"MessageGroupId": "c-7", "MessageDeduplicationId": "ord-1"}
+    # Standard queues take neither
+    assert fifo.send_args(FIFO_QUEUE_URL[:-len(".fifo")], body) == {}
+
+    assert fifo.message_group_id({"message": "hi"}) == "default"
+    assert len(fifo.message_group_id({"customer": {"id": "x" * 500}})) <= MAX_ID_LENGTH
+    # Fallbacks: the request's Idempotency-Key, then the body's content
+    assert fifo.deduplication_id({"message": "hi"}, "key-1") == "key-1"
+    assert fifo.deduplication_id({"a": 1, "b": 2}) == fifo.deduplication_id({"b": 2, "a": 1})
+    assert fifo.deduplication_id({"a": 1}) != fifo.deduplication_id({"a": 2})
+
+
+class _BatchingSQS:
+    def __init__(self, transient_failures: int = 0):
+        self.calls = []
+        self.transient_failures = transient_failures
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.calls.append([entry["Id"] for entry in Entries])
+        failed = Entries[:self.transient_failures]
+        self.transient_failures = 0
+        return {
+            "Successful": [{"Id": entry["Id"], "MessageId": f"msg-{entry['Id']}"} for entry in Entries if entry not in failed],
+            "Failed": [{"Id": entry["Id"], "Code": "InternalError", "SenderFault": False} for entry in failed],
+        }
+
+
+def test_send_batch():
+    client = _BatchingSQS(transient_failures=2)
+    bodies = [{"customer": f"c-{i % 3}", "seq": i} for i in range(25)]
+    message_ids = send_batch(client, FIFO_QUEUE_URL, bodies, FifoAttributes(group_field="customer"))
+    assert message_ids == [f"msg-{i}" for i in range(25)]
+    # 10 per call; the failed entries are resent before the next chunk
+    assert [len(call) for call in client.calls] == [10, 2, 10, 5]
+    assert client.calls[1] == ["0", "1"]
+
+
+def test_order_within_groups_parallel_across_groups():
+    records = _fifo_records(groups=4, per_group=5)
+    seen = {f"g{group}": [] for group in range(4)}
+    running = set()
+    peak = [0]
+    lock = threading.Lock()
+
+    def process(i):
+        group = records[i]["attributes"]["MessageGroupId"]
+        with lock:
+            running.add(group)
+            peak[0] = max(peak[0], len(running))
+        time.sleep(0.005)
+        seen[group].append(json.loads(records[i]["body"])["test_id"])
+        with lock:
+            running.discard(group)
+        return True
+
+    assert process_groups(records, process, max_workers=4) == set()
+    assert seen == {f"g{group}": [f"g{group}-{seq}" for seq in range(5)] for group in range(4)}
+    assert peak[0] > 1
+
+
+def test_failure_stops_only_its_group():
+    records = _fifo_records(groups=3, per_group=4)
+    started = []
+
+    def process(i):
+        test_id = json.loads(records[i]["body"])["test_id"]
+        started.append(test_id)
+        if test_id == "g1-1":
+            raise RuntimeError("downstream rejected g1-1")
+        return test_id != "g2-2"  # not started: no time left
+
+    failed = process_groups(records, process, max_workers=3)
+    assert sorted(json.loads(records[i]["body"])["test_id"] for i in failed) == ["g1-1", "g1-2", "g1-3", "g2-2", "g2-3"]
+    assert "g1-2" not in started and "g2-3" not in started
+    assert [test_id for test_id in started if test_id.startswith("g0")] == ["g0-0", "g0-1", "g0-2", "g0-3"]
+
+
+def test_worker_reports_group_tails(monkeypatch, span_exporter):
+    worker = load_handler("lambda2")
+    worker.idempotency.cache.clear()
+    process_message_with_span = worker.process_message_with_span
+
+    def failing(message_body, span):
+        if message_body["test_id"] == "g0-1":
+            raise RuntimeError("downstream rejected g0-1")
+        return process_message_with_span(message_body, span)
+
+    monkeypatch.setattr(worker, "process_message_with_span", failing)
+    records = _fifo_records(groups=2, per_group=3)
+    result = worker.handler({"Records": records}, FakeLambdaContext())
+    by_id = {record["messageId"]: json.loads(record["body"])["test_id"] for record in records}
+    assert sorted(by_id[item["itemIdentifier"]] for item in result["batchItemFailures"]) == ["g0-1", "g0-2"]
+
+    spans = [span for span in span_exporter.get_finished_spans() if span.name == "sqs_message_processing"]
+    assert sorted(span.attributes["messaging.sqs.message_group_id"] for span in spans) == ["g0", "g0", "g1", "g1", "g1"]
+
+    # The redelivered tail goes through in order; g1 is skipped as already processed
+    monkeypatch.setattr(worker, "process_message_with_span", process_message_with_span)
+    assert worker.handler({"Records": records}, FakeLambdaContext())["batchItemFailures"] == []
+
+
+def test_api_sends_group_and_deduplication_ids(monkeypatch, span_exporter):
+    api = load_handler("lambda1")
+    monkeypatch.setattr(api, "test_connectivity", lambda: True)
+    monkeypatch.setattr(api, "sqs", CapturingSQS())
+    monkeypatch.setattr(api, "priority_router", PriorityRouter(FIFO_QUEUE_URL))
+    monkeypatch.setattr(api, "fifo_attributes", FifoAttributes(group_field="customerId"))
+
+    event = {"httpMethod": "POST", "path": "/process", "body": json.dumps({"message": "hi", "customerId": "c-1"})}
+    assert api.handler(event, FakeLambdaContext())["statusCode"] == 200
+    assert api.handler(dict(event), FakeLambdaContext())["statusCode"] == 200
+    first, second = api.sqs.sent
+    assert first["QueueUrl"] == FIFO_QUEUE_URL and first["MessageGroupId"] == "c-1"
+    # Same request body: SQS drops the second send within its deduplication window
+    assert first["MessageDeduplicationId"] == second["MessageDeduplicationId"]
+    assert span_exporter.get_finished_spans()[-1].attributes["messaging.sqs.message_group_id"] == "c-1"
+
+
+@pytest.mark.parametrize("max_workers", [1, 8], ids=["sequential", "group_parallel"])
+def test_group_parallel_throughput(benchmark, max_workers):
+    """8 groups of 5 records with 2ms of I/O each"""
+    records = _fifo_records(groups=8, per_group=5)
+
+    def process(i):
+        time.sleep(0.002)
+        return True
+
+    assert benchmark.pedantic(process_groups, args=(records, process, max_workers), rounds=5) == set()
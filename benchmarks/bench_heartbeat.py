@@ -0,0 +1,115 @@
+"""
+Visibility heartbeat against the in-process SQS stand-in: tracking overhead,
+batched extensions, slow messages kept invisible by the standalone consumer
+and failed messages released after their current visibility.
+"""
+
+import json
+import time
+import uuid
+
+import pytest
+
+from conftest import load_handler
+from otel_sqs.consumer import SQSConsumer
+from otel_sqs.heartbeat import VisibilityHeartbeat
+
+# Short timeouts keep the tests fast: extend 1s before a 2s visibility runs out
+VISIBILITY_S = 2
+MARGIN_S = 1
+
+
+@pytest.fixture
+def queue_url(local_sqs):
+    return local_sqs.create_queue(f"otel-alml-poc-queue-{uuid.uuid4().hex[:8]}", visibility_timeout_s=VISIBILITY_S)
+
+
+@pytest.fixture
+def heartbeat(local_sqs):
+    heartbeat = VisibilityHeartbeat(local_sqs.client(), visibility_timeout_s=VISIBILITY_S, margin_s=MARGIN_S)
+    yield heartbeat
+    heartbeat.close()
+
+
+def _receive(client, queue_url: str, count: int) -> list:
+    client.send_message_batch(
+        QueueUrl=queue_url,
+        Entries=[{"Id": str(i), "MessageBody": json.dumps({"test_id": f"bench-{i}"})} for i in range(count)],
+    )
+    return client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=count)["Messages"]
+
+
+def _wait_until(predicate, timeout_s: float = 30.0):
+    deadline = time.monotonic() + timeout_s
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_track_untrack_overhead(benchmark):
+    # Far-off deadlines: measures the per-batch bookkeeping, never calls SQS
+    heartbeat = VisibilityHeartbeat(sqs_client=object(), visibility_timeout_s=3600)
+    handles = [f"AQEB{uuid.uuid4().hex}" for _ in range(10)]
+
+    def one_batch():
+        heartbeat.track("https://sqs.eu-central-1.amazonaws.com/123456789012/q", handles)
+        heartbeat.untrack(handles)
+
+    benchmark(one_batch)
+    heartbeat.close()
+
+
+def test_extensions_are_batched(local_sqs, queue_url, heartbeat):
+    messages = _receive(local_sqs.client(), queue_url, 10)
+    calls_before = local_sqs.calls.get("ChangeMessageVisibilityBatch", 0)
+    heartbeat.track(queue_url, [message["ReceiptHandle"] for message in messages])
+
+    time.sleep(VISIBILITY_S + 0.5)
+    queue = local_sqs.queue(queue_url)
+    assert queue.in_flight() == 10
+    # One call per round for all 10 messages, not one per message
+    assert local_sqs.calls["ChangeMessageVisibilityBatch"] - calls_before <= 3
+    assert all(message.receive_count == 1 for message in queue.messages.values())
+
+
+def test_deleted_messages_are_dropped(local_sqs, queue_url, heartbeat):
+    [message] = _receive(local_sqs.client(), queue_url, 1)
+    heartbeat.track(queue_url, [message["ReceiptHandle"]])
+    local_sqs.client().delete_message(QueueUrl=queue_url, ReceiptHandle=message["ReceiptHandle"])
+    # The extension fails with ReceiptHandleIsInvalid and tracking stops
+    _wait_until(lambda: len(heartbeat) == 0, timeout_s=VISIBILITY_S + 1)
+
+
+@pytest.mark.parametrize("with_heartbeat", [False, True])
+def test_slow_message_not_redelivered(local_sqs, queue_url, heartbeat, with_heartbeat):
+    local_sqs.client().send_message(QueueUrl=queue_url, MessageBody=json.dumps({"test_id": "slow"}))
+    worker = load_handler("lambda2")
+    receive_counts = []
+
+    def slow(records):
+        receive_counts.append(int(records[0]["attributes"]["ApproximateReceiveCount"]))
+        time.sleep(VISIBILITY_S * 1.75)
+        return worker.process_records(records)
+
+    consumer = SQSConsumer(
+        queue_url, slow, sqs_client=local_sqs.client(), wait_time_s=1,
+        heartbeat=heartbeat if with_heartbeat else None,
+    ).start()
+    _wait_until(lambda: len(local_sqs.queue(queue_url)) == 0)
+    assert consumer.drain()
+    # Without the heartbeat a second worker picks the message up while the first is still busy
+    if with_heartbeat:
+        assert receive_counts == [1]
+    else:
+        assert receive_counts == [1, 2]
+
+
+def test_failed_message_released_after_current_visibility(local_sqs, queue_url, heartbeat):
+    local_sqs.client().send_message(QueueUrl=queue_url, MessageBody="not json")
+    consumer = SQSConsumer(
+        queue_url, load_handler("lambda2").process_records, sqs_client=local_sqs.client(), wait_time_s=1, heartbeat=heartbeat
+    ).start()
+    queue = local_sqs.queue(queue_url)
+    _wait_until(lambda: next(iter(queue.messages.values())).receive_count == 2, timeout_s=VISIBILITY_S * 2)
+    assert consumer.drain()
+    assert len(heartbeat) == 0
@@ -0,0 +1,184 @@
+"""
+Idempotent consumer lookups for whole batches: warm-container LRU hits and
+batched persistent-store lookups (SQLite stand-in), plus the worker handler
+skipping a redelivered batch. The API handler's Idempotency-Key support is
+checked with a fake SQS client: replays, key reuse, and coalescing of
+concurrent duplicates.
+"""
+
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import FakeLambdaContext, load_handler
+from otel_sqs.idempotency import (
+    IdempotentConsumer,
+    IdempotentRequests,
+    InMemoryIdempotencyStore,
+    LRUCache,
+    RequestInProgress,
+    SQLiteIdempotencyStore,
+)
+
+BATCH_SIZES = [10, 10_000]
+STORES = {"memory": InMemoryIdempotencyStore, "sqlite": SQLiteIdempotencyStore}
+
+
+def _keys(batch_size):
+    return [f"messageId:{i:08d}" for i in range(batch_size)]
+
+
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+def test_lookup_cache_hits(benchmark, batch_size):
+    consumer = IdempotentConsumer(cache_size=batch_size)
+    keys = _keys(batch_size)
+    consumer.mark_processed(keys)
+
+    assert all(benchmark(consumer.find_duplicates, keys))
+
+
+@pytest.mark.parametrize("store_name", list(STORES))
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+def test_lookup_store_hits(benchmark, batch_size, store_name):
+    store = STORES[store_name]()
+    keys = _keys(batch_size)
+    # Keys processed by another container: only the persistent store knows them
+    IdempotentConsumer(store=store).mark_processed(keys)
+    consumer = IdempotentConsumer(store=store)
+
+    def lookup():
+        consumer.cache.clear()
+        return consumer.find_duplicates(keys)
+
+    assert all(benchmark(lookup))
+
+
+def test_duplicates_within_batch_and_expiry():
+    now = [1000.0]
+    store = SQLiteIdempotencyStore(clock=lambda: now[0])
+    consumer = IdempotentConsumer(store=store, ttl_s=60)
+    assert consumer.find_duplicates(["a", "b", "a"]) == [False, False, True]
+
+    consumer.mark_processed(["a"])
+    consumer.cache.clear()
+    assert consumer.find_duplicates(["a", "b"]) == [True, False]
+
+    now[0] += 61
+    consumer.cache.clear()
+    assert consumer.find_duplicates(["a"]) == [False]
+    assert store.put_if_absent("a", {}, 60) and not store.put_if_absent("a", {}, 60)
+
+
+def test_cache_eviction_during_lookup():
+    # A worker thread fills the cache while another is between finding "a" and refreshing it
+    evictions = []
+
+    def clock():
+        if evictions == ["pending"]:
+            thread = evictions[0] = threading.Thread(target=cache.put, args=("c", True))
+            thread.start()
+            # Blocked on the lock, or done evicting "a" without one
+            thread.join(0.2)
+        return 0.0
+
+    cache = LRUCache(2, 60, clock=clock)
+    cache.put("a", True)
+    cache.put("b", True)
+    evictions.append("pending")
+    assert cache.get("a") is True
+    evictions[0].join()
+    assert len(cache) == 2 and cache.get("c") is True
+
+
+def test_business_key():
+    consumer = IdempotentConsumer(key_field="data.orderId")
+    assert consumer.key_for({"messageId": "m1"}, {"data": {"orderId": 42}}) == "data.orderId:42"
+    assert consumer.key_for({"messageId": "m1"}, {"data": {}}) == "messageId:m1"
+
+
+def test_worker_handler_skips_redelivery(make_sqs_event, span_exporter):
+    worker = load_handler("lambda2")
+    event = make_sqs_event(10)
+    span_exporter.clear()
+
+    assert worker.handler(event, FakeLambdaContext()) == {"batchItemFailures": []}
+    assert len(span_exporter.get_finished_spans()) == 10
+
+    span_exporter.clear()
+    assert worker.handler(event, FakeLambdaContext()) == {"batchItemFailures": []}
+    assert not span_exporter.get_finished_spans()
+
+
+class _FakeSQS:
+    """Counts sends; the delay widens the window for concurrent duplicates"""
+
+    def __init__(self, delay_s: float = 0.0):
+        self.delay_s = delay_s
+        self.sends = 0
+        self._lock = threading.Lock()
+
+    def send_message(self, **kwargs):
+        time.sleep(self.delay_s)
+        with self._lock:
+            self.sends += 1
+        return {"MessageId": str(uuid.uuid4())}
+
+
+def _api_event(key, body):
+    return {"httpMethod": "POST", "path": "/process", "headers": {"Idempotency-Key": key}, "body": json.dumps(body)}
+
+
+@pytest.fixture
+def api(monkeypatch):
+    api = load_handler("lambda1")
+    monkeypatch.setattr(api, "test_connectivity", lambda: True)
+    monkeypatch.setattr(api, "sqs", _FakeSQS())
+    monkeypatch.setattr(api, "idempotent_requests", IdempotentRequests(store=SQLiteIdempotencyStore()))
+    return api
+
+
+def test_api_replays_response(benchmark, api, span_exporter):
+    event = _api_event(str(uuid.uuid4()), {"message": "hello"})
+    first = api.handler(event, FakeLambdaContext())
+    assert first["statusCode"] == 200
+
+    replay = benchmark(api.handler, event, FakeLambdaContext())
+    assert api.sqs.sends == 1
+    assert replay["headers"]["Idempotent-Replayed"] == "true"
+    assert json.loads(replay["body"])["messageId"] == json.loads(first["body"])["messageId"]
+
+
+def test_api_rejects_key_reuse(api, span_exporter):
+    key = str(uuid.uuid4())
+    assert api.handler(_api_event(key, {"message": "a"}), FakeLambdaContext())["statusCode"] == 200
+    assert api.handler(_api_event(key, {"message": "b"}), FakeLambdaContext())["statusCode"] == 422
+    assert api.sqs.sends == 1
+
+
+def test_api_coalesces_concurrent_duplicates(api, span_exporter):
+    api.sqs.delay_s = 0.2
+    event = _api_event(str(uuid.uuid4()), {"message": "hello"})
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(lambda _: api.handler(event, FakeLambdaContext()), range(8)))
+
+    assert api.sqs.sends == 1
+    assert len({json.loads(r["body"])["messageId"] for r in responses}) == 1
+
+
+def test_in_progress_in_other_container():
+    store = SQLiteIdempotencyStore()
+    original, duplicate = IdempotentRequests(store=store), IdempotentRequests(store=store, wait_s=0.2, poll_interval_s=0.05)
+    response = {"statusCode": 200, "body": "{}"}
+
+    def produce_while_duplicate_arrives():
+        with pytest.raises(RequestInProgress):
+            duplicate.run("k", "body", lambda: pytest.fail("duplicate must not produce"))
+        return response
+
+    assert original.run("k", "body", produce_while_duplicate_arrives) == (response, "new")
+    replayed, outcome = duplicate.run("k", "body", lambda: pytest.fail("duplicate must not produce"))
+    assert outcome == "coalesced" and replayed["headers"]["Idempotent-Replayed"] == "true"
@@ -0,0 +1,133 @@
+"""
+Receive-side SQS instrumentation: the process span store's TTL and LRU
+eviction, stale spans ended with ``messaging.sqs.tracking_ended``,
+``processing()`` activating a tracked span, and receive -> process -> delete
+against the local SQS stand-in.
+"""
+
+import threading
+import uuid
+
+import pytest
+from opentelemetry.trace import INVALID_SPAN, SpanKind
+
+from conftest import Clock
+from otel_sqs import instrumentation
+from otel_sqs.instrumentation import TRACKING_ENDED_ATTRIBUTE, ReceivedSpanStore, SQSInstrumentor
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def store(monkeypatch, clock):
+    store = ReceivedSpanStore(max_size=3, ttl_s=60, clock=clock)
+    monkeypatch.setattr(instrumentation, "received_spans", store)
+    return store
+
+
+def _ended(span_exporter):
+    return {span.name: span.attributes.get(TRACKING_ENDED_ATTRIBUTE) for span in span_exporter.get_finished_spans()}
+
+
+def test_expired_spans_are_ended(store, clock, tracer, span_exporter):
+    store.add("handle-a", tracer.start_span("a"))
+    clock.now = 30.0
+    store.add("handle-b", tracer.start_span("b"))
+    clock.now = 59.0
+    assert store.sweep() == 0 and len(store) == 2
+
+    clock.now = 60.0
+    assert store.sweep() == 1
+    assert store.get("handle-a") is None and store.get("handle-b") is not None
+    assert _ended(span_exporter) == {"a": "expired"}
+
+    # Adding also drops whatever expired in the meantime
+    clock.now = 90.0
+    store.add("handle-c", tracer.start_span("c"))
+    assert len(store) == 1 and _ended(span_exporter) == {"a": "expired", "b": "expired"}
+
+
+def test_least_recently_received_is_evicted(store, tracer, span_exporter):
+    for name in ("a", "b", "c", "d"):
+        store.add(f"handle-{name}", tracer.start_span(name))
+    assert len(store) == 3 and store.get("handle-a") is None
+    assert _ended(span_exporter) == {"a": "evicted"}
+
+    # A redelivered handle ends the previous span and moves to the back
+    store.add("handle-b", tracer.start_span("b-again"))
+    store.add("handle-e", tracer.start_span("e"))
+    assert _ended(span_exporter) == {"a": "evicted", "b": "redelivered", "c": "evicted"}
+    assert store.get("handle-b").name == "b-again"
+
+
+def test_deleted_spans_are_not_flagged(store, clock, tracer, span_exporter):
+    span = tracer.start_span("a")
+    store.add("handle-a", span)
+    assert store.pop("handle-a") is span and store.pop("handle-a") is None
+    span.end()
+    clock.now = 120.0
+    assert store.sweep() == 0
+    assert _ended(span_exporter) == {"a": None}
+
+
+def test_processing_is_per_thread(store, tracer, span_exporter):
+    store.add("handle-a", tracer.start_span("a process"))
+    store.add("handle-b", tracer.start_span("b process"))
+    instrumentor = SQSInstrumentor()
+    parents = {}
+
+    def handle(receipt_handle):
+        with instrumentor.processing({"ReceiptHandle": receipt_handle}) as span:
+            with tracer.start_as_current_span("business_logic") as child:
+                parents[receipt_handle] = (span, child.parent.span_id)
+
+    threads = [threading.Thread(target=handle, args=(f"handle-{name}",)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for receipt_handle, (span, parent_id) in parents.items():
+        assert span is store.get(receipt_handle) and parent_id == span.get_span_context().span_id
+    # Leaving the block does not end the process span, the delete does
+    assert [span.name for span in span_exporter.get_finished_spans()] == ["business_logic"] * 2
+
+    with instrumentor.processing({"ReceiptHandle": "unknown"}) as span:
+        assert span is INVALID_SPAN
+
+
+def test_receive_process_delete(store, local_sqs, tracer, span_exporter):
+    queue_url = local_sqs.create_queue(f"otel-alml-poc-queue-{uuid.uuid4().hex[:8]}")
+    client = local_sqs.client()
+    instrumentor = SQSInstrumentor()
+    instrumentor.instrument()
+    try:
+        client.send_message(QueueUrl=queue_url, MessageBody="{}")
+        [message] = client.receive_message(QueueUrl=queue_url)["Messages"]
+        with instrumentor.processing(message) as span:
+            assert span.name.endswith(" process") and span.kind == SpanKind.CONSUMER
+        client.delete_message_batch(
+            QueueUrl=queue_url, Entries=[{"Id": "0", "ReceiptHandle": message["ReceiptHandle"]}],
+        )
+    finally:
+        instrumentor.uninstrument()
+
+    assert len(store) == 0
+    spans = {span.name.rpartition(" ")[2]: span for span in span_exporter.get_finished_spans()}
+    assert set(spans) == {"send", "receive", "process"}
+    # Linked to the producer, ended by the delete rather than flagged
+    assert spans["process"].links[0].context.span_id == spans["send"].context.span_id
+    assert TRACKING_ENDED_ATTRIBUTE not in spans["process"].attributes
+
+
+def test_add_pop_overhead(benchmark, store, tracer):
+    span = tracer.start_span("process")
+    store.max_size = 10**6
+
+    def track():
+        store.add("handle", span)
+        store.pop("handle")
+
+    benchmark(track)
@@ -0,0 +1,155 @@
+"""
+Priority lanes: producer routing, weighted fair scheduling with starvation
+protection, and latency isolation of a high-priority lane from a bulk backlog
+on the in-process SQS stand-in.
+"""
+
+import json
+import time
+import uuid
+
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from conftest import Clock
+from otel_sqs import consumer as consumer_module
+from otel_sqs.consumer import SQSConsumer
+from otel_sqs.lanes import DEFAULT_LANE, Lane, LaneBuffer, PriorityRouter, lanes_from_env
+
+BULK_MESSAGES = 300
+HIGH_MESSAGES = 20
+BATCH_TIME_S = 0.01
+
+
+def test_router():
+    router = PriorityRouter("https://sqs/default", {"high": "https://sqs/high"}, field="data.priority")
+    assert router.route({"data": {"priority": "high"}}) == ("high", "https://sqs/high")
+    assert router.route({"data": {"priority": "urgent"}}) == (DEFAULT_LANE, "https://sqs/default")
+    assert router.route({"data": "high"}) == (DEFAULT_LANE, "https://sqs/default")
+    assert router.route("not a dict") == (DEFAULT_LANE, "https://sqs/default")
+    assert PriorityRouter("https://sqs/default").route({"priority": "high"}) == (DEFAULT_LANE, "https://sqs/default")
+
+
+def test_lanes_from_env(monkeypatch):
+    monkeypatch.setenv("SQS_PRIORITY_QUEUE_URLS", "high=https://sqs/high, low=https://sqs/low")
+    monkeypatch.setenv("CONSUMER_LANE_WEIGHTS", "high=8,low=0")
+    assert lanes_from_env("https://sqs/default") == [
+        Lane(DEFAULT_LANE, "https://sqs/default", 1), Lane("high", "https://sqs/high", 8), Lane("low", "https://sqs/low", 1),
+    ]
+
+
+def test_weighted_fair_share():
+    buffer = LaneBuffer([Lane("high", "h", 3), Lane("low", "l", 1)], capacity=100, clock=Clock())
+    for i in range(20):
+        buffer.put("high", i)
+        buffer.put("low", i)
+    order = [buffer.get()[0].name for _ in range(8)]
+    # Smooth round robin interleaves instead of serving high in bursts
+    assert order == ["high", "high", "low", "high"] * 2
+
+
+def test_starvation_protection():
+    clock = Clock()
+    buffer = LaneBuffer([Lane("high", "h", 100), Lane("low", "l", 1)], capacity=100, max_wait_s=5, clock=clock)
+    buffer.put("low", "old")
+    clock.now = 1.0
+    for i in range(50):
+        buffer.put("high", i)
+    assert buffer.get()[0].name == "high"
+    clock.now = 5.0
+    lane, item, waited_s = buffer.get()
+    assert (lane.name, item, waited_s) == ("low", "old", 5.0)
+    assert buffer.get()[0].name == "high"
+    buffer.close()
+    assert sum(1 for _ in iter(buffer.get, None)) == 48
+
+
+def test_weighted_get(benchmark):
+    lanes = [Lane("high", "h", 8), Lane("default", "d", 1), Lane("low", "l", 1)]
+    buffer = LaneBuffer(lanes, capacity=1_000_000)
+
+    def get():
+        lane, _, _ = buffer.get()
+        buffer.put(lane.name, None)
+
+    for lane in lanes:
+        buffer.put(lane.name, None)
+    benchmark(get)
+
+
+def _send(client, queue_url: str, count: int, priority: str):
+    for start in range(0, count, 10):
+        entries = [
+            {"Id": str(i), "MessageBody": json.dumps({"data": {"priority": priority}})}
+            for i in range(min(10, count - start))
+        ]
+        client.send_message_batch(QueueUrl=queue_url, Entries=entries)
+
+
+def _high_latencies(local_sqs, lanes, high_queue_url: str) -> list:
+    """Seconds from start until each high-priority message was processed, behind a bulk backlog"""
+    latencies = []
+    started = time.monotonic()
+
+    def process_batch(records):
+        time.sleep(BATCH_TIME_S)
+        for record in records:
+            if json.loads(record["body"])["data"]["priority"] == "high":
+                latencies.append(time.monotonic() - started)
+        return {"batchItemFailures": []}
+
+    consumer = SQSConsumer(
+        None, process_batch, sqs_client=local_sqs.client(), pollers=1, workers=1,
+        buffer_batches=2, wait_time_s=1, drain_timeout_s=10, lanes=lanes,
+    ).start()
+    deadline = time.monotonic() + 30
+    while len(local_sqs.queue(high_queue_url)) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert consumer.drain()
+    assert len(latencies) == HIGH_MESSAGES
+    return latencies
+
+
+def test_latency_isolation(local_sqs, monkeypatch):
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter("benchmarks")
+    monkeypatch.setattr(consumer_module, "_lane_wait_time", meter.create_histogram("messaging.sqs.lane.wait_time"))
+    client = local_sqs.client()
+
+    # Baseline: one queue, the high-priority requests arrive behind the backlog
+    shared_url = local_sqs.create_queue(f"otel-alml-poc-queue-{uuid.uuid4().hex[:8]}")
+    _send(client, shared_url, BULK_MESSAGES, "bulk")
+    _send(client, shared_url, HIGH_MESSAGES, "high")
+    shared = _high_latencies(local_sqs, [Lane(DEFAULT_LANE, shared_url)], shared_url)
+
+    bulk_url = local_sqs.create_queue(f"otel-alml-poc-queue-{uuid.uuid4().hex[:8]}")
+    high_url = local_sqs.create_queue(f"otel-alml-poc-high-{uuid.uuid4().hex[:8]}")
+    _send(client, bulk_url, BULK_MESSAGES, "bulk")
+    _send(client, high_url, HIGH_MESSAGES, "high")
+    lanes = [Lane(DEFAULT_LANE, bulk_url, 1), Lane("high", high_url, 8)]
+    laned = _high_latencies(local_sqs, lanes, high_url)
+
+    print(f"\nhigh-priority latency behind {BULK_MESSAGES} bulk messages: "
+          f"shared queue {min(shared) * 1000:.0f}-{max(shared) * 1000:.0f}ms, "
+          f"priority lane {min(laned) * 1000:.0f}-{max(laned) * 1000:.0f}ms")
+    assert max(laned) < min(shared)
+    # The bulk lane is still served while the high lane has work
+    assert local_sqs.queue(bulk_url).deleted > 0
+
+    wait_times = {}
+    for resource_metrics in reader.get_metrics_data().resource_metrics:
+        for scope_metrics in resource_metrics.scope_metrics:
+            for metric in scope_metrics.metrics:
+                for point in metric.data.data_points:
+                    wait_times[point.attributes["lane"]] = point
+    assert set(wait_times) == {DEFAULT_LANE, "high"}
+    assert wait_times["high"].count > 0
+
+
+def test_queue_depth(local_sqs):
+    queue_url = local_sqs.create_queue(f"otel-alml-poc-queue-{uuid.uuid4().hex[:8]}")
+    _send(local_sqs.client(), queue_url, 25, "bulk")
+    consumer = SQSConsumer(queue_url, lambda records: {"batchItemFailures": []}, sqs_client=local_sqs.client())
+    [lane] = consumer.lanes
+    assert consumer.queue_depth(lane) == 25
+    assert consumer.buffered(lane.name) == 0
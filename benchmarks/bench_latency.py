@@ -0,0 +1,100 @@
+"""
+Queue latency instrumentation: timing extraction from SQS system attributes,
+per-record recording overhead, and the API-to-worker path end to end.
+"""
+
+import json
+import time
+
+import pytest
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from conftest import CapturingSQS, FakeLambdaContext, load_handler, make_sqs_record
+from otel_sqs import latency
+from otel_sqs.latency import queue_timings, record_queue_latency
+
+NOW_MS = 1_760_000_000_000
+
+
+@pytest.fixture
+def metric_reader(monkeypatch):
+    """Routes the latency histograms to an in-memory reader instead of the global no-op provider"""
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter("benchmarks")
+    for attribute, name in (
+        ("_dwell_time", "messaging.sqs.queue.dwell_time"),
+        ("_end_to_end", "messaging.sqs.end_to_end.duration"),
+        ("_receive_count", "messaging.sqs.receive_count"),
+    ):
+        monkeypatch.setattr(latency, attribute, meter.create_histogram(name))
+    return reader
+
+
+def _histograms(reader) -> dict:
+    histograms = {}
+    for resource_metrics in reader.get_metrics_data().resource_metrics:
+        for scope_metrics in resource_metrics.scope_metrics:
+            for metric in scope_metrics.metrics:
+                histograms[metric.name] = metric.data.data_points[0]
+    return histograms
+
+
+def _record(sent_ms: int, first_receive_ms: int, receive_count: int = 1) -> dict:
+    record = make_sqs_record({}, {})
+    record["attributes"].update({
+        "SentTimestamp": str(sent_ms),
+        "ApproximateFirstReceiveTimestamp": str(first_receive_ms),
+        "ApproximateReceiveCount": str(receive_count),
+    })
+    return record
+
+
+def test_queue_timings():
+    record = _record(NOW_MS - 900, NOW_MS - 400, receive_count=3)
+    assert queue_timings(record, {"timestamp": NOW_MS - 1000}, now_ms=NOW_MS) == {
+        "dwell_time_ms": 500, "end_to_end_ms": 1000, "receive_count": 3,
+    }
+    # Clock skew between SQS and the worker never yields negative latencies
+    assert queue_timings(_record(NOW_MS, NOW_MS - 5), {"timestamp": NOW_MS + 20}, now_ms=NOW_MS)["dwell_time_ms"] == 0
+    # Older producers wrote remaining milliseconds, not a wall-clock time
+    assert "end_to_end_ms" not in queue_timings(record, {"timestamp": 2999}, now_ms=NOW_MS)
+
+
+def test_record_overhead(benchmark, metric_reader, tracer):
+    record = _record(NOW_MS - 900, NOW_MS - 400)
+    body = {"timestamp": NOW_MS - 1000}
+    with tracer.start_as_current_span("sqs_message_processing") as span:
+        benchmark(record_queue_latency, record, body, span)
+    assert _histograms(metric_reader)["messaging.sqs.queue.dwell_time"].sum > 0
+
+
+def test_api_to_worker_latency(monkeypatch, metric_reader, span_exporter):
+    api = load_handler("lambda1")
+    worker = load_handler("lambda2")
+    monkeypatch.setattr(api, "test_connectivity", lambda: True)
+    monkeypatch.setattr(api, "sqs", CapturingSQS())
+
+    accepted_ms = int(time.time() * 1000) - 250
+    event = {"httpMethod": "POST", "path": "/process", "body": json.dumps({"message": "hello"}),
+             "requestContext": {"requestTimeEpoch": accepted_ms}}
+    assert api.handler(event, FakeLambdaContext())["statusCode"] == 200
+    [sent] = api.sqs.sent
+    body = json.loads(sent["MessageBody"])
+    assert body["timestamp"] == accepted_ms
+
+    record = _record(accepted_ms + 20, accepted_ms + 120, receive_count=2)
+    record["body"] = sent["MessageBody"]
+    span_exporter.clear()
+    worker.idempotency.cache.clear()
+    assert worker.handler({"Records": [record]}, FakeLambdaContext()) == {"batchItemFailures": []}
+
+    [span] = span_exporter.get_finished_spans()
+    assert span.attributes["messaging.sqs.dwell_time_ms"] == 100
+    assert span.attributes["messaging.sqs.end_to_end_ms"] >= 250
+    assert span.attributes["messaging.sqs.receive_count"] == 2
+    histograms = _histograms(metric_reader)
+    assert histograms["messaging.sqs.queue.dwell_time"].sum == 100
+    assert histograms["messaging.sqs.end_to_end.duration"].sum >= 250
+    assert histograms["messaging.sqs.receive_count"].sum == 2
+    assert histograms["messaging.sqs.queue.dwell_time"].attributes == {"messaging.destination.name": "otel-alml-poc-queue"}
@@ -0,0 +1,181 @@
+"""
+OTLP relay extension against local HTTP stubs: buffer thresholds and the
+memory cap, merged requests parsing as one OTLP request, the gzip forwarder and
+restore on failure, the loopback endpoint, and the Extensions API loop joining
+a forward before asking for the next event.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+from http.server import ThreadingHTTPServer
+
+import pytest
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+from opentelemetry.proto.trace.v1.trace_pb2 import ResourceSpans
+
+from conftest import REPO_ROOT, Clock, HTTPStub
+
+sys.path.insert(0, os.path.join(REPO_ROOT, "otlp_relay"))
+import relay  # noqa: E402
+
+
+@pytest.fixture
+def upstream():
+    status = [200]
+    stub = HTTPStub(lambda method, path, headers, body: (status[0], {}, b""))
+    stub.status = status
+    yield stub
+    stub.stop()
+
+
+def _request(service_name: str) -> bytes:
+    request = ExportTraceServiceRequest(resource_spans=[ResourceSpans()])
+    request.resource_spans[0].resource.attributes.add(key="service.name").value.string_value = service_name
+    return request.SerializeToString()
+
+
+def test_buffer_thresholds():
+    clock = Clock()
+    buffer = relay.BatchBuffer(max_bytes=100, max_age_s=30, memory_cap_bytes=1000, clock=clock)
+    assert not buffer.due()
+    buffer.add("/v1/traces", b"x" * 40)
+    assert not buffer.due()
+    # Age is measured from the oldest buffered request
+    clock.now = 20.0
+    buffer.add("/v1/metrics", b"x" * 40)
+    clock.now = 30.0
+    assert buffer.due()
+    clock.now = 0.0
+    buffer.drain()
+    buffer.add("/v1/traces", b"x" * 100)
+    assert buffer.due()
+    assert buffer.drain() == {"/v1/traces": [b"x" * 100]} and buffer.buffered_bytes == 0
+
+
+def test_memory_cap_and_restore():
+    buffer = relay.BatchBuffer(max_bytes=10**6, memory_cap_bytes=100)
+    assert buffer.add("/v1/traces", b"a" * 60)
+    assert not buffer.add("/v1/traces", b"b" * 60)
+    assert (buffer.accepted_requests, buffer.rejected_requests, buffer.dropped_bytes) == (1, 1, 60)
+
+    chunks = buffer.drain()["/v1/traces"]
+    buffer.add("/v1/traces", b"c" * 30)
+    # A failed batch goes back in front of newer requests
+    buffer.restore("/v1/traces", chunks)
+    assert buffer.drain() == {"/v1/traces": [b"a" * 60, b"c" * 30]}
+    buffer.add("/v1/traces", b"d" * 50)
+    buffer.restore("/v1/traces", chunks)
+    assert buffer.dropped_bytes == 120 and buffer.buffered_bytes == 50
+
+
+def test_concatenated_requests_parse_as_one():
+    merged = ExportTraceServiceRequest.FromString(_request("api-handler") + _request("worker"))
+    services = [spans.resource.attributes[0].value.string_value for spans in merged.resource_spans]
+    assert services == ["api-handler", "worker"]
+
+
+def test_forwarder_sends_one_gzip_request(upstream):
+    forwarder = relay.Forwarder(upstream.url + "/", {"api-key": "license"}, level=6)
+    chunks = [_request("api-handler"), _request("worker")]
+    assert forwarder.send("/v1/traces", chunks)
+
+    [(method, path, headers, body)] = upstream.requests
+    assert (method, path) == ("POST", "/v1/traces")
+    assert headers["Content-Encoding"] == "gzip" and headers["Content-Type"] == relay.PROTOBUF_CONTENT_TYPE
+    assert headers["api-key"] == "license"
+    assert zlib.decompress(body, 16 + zlib.MAX_WBITS) == b"".join(chunks)
+
+
+def test_failed_forward_is_kept(upstream):
+    buffer = relay.BatchBuffer()
+    forwarder = relay.Forwarder(upstream.url, {})
+    forwarding = relay.Relay(buffer, forwarder)
+    buffer.add("/v1/traces", _request("api-handler"))
+    upstream.status[0] = 503
+    forwarding.flush()
+    assert buffer.buffered_bytes > 0
+    upstream.status[0] = 200
+    forwarding.flush()
+    assert buffer.buffered_bytes == 0 and len(upstream.requests) == 2
+
+
+def test_loopback_endpoint():
+    buffer = relay.BatchBuffer(memory_cap_bytes=200)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), relay.make_request_handler(buffer))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def post(path, body, content_type=relay.PROTOBUF_CONTENT_TYPE, encoding=None):
+        headers = {"Content-Type": content_type}
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url + path, data=body, headers=headers, method="POST")) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    try:
+        body = _request("api-handler")
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        assert post("/v1/traces", compressor.compress(body) + compressor.flush(), encoding="gzip") == 200
+        assert buffer.drain() == {"/v1/traces": [body]}
+        assert post("/v1/profiles", body) == 404
+        assert post("/v1/traces", b"{}", content_type="application/json") == 415
+        assert post("/v1/traces", b"not gzip", encoding="gzip") == 400
+        assert post("/v1/traces", b"x" * 201) == 429
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_extension_joins_forward_before_next_event():
+    events = [{"eventType": "INVOKE"}, {"eventType": "INVOKE"}, {"eventType": "SHUTDOWN"}]
+    timeline = []
+
+    def runtime_api(method, path, headers, body):
+        if path.endswith("/register"):
+            return 200, {"Lambda-Extension-Identifier": "ext-1"}, b"{}"
+        assert headers["Lambda-Extension-Identifier"] == "ext-1"
+        timeline.append("next")
+        return 200, {}, json.dumps(events.pop(0)).encode()
+
+    def slow_upstream(method, path, headers, body):
+        time.sleep(0.2)
+        timeline.append("forwarded")
+        return 200, {}, b""
+
+    extensions = HTTPStub(runtime_api)
+    slow = HTTPStub(slow_upstream)
+    try:
+        buffer = relay.BatchBuffer(max_bytes=1)
+        forwarding = relay.Relay(buffer, relay.Forwarder(slow.url, {}))
+        client = relay.ExtensionsClient(extensions.url[len("http://"):])
+        buffer.add("/v1/traces", _request("first"))
+        original_next = client.next_event
+
+        def next_event():
+            event = original_next()
+            if event["eventType"] == "INVOKE" and len(events) == 1:
+                # Exported by the first invocation, forwarded while the second runs
+                buffer.add("/v1/metrics", b"metrics")
+            return event
+
+        client.next_event = next_event
+        relay.run_extension(forwarding, client)
+    finally:
+        extensions.stop()
+        slow.stop()
+
+    assert json.loads(extensions.requests[0][3]) == {"events": ["INVOKE", "SHUTDOWN"]}
+    # Every forward finished before the next /event/next, which lets the environment freeze
+    assert timeline == ["next", "forwarded", "next", "forwarded", "next"]
+    assert [path for _, path, _, _ in slow.requests] == ["/v1/traces", "/v1/metrics"]
+    assert buffer.buffered_bytes == 0
@@ -0,0 +1,59 @@
+"""
+Span processor throughput and the full worker handler against an in-memory exporter.
+"""
+
+import pytest
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+
+from conftest import load_handler
+
+
+class _DiscardingExporter(SpanExporter):
+    def __init__(self):
+        self.exported = 0
+
+    def export(self, spans):
+        self.exported += len(spans)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+@pytest.mark.parametrize("span_count", [100, 2048])
+def test_batch_span_processor_throughput(benchmark, tracer, span_exporter, span_count):
+    for i in range(span_count):
+        with tracer.start_as_current_span(f"span-{i}") as span:
+            span.set_attribute("messaging.system", "sqs")
+    spans = span_exporter.get_finished_spans()
+
+    exporter = _DiscardingExporter()
+    processor = BatchSpanProcessor(exporter, max_queue_size=max(span_count * 2, 2048), max_export_batch_size=512)
+
+    def push_and_flush():
+        for span in spans:
+            processor.on_end(span)
+        processor.force_flush()
+
+    benchmark(push_and_flush)
+    processor.shutdown()
+    assert exporter.exported % span_count == 0
+
+
+@pytest.mark.parametrize("batch_size", [1, 10, 100, 10_000])
+def test_worker_handler(benchmark, span_exporter, make_sqs_event, lambda_context, batch_size):
+    worker = load_handler("lambda2")
+    event = make_sqs_event(batch_size)
+
+    def fresh_delivery():
+        # Every round must process the batch, not skip it as a redelivery
+        span_exporter.clear()
+        worker.idempotency.cache.clear()
+
+    rounds = 3 if batch_size >= 10_000 else 20
+    result = benchmark.pedantic(
+        worker.handler, args=(event, lambda_context), setup=fresh_delivery, rounds=rounds
+    )
+
+    assert result == {"batchItemFailures": []}
+    assert len(span_exporter.get_finished_spans()) == batch_size
@@ -0,0 +1,115 @@
+"""
+Per-client token buckets: refill and burst, client keys from API Gateway
+events, the shared store, the per-request overhead, and a noisy client not
+starving a well-behaved one at the API handler.
+"""
+
+import json
+
+import pytest
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from conftest import CapturingSQS, Clock, FakeLambdaContext, load_handler
+from otel_sqs import rate_limit
+from otel_sqs.rate_limit import ANONYMOUS, InMemoryRateLimitStore, RateLimiter, client_key, client_label, retry_after_header
+
+
+class _FailingStore:
+    def take(self, key, rate_per_s, burst):
+        raise ConnectionError("table unreachable")
+
+
+def test_token_bucket():
+    clock = Clock()
+    limiter = RateLimiter(rate_per_s=2, burst=3, clock=clock)
+    assert [limiter.acquire("a") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("a") == pytest.approx(0.5)
+    # Other clients have their own bucket
+    assert limiter.acquire("b") == 0.0
+    clock.now = 0.5
+    assert limiter.acquire("a") == 0.0
+    assert limiter.acquire("a") == pytest.approx(0.5)
+    clock.now = 100.0
+    # Refill stops at the burst size
+    assert sum(1 for _ in range(10) if limiter.acquire("a") == 0.0) == 3
+
+
+def test_client_key():
+    event = {
+        "headers": {"X-Api-Key": "key-1", "X-Client-Id": "tenant-7"},
+        "requestContext": {"identity": {"sourceIp": "203.0.113.9", "apiKey": None}},
+    }
+    assert client_key(event, ["api_key", "source_ip"]) == "api_key:key-1"
+    assert client_key(event, ["header:x-client-id"]) == "header:tenant-7"
+    assert client_key(event, ["source_ip"]) == "source_ip:203.0.113.9"
+    assert client_key({}, ["api_key", "source_ip"]) == ANONYMOUS
+    # Telemetry gets the source and a hash, never the key itself
+    assert client_label("api_key:key-1") == client_label("api_key:key-1") != client_label("api_key:key-2")
+    assert client_label("api_key:key-1").startswith("api_key:") and "key-1" not in client_label("api_key:key-1")
+    assert client_label(ANONYMOUS) == ANONYMOUS
+    assert retry_after_header(0.2) == "1" and retry_after_header(2.5) == "3"
+
+
+def test_shared_store_limits_across_containers():
+    store_clock = Clock()
+    store = InMemoryRateLimitStore(clock=store_clock)
+    containers = [RateLimiter(rate_per_s=1, burst=5, store=store, clock=Clock()) for _ in range(3)]
+    allowed = sum(1 for limiter in containers for _ in range(5) if limiter.acquire("a") == 0.0)
+    # Each container alone would allow its full burst
+    assert allowed == 5
+
+
+def test_store_outage_falls_back_to_local_bucket():
+    limiter = RateLimiter(rate_per_s=1, burst=2, store=_FailingStore(), clock=Clock())
+    assert [limiter.acquire("a") > 0 for _ in range(3)] == [False, False, True]
+
+
+def test_lru_bound():
+    limiter = RateLimiter(rate_per_s=1, burst=1, max_clients=100, clock=Clock())
+    for i in range(1000):
+        limiter.acquire(f"client-{i}")
+    assert len(limiter._buckets) == 100
+
+
+@pytest.mark.parametrize("throttled", [False, True], ids=["allowed", "throttled"])
+def test_acquire_overhead(benchmark, throttled):
+    limiter = RateLimiter(rate_per_s=1e9 if not throttled else 1e-9, burst=1)
+    limiter.acquire("client")
+    benchmark(limiter.acquire, "client")
+
+
+def test_noisy_client_does_not_starve_others(monkeypatch, span_exporter):
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter("benchmarks")
+    monkeypatch.setattr(rate_limit, "_throttle_counter", meter.create_counter("http.server.rate_limit.throttled"))
+    api = load_handler("lambda1")
+    monkeypatch.setattr(api, "sqs", CapturingSQS())
+    monkeypatch.setattr(api, "rate_limiter", RateLimiter(rate_per_s=0.001, burst=10))
+
+    def request(source_ip: str) -> dict:
+        event = {"httpMethod": "POST", "path": "/process", "body": json.dumps({"message": "hi"}),
+                 "requestContext": {"identity": {"sourceIp": source_ip}}}
+        return api.handler(event, FakeLambdaContext())
+
+    monkeypatch.setattr(api, "test_connectivity", lambda: True)
+    noisy = [request("198.51.100.1")["statusCode"] for _ in range(100)]
+    assert noisy.count(200) == 10
+    assert noisy.count(429) == 90
+
+    monkeypatch.setattr(api, "test_connectivity", lambda: pytest.fail("throttled requests must not touch the network"))
+    throttled = request("198.51.100.1")
+    assert throttled["statusCode"] == 429 and int(throttled["headers"]["Retry-After"]) > 0
+    span = span_exporter.get_finished_spans()[-1]
+    assert span.attributes["http.rate_limit.client"] == client_label("source_ip:198.51.100.1")
+    assert "198.51.100.1" not in span.attributes["http.rate_limit.client"]
+    assert span.attributes["http.rate_limit.throttled"] is True
+
+    monkeypatch.setattr(api, "test_connectivity", lambda: True)
+    assert request("198.51.100.2")["statusCode"] == 200
+    assert len(api.sqs.sent) == 11
+
+    [metric] = reader.get_metrics_data().resource_metrics[0].scope_metrics[0].metrics
+    [point] = metric.data.data_points
+    assert point.value == 91
+    assert point.attributes == {"source": "source_ip", "scope": "local"}
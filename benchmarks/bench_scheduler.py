@@ -0,0 +1,90 @@
+"""
+Remaining-time-aware scheduling in the worker: per-record admission overhead,
+EWMA estimates, and a slow batch that defers its tail instead of timing out.
+"""
+
+import time
+
+import pytest
+
+from conftest import FakeLambdaContext, load_handler
+from otel_sqs.scheduler import BatchScheduler
+
+RECORD_MS = 50
+
+
+def test_admit_and_observe_overhead(benchmark):
+    scheduler = BatchScheduler(type_field="data.priority")
+    deadline = time.monotonic() + 60
+    body = {"data": {"priority": "high"}}
+
+    def one_record():
+        message_type = scheduler.message_type(body)
+        scheduler.admit(message_type, deadline)
+        scheduler.observe(message_type, 1.0)
+
+    benchmark(one_record)
+
+
+def test_estimates_follow_an_ewma_per_type():
+    scheduler = BatchScheduler(default_estimate_ms=100, alpha=0.5, type_field="data.priority")
+    assert scheduler.estimate_ms("high") == 100
+    scheduler.observe("high", 40)
+    scheduler.observe("high", 20)
+    scheduler.observe("low", 400)
+    assert scheduler.estimate_ms("high") == pytest.approx(30)
+    assert scheduler.estimate_ms("low") == pytest.approx(400)
+    assert scheduler.message_type({"data": {"priority": "low"}}) == "low"
+    assert scheduler.message_type({"data": {}}) == "default"
+    assert scheduler.message_type({}, claim_check=True) == "claim-check"
+
+
+def test_no_deadline_admits_everything():
+    scheduler = BatchScheduler(default_estimate_ms=10_000)
+    assert scheduler.deadline(None) is None
+    assert scheduler.admit("default", None)
+
+
+@pytest.fixture
+def slow_worker(monkeypatch):
+    worker = load_handler("lambda2")
+    monkeypatch.setattr(worker, "scheduler", BatchScheduler(flush_budget_ms=200, default_estimate_ms=RECORD_MS))
+    process_message_with_span = worker.process_message_with_span
+
+    def slow(message_body, span):
+        time.sleep(RECORD_MS / 1000)
+        return process_message_with_span(message_body, span)
+
+    monkeypatch.setattr(worker, "process_message_with_span", slow)
+    worker.idempotency.cache.clear()
+    return worker
+
+
+def test_slow_batch_defers_unstarted_records(slow_worker, span_exporter, make_sqs_event):
+    event = make_sqs_event(10)
+    span_exporter.clear()
+    # Room for about 6 records of 50ms after the 200ms flush budget
+    result = slow_worker.handler(event, FakeLambdaContext(remaining_ms=200 + 6 * RECORD_MS + 20))
+
+    deferred = [failure["itemIdentifier"] for failure in result["batchItemFailures"]]
+    processed = len(span_exporter.get_finished_spans())
+    assert 0 < len(deferred) < 10 and processed + len(deferred) == 10
+    # Deferred records are the unstarted tail of the batch, in order
+    assert deferred == [record["messageId"] for record in event["Records"][processed:]]
+
+    # The redelivered tail is processed in the next invocation
+    redelivery = {"Records": event["Records"][processed:]}
+    assert slow_worker.handler(redelivery, FakeLambdaContext())["batchItemFailures"] == []
+
+
+def test_learned_estimate_admits_fast_records(monkeypatch, span_exporter, make_sqs_event):
+    worker = load_handler("lambda2")
+    scheduler = BatchScheduler(flush_budget_ms=200, default_estimate_ms=1000)
+    monkeypatch.setattr(worker, "scheduler", scheduler)
+    worker.idempotency.cache.clear()
+    # Unknown type: the conservative default does not fit into the time left
+    assert len(worker.handler(make_sqs_event(10), FakeLambdaContext(remaining_ms=500))["batchItemFailures"]) == 10
+
+    worker.handler(make_sqs_event(1), FakeLambdaContext())
+    assert scheduler.estimate_ms("default") < 100
+    assert worker.handler(make_sqs_event(10), FakeLambdaContext(remaining_ms=500))["batchItemFailures"] == []
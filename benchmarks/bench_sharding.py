@@ -0,0 +1,167 @@
+"""
+Hash-sharded queues: consistent-hash balance and stability when a shard is
+added, per-shard batched sends and depth on the in-process SQS stand-in, the
+depth gauge never calling SQS during collection, the
+consumer attaching every shard, and the API handler keeping a tenant on one
+shard.
+"""
+
+import json
+import threading
+import time
+import uuid
+
+import pytest
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from conftest import CapturingSQS, FakeLambdaContext, load_handler
+from otel_sqs import sharding
+from otel_sqs.lanes import DEFAULT_LANE, Lane, lanes_from_env
+from otel_sqs.sharding import HashRing, ShardRouter, shard_name
+
+KEYS = [f"tenant-{i}" for i in range(10000)]
+
+
+def test_ring_balance():
+    ring = HashRing([f"shard-{i}" for i in range(4)])
+    counts = {}
+    for key in KEYS:
+        node = ring.node_for(key)
+        counts[node] = counts.get(node, 0) + 1
+    assert len(counts) == 4
+    assert all(abs(count - len(KEYS) / 4) < len(KEYS) / 4 * 0.25 for count in counts.values())
+
+
+def test_adding_a_shard_moves_only_its_share():
+    before = HashRing([f"shard-{i}" for i in range(4)])
+    after = HashRing([f"shard-{i}" for i in range(5)])
+    moved = [key for key in KEYS if before.node_for(key) != after.node_for(key)]
+    assert all(after.node_for(key) == "shard-4" for key in moved)
+    assert 0.1 < len(moved) / len(KEYS) < 0.3
+
+
+def test_router():
+    router = ShardRouter(["https://sqs/q-0", "https://sqs/q-1", "https://sqs/q-2"], key_field="customer.id")
+    assert router.route({"customer": {"id": "c-1"}}, "req-1") == router.route({"customer": {"id": "c-1"}}, "req-2")
+    assert router.shard_key({"message": "hi"}, "req-1") == "req-1"
+    # Without the key, requests spread by request id
+    assert len({router.route({}, f"req-{i}") for i in range(100)}) == 3
+    single = ShardRouter(["https://sqs/q-0"], key_field="customer.id")
+    assert not single.enabled and single.route({"customer": {"id": "c-1"}}, "req-1") == "https://sqs/q-0"
+
+
+def test_send_batch_per_shard(monkeypatch, local_sqs):
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter("benchmarks")
+    monkeypatch.setattr(sharding, "_send_duration", meter.create_histogram("messaging.sqs.shard.send.duration"))
+    queue_urls = [local_sqs.create_queue(f"otel-alml-poc-queue-{i}-{uuid.uuid4().hex[:8]}") for i in range(3)]
+    client = local_sqs.client()
+    router = ShardRouter(queue_urls, key_field="tenant", sqs_client=client)
+
+    bodies = [{"tenant": f"t-{i % 12}", "seq": i} for i in range(60)]
+    message_ids = router.send_batch(bodies, [f"req-{i}" for i in range(60)])
+    assert len(set(message_ids)) == 60 and None not in message_ids
+
+    tenants_per_queue = {}
+    for queue_url in queue_urls:
+        received = local_sqs.queue(queue_url).receive(100, 0, None)
+        tenants_per_queue[queue_url] = {json.loads(message.body)["tenant"] for message, _ in received}
+    # Every tenant's messages are on exactly its shard
+    assert sorted(t for tenants in tenants_per_queue.values() for t in tenants) == sorted(f"t-{i}" for i in range(12))
+    for queue_url, tenants in tenants_per_queue.items():
+        assert all(router.route({"tenant": tenant}, "") == queue_url for tenant in tenants)
+
+    [metric] = reader.get_metrics_data().resource_metrics[0].scope_metrics[0].metrics
+    assert {point.attributes["shard"] for point in metric.data.data_points} == {
+        shard_name(url) for url, tenants in tenants_per_queue.items() if tenants
+    }
+
+
+def test_queue_depths_are_cached(local_sqs):
+    queue_urls = [local_sqs.create_queue(f"otel-alml-poc-queue-{i}-{uuid.uuid4().hex[:8]}") for i in range(2)]
+    client = local_sqs.client()
+    now = [0.0]
+    router = ShardRouter(queue_urls, sqs_client=client, depth_refresh_s=30, clock=lambda: now[0])
+    client.send_message(QueueUrl=queue_urls[0], MessageBody="{}")
+    # Reading the depths never calls SQS; refreshing happens on a background thread
+    assert router.queue_depths() == {}
+    router.refresh_depths().join()
+    assert router.queue_depths() == {shard_name(queue_urls[0]): 1, shard_name(queue_urls[1]): 0}
+    client.send_message(QueueUrl=queue_urls[1], MessageBody="{}")
+    assert router.refresh_depths() is None
+    assert router.queue_depths()[shard_name(queue_urls[1])] == 0
+    now[0] = 30.0
+    router.refresh_depths().join()
+    assert router.queue_depths()[shard_name(queue_urls[1])] == 1
+
+
+def test_depth_gauge_stays_off_the_request_path(monkeypatch):
+    release = threading.Event()
+
+    class _SlowSQS:
+        calls = 0
+
+        def get_queue_attributes(self, QueueUrl, AttributeNames):
+            _SlowSQS.calls += 1
+            release.wait()
+            return {"Attributes": {"ApproximateNumberOfMessages": "7"}}
+
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter("benchmarks")
+    monkeypatch.setattr(sharding, "_active_routers", sharding.weakref.WeakSet())
+    meter.create_observable_gauge("messaging.sqs.shard.depth", callbacks=[sharding._observe_depth])
+    router = ShardRouter(["https://sqs/q-0", "https://sqs/q-1"], sqs_client=_SlowSQS())
+
+    # SQS hangs, yet collecting (as force_flush does on every request) returns at once
+    start = time.perf_counter()
+    reader.get_metrics_data()
+    reader.get_metrics_data()
+    assert time.perf_counter() - start < 0.5
+    release.set()
+    deadline = time.monotonic() + 5
+    while len(router.queue_depths()) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # One background refresh at a time
+    assert _SlowSQS.calls == 2
+    [metric] = reader.get_metrics_data().resource_metrics[0].scope_metrics[0].metrics
+    assert {point.attributes["shard"]: point.value for point in metric.data.data_points} == {"q-0": 7, "q-1": 7}
+
+
+def test_consumer_attaches_every_shard(monkeypatch):
+    monkeypatch.setenv("SQS_SHARD_QUEUE_URLS", "https://sqs/q-0,https://sqs/q-1,https://sqs/q-2")
+    monkeypatch.setenv("SQS_PRIORITY_QUEUE_URLS", "high=https://sqs/high")
+    assert lanes_from_env("https://sqs/q-0") == [
+        Lane(DEFAULT_LANE, "https://sqs/q-0"), Lane("high", "https://sqs/high"), Lane("q-1", "https://sqs/q-1"), Lane("q-2", "https://sqs/q-2"),
+    ]
+
+
+def test_api_keeps_a_tenant_on_one_shard(monkeypatch, span_exporter):
+    api = load_handler("lambda1")
+    monkeypatch.setattr(api, "test_connectivity", lambda: True)
+    monkeypatch.setattr(api, "sqs", CapturingSQS())
+    queue_urls = [f"https://sqs.eu-central-1.amazonaws.com/123456789012/otel-alml-poc-queue-{i}" for i in range(4)]
+    monkeypatch.setattr(api, "shard_router", ShardRouter(queue_urls, key_field="customerId"))
+
+    for i in range(40):
+        body = json.dumps({"message": "hi", "customerId": f"c-{i % 8}"})
+        assert api.handler({"httpMethod": "POST", "path": "/process", "body": body}, FakeLambdaContext())["statusCode"] == 200
+    shards = {}
+    for sent in api.sqs.sent:
+        customer = json.loads(sent["MessageBody"])["data"]["customerId"]
+        shards.setdefault(customer, set()).add(sent["QueueUrl"])
+    assert all(len(urls) == 1 for urls in shards.values())
+    assert len(set.union(*shards.values())) > 1
+
+    # Priority lanes keep their own queues
+    monkeypatch.setattr(api, "priority_router", api.PriorityRouter(api.SQS_QUEUE_URL, {"high": "https://sqs/high"}))
+    body = json.dumps({"message": "hi", "customerId": "c-1", "priority": "high"})
+    api.handler({"httpMethod": "POST", "path": "/process", "body": body}, FakeLambdaContext())
+    assert api.sqs.sent[-1]["QueueUrl"] == "https://sqs/high"
+
+
+@pytest.mark.parametrize("shards", [4, 64])
+def test_route_cost(benchmark, shards):
+    router = ShardRouter([f"https://sqs/q-{i}" for i in range(shards)], key_field="tenant")
+    body = {"tenant": "tenant-42", "message": "hi"}
+    benchmark(router.route, body, "req-1")
@@ -0,0 +1,158 @@
+"""
+SigV4 signing cache: signatures identical to botocore's, refreshed
+credentials never signing with a stale key, which operations are switched,
+and signatures per second for a SendMessage request.
+"""
+
+import datetime
+import json
+import types
+import uuid
+
+import pytest
+from botocore import auth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import ReadOnlyCredentials
+
+from otel_sqs import signing
+from otel_sqs.clients import create_client
+from otel_sqs.signing import CachingSigV4Auth, _choose_signer
+
+QUEUE_URL = "https://sqs.eu-central-1.amazonaws.com/123456789012/otel-alml-poc-queue"
+# STS session tokens of Lambda execution roles are around a kilobyte
+CREDENTIALS = ReadOnlyCredentials("ASIAEXAMPLE", "secret-1", "t" * 1000)
+
+
+class _Frozen(datetime.datetime):
+    @classmethod
+    def utcnow(cls):
+        return cls(2024, 5, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def frozen_time(monkeypatch):
+    monkeypatch.setattr(auth, "datetime", types.SimpleNamespace(datetime=_Frozen))
+
+
+def _send_message_request() -> AWSRequest:
+    body = json.dumps({"QueueUrl": QUEUE_URL, "MessageBody": json.dumps({"message": "hi", "data": "x" * 512})})
+    return AWSRequest(
+        method="POST",
+        url="https://sqs.eu-central-1.amazonaws.com/",
+        data=body.encode("utf-8"),
+        headers={
+            "X-Amz-Target": "AmazonSQS.SendMessage",
+            "Content-Type": "application/x-amz-json-1.0",
+            "User-Agent": "Boto3/1.34.0",
+        },
+    )
+
+
+def _authorization(signer_class, credentials=CREDENTIALS) -> str:
+    request = _send_message_request()
+    signer_class(credentials, "sqs", "eu-central-1").add_auth(request)
+    return request.headers["Authorization"]
+
+
+def test_signatures_match_botocore(frozen_time):
+    signing.clear_caches()
+    expected = _authorization(auth.SigV4Auth)
+    # Uncached, then from the caches
+    assert _authorization(CachingSigV4Auth) == expected
+    assert _authorization(CachingSigV4Auth) == expected
+
+
+def test_refreshed_credentials(frozen_time):
+    _authorization(CachingSigV4Auth)
+    refreshed = ReadOnlyCredentials("ASIAEXAMPLE", "secret-2", "u" * 1000)
+    assert _authorization(CachingSigV4Auth, refreshed) == _authorization(auth.SigV4Auth, refreshed)
+    assert _authorization(CachingSigV4Auth, refreshed) != _authorization(CachingSigV4Auth)
+
+
+def test_retry_reselects_headers(frozen_time):
+    request = _send_message_request()
+    signer = CachingSigV4Auth(CREDENTIALS, "sqs", "eu-central-1")
+    signer.add_auth(request)
+    request.headers["X-Amz-Target"] = "AmazonSQS.SendMessageBatch"
+    signer.add_auth(request)
+    expected = _send_message_request()
+    expected.headers["X-Amz-Target"] = "AmazonSQS.SendMessageBatch"
+    auth.SigV4Auth(CREDENTIALS, "sqs", "eu-central-1").add_auth(expected)
+    assert request.headers["Authorization"] == expected.headers["Authorization"]
+
+
+def test_switched_operations():
+    assert _choose_signer(signing_name="sqs", signature_version="v4") == signing.SIGNATURE_VERSION
+    assert _choose_signer(signing_name="dynamodb", signature_version="v4") == signing.SIGNATURE_VERSION
+    # S3 signs with s3v4; presigned URLs and unsigned bodies keep botocore's signer
+    assert _choose_signer(signing_name="s3", signature_version="v4") is None
+    assert _choose_signer(signing_name="sqs", signature_version="v4-query") is None
+    assert _choose_signer(signing_name="sqs", signature_version="v4-unsigned-body") is None
+    # Operation-specific auth types are botocore's to choose
+    for auth_type in ("none", "v4-unsigned-body", "v4a", "bearer"):
+        assert _choose_signer(signing_name="sts", signature_version="v4", context={"auth_type": auth_type}) is None
+
+
+class _Sent(Exception):
+    pass
+
+
+def test_operation_auth_type_is_kept(monkeypatch):
+    cached_signatures = []
+    original = CachingSigV4Auth.signature
+    monkeypatch.setattr(CachingSigV4Auth, "signature", lambda self, *args: cached_signatures.append(1) or original(self, *args))
+    monkeypatch.setenv("AWS_CLIENT_SIGNING_CACHE", "true")
+    client = create_client(
+        "sts", endpoint_url="http://127.0.0.1:9", region_name="eu-central-1",
+        aws_access_key_id="local", aws_secret_access_key="local",
+    )
+    sent = []
+
+    def capture(request, **kwargs):
+        sent.append(request.headers)
+        raise _Sent()
+
+    client.meta.events.register("before-send", capture)
+    # AssumeRoleWithWebIdentity is modeled with auth type "none"
+    with pytest.raises(_Sent):
+        client.assume_role_with_web_identity(
+            RoleArn="arn:aws:iam::123456789012:role/worker", RoleSessionName="session", WebIdentityToken="token-1234",
+        )
+    assert "Authorization" not in sent[0] and not cached_signatures
+    with pytest.raises(_Sent):
+        client.get_caller_identity()
+    assert "Authorization" in sent[1] and len(cached_signatures) == 1
+
+
+def test_client_uses_cached_signer(monkeypatch, frozen_time, local_sqs):
+    cached_signatures = []
+    original = CachingSigV4Auth.signature
+    monkeypatch.setattr(CachingSigV4Auth, "signature", lambda self, *args: cached_signatures.append(1) or original(self, *args))
+    queue_url = local_sqs.create_queue(f"otel-alml-poc-queue-{uuid.uuid4().hex[:8]}")
+
+    def send(signing_cache: str) -> str:
+        monkeypatch.setenv("AWS_CLIENT_SIGNING_CACHE", signing_cache)
+        client = create_client(
+            "sqs", endpoint_url=local_sqs.endpoint_url, region_name="eu-central-1",
+            aws_access_key_id="local", aws_secret_access_key="local",
+        )
+        authorization = []
+        client.meta.events.register("before-send", lambda request, **kwargs: authorization.append(request.headers["Authorization"]))
+        client.send_message(QueueUrl=queue_url, MessageBody="{}")
+        return authorization[0]
+
+    cached = send("true")
+    assert len(cached_signatures) == 1
+    assert send("false") == cached
+    assert len(cached_signatures) == 1
+
+
+@pytest.mark.parametrize("signer_class", [auth.SigV4Auth, CachingSigV4Auth], ids=["botocore", "cached"])
+def test_signatures_per_second(benchmark, signer_class):
+    request = _send_message_request()
+
+    def sign():
+        # botocore builds a signer per request around the frozen credentials
+        signer_class(CREDENTIALS, "sqs", "eu-central-1").add_auth(request)
+
+    benchmark(sign)
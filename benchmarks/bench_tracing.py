@@ -0,0 +1,113 @@
+"""
+Span creation, context propagation and OTLP encoding costs.
+"""
+
+import pytest
+from opentelemetry import propagate, trace
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.trace import SpanKind
+
+from otel_sqs.envelope import ENVELOPE_ATTRIBUTE, EnvelopePropagator
+from otel_sqs.instrumentation import sqs_getter, sqs_setter
+
+FUNCTION_NAME = "otel-alml-poc-api-handler"
+QUEUE_URL = "https://sqs.eu-central-1.amazonaws.com/123456789012/otel-alml-poc-queue"
+
+
+def _api_span(tracer):
+    # Attributes set by lambda1/index.py handler + process_within_span
+    with tracer.start_as_current_span("api_request_processing", kind=SpanKind.SERVER) as span:
+        span.set_attribute("lambda.function", "api-handler")
+        span.set_attribute("lambda.name", FUNCTION_NAME)
+        span.set_attribute("http.method", "POST")
+        span.set_attribute("http.path", "/process")
+        span.set_attribute("faas.execution", "3f2c2a8e-9f0e-4a61-9f5e-2f3d1d1b6a77")
+        span.set_attribute("faas.id", FUNCTION_NAME)
+        span.set_attribute("messaging.system", "sqs")
+        span.set_attribute("messaging.operation", "publish")
+        span.set_attribute("messaging.destination", QUEUE_URL.split("/")[-1])
+        span.set_attribute("messaging.message_id", "b5b0d6a5-6d0a-4bb4-8f4a-ff0f3e0c1f11")
+        span.set_attribute("messaging.url", QUEUE_URL)
+        span.set_attribute("span.kind", "server")
+
+
+def _worker_span(tracer):
+    # Attributes set by lambda2/index.py handler + process_message_with_span
+    with tracer.start_as_current_span("sqs_message_processing", kind=SpanKind.CONSUMER) as span:
+        span.set_attribute("lambda.function", "worker")
+        span.set_attribute("lambda.name", "otel-alml-poc-worker")
+        span.set_attribute("messaging.system", "sqs")
+        span.set_attribute("messaging.operation", "process")
+        span.set_attribute("messaging.message_id", "b5b0d6a5-6d0a-4bb4-8f4a-ff0f3e0c1f11")
+        span.set_attribute("faas.execution", "3f2c2a8e-9f0e-4a61-9f5e-2f3d1d1b6a77")
+        span.set_attribute("faas.id", "otel-alml-poc-worker")
+        span.set_attribute("span.kind", "consumer")
+        span.set_attribute("message.test_id", "trace-test-001")
+        span.set_attribute("message.source", "unknown")
+        span.set_attribute("message.size", 187)
+
+
+def test_api_handler_span(benchmark, tracer, span_exporter):
+    benchmark(_api_span, tracer)
+    assert span_exporter.get_finished_spans()
+
+
+def test_worker_span(benchmark, tracer, span_exporter):
+    benchmark(_worker_span, tracer)
+    assert span_exporter.get_finished_spans()
+
+
+def test_propagate_inject(benchmark, tracer):
+    def inject():
+        carrier = {}
+        propagate.inject(carrier)
+        return carrier
+
+    with tracer.start_as_current_span("api_request_processing"):
+        carrier = benchmark(inject)
+    assert {"traceparent", "X-Amzn-Trace-Id"} <= carrier.keys()
+
+
+def test_propagate_extract(benchmark, trace_carrier):
+    context = benchmark(propagate.extract, trace_carrier)
+    assert context
+
+
+def _attributes_size(message_attributes):
+    # SQS bills name + data type + value of every message attribute
+    return sum(len(name) + len(a["DataType"]) + len(a["StringValue"]) for name, a in message_attributes.items())
+
+
+def test_envelope_inject(benchmark, tracer):
+    envelope = EnvelopePropagator()
+
+    def inject():
+        message_attributes = {}
+        envelope.inject(message_attributes, setter=sqs_setter)
+        return message_attributes
+
+    with tracer.start_as_current_span("api_request_processing"):
+        message_attributes = benchmark(inject)
+        headers = {}
+        propagate.inject(headers, setter=sqs_setter)
+    assert list(message_attributes) == [ENVELOPE_ATTRIBUTE]
+    assert _attributes_size(message_attributes) * 3 < _attributes_size(headers)
+
+
+def test_envelope_extract(benchmark, tracer):
+    envelope = EnvelopePropagator()
+    with tracer.start_as_current_span("api_request_processing") as span:
+        message_attributes = {}
+        envelope.inject(message_attributes, setter=sqs_setter)
+
+    context = benchmark(envelope.extract, message_attributes, getter=sqs_getter)
+    assert trace.get_current_span(context).get_span_context().span_id == span.get_span_context().span_id
+
+
+@pytest.mark.parametrize("batch_size", [1, 8, 64, 512, 2048])
+def test_encode_spans(benchmark, tracer, span_exporter, batch_size):
+    for _ in range(batch_size):
+        _worker_span(tracer)
+    spans = span_exporter.get_finished_spans()
+    request = benchmark(encode_spans, spans)
+    assert len(request.resource_spans[0].scope_spans[0].spans) == batch_size
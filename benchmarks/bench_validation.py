@@ -0,0 +1,182 @@
+"""
+Request schema validation: error paths, compile-time rejection of unsupported
+schemas, validation cost of compiled closures against a per-request schema
+walk, and the API handler answering 400 before anything is enqueued.
+"""
+
+import json
+import os
+
+import pytest
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from conftest import CapturingSQS, FakeLambdaContext, REPO_ROOT, load_handler
+from otel_sqs import validation
+from otel_sqs.validation import RequestValidator, compile_schema
+
+ORDER_SCHEMA = {
+    "type": "object",
+    "required": ["orderId", "items"],
+    "additionalProperties": False,
+    "properties": {
+        "orderId": {"type": "string", "pattern": "^ord-[0-9]+$"},
+        "priority": {"enum": ["high", "default", "low"]},
+        "items": {
+            "type": "array",
+            "minItems": 1,
+            "maxItems": 100,
+            "items": {
+                "type": "object",
+                "required": ["sku", "quantity"],
+                "properties": {
+                    "sku": {"type": "string", "minLength": 3},
+                    "quantity": {"type": "integer", "minimum": 1, "maximum": 1000},
+                    "price": {"type": "number", "exclusiveMinimum": 0},
+                },
+            },
+        },
+        "note": {"type": ["string", "null"], "maxLength": 200},
+    },
+}
+
+VALID_ORDER = {
+    "orderId": "ord-42",
+    "priority": "high",
+    "items": [{"sku": f"sku-{i}", "quantity": i + 1, "price": 9.99} for i in range(20)],
+    "note": None,
+}
+
+
+def _errors(schema, body) -> list:
+    return [(error.path, error.keyword) for error in RequestValidator(schema).validate(body)]
+
+
+def test_valid_body():
+    assert _errors(ORDER_SCHEMA, VALID_ORDER) == []
+
+
+def test_error_paths():
+    body = {
+        "orderId": "42",
+        "priority": "urgent",
+        "items": [{"sku": "sku-1", "quantity": 1}, {"sku": "x", "quantity": True}, {"quantity": 0, "price": 0}],
+        "coupon": "FREE",
+    }
+    assert _errors(ORDER_SCHEMA, body) == [
+        ("$.orderId", "pattern"),
+        ("$.priority", "enum"),
+        ("$.items[1].sku", "minLength"),
+        ("$.items[1].quantity", "type"),
+        ("$.items[2].sku", "required"),
+        ("$.items[2].quantity", "minimum"),
+        ("$.items[2].price", "exclusiveMinimum"),
+        ("$.coupon", "additionalProperties"),
+    ]
+    assert _errors(ORDER_SCHEMA, ["not", "an", "object"]) == [("$", "type")]
+    assert _errors(ORDER_SCHEMA, {}) == [("$.orderId", "required"), ("$.items", "required")]
+
+
+def test_max_errors():
+    body = {"orderId": "ord-1", "items": [{"sku": "s", "quantity": 0}] * 50}
+    assert len(RequestValidator(ORDER_SCHEMA, max_errors=5).validate(body)) == 5
+
+
+def test_unsupported_keywords_fail_at_compile_time():
+    with pytest.raises(ValueError, match="oneOf"):
+        compile_schema({"type": "object", "properties": {"a": {"oneOf": [{"type": "string"}]}}})
+    with pytest.raises(ValueError, match="decimal"):
+        compile_schema({"type": "decimal"})
+
+
+def test_shipped_schema():
+    with open(os.path.join(REPO_ROOT, "lambda1", "request_schema.json")) as f:
+        validator = RequestValidator(json.load(f))
+    assert validator.validate({"message": "Testing trace propagation", "priority": "high", "test_id": "trace-test-001"}) == []
+    assert [error.path for error in validator.validate({"message": "", "priority": "high priority"})] == ["$.message", "$.priority"]
+
+
+def _interpret(schema, value, path="$", errors=None):
+    """Walks the schema dict on every call: what compiling avoids"""
+    errors = [] if errors is None else errors
+    types = schema.get("type")
+    if types is not None:
+        names = types if isinstance(types, list) else [types]
+        if not any(validation._TYPES[name](value) for name in names):
+            errors.append((path, "type"))
+            return errors
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append((path, "enum"))
+    if isinstance(value, dict):
+        for name in schema.get("required", []):
+            if name not in value:
+                errors.append((f"{path}.{name}", "required"))
+        properties = schema.get("properties", {})
+        for name, item in value.items():
+            if name in properties:
+                _interpret(properties[name], item, f"{path}.{name}", errors)
+            elif schema.get("additionalProperties") is False:
+                errors.append((f"{path}.{name}", "additionalProperties"))
+    if isinstance(value, list):
+        if len(value) < schema.get("minItems", 0) or len(value) > schema.get("maxItems", len(value)):
+            errors.append((path, "items"))
+        for i, item in enumerate(value):
+            _interpret(schema.get("items", {}), item, f"{path}[{i}]", errors)
+    if isinstance(value, str):
+        if len(value) < schema.get("minLength", 0) or len(value) > schema.get("maxLength", len(value)):
+            errors.append((path, "length"))
+        if "pattern" in schema and validation.re.search(schema["pattern"], value) is None:
+            errors.append((path, "pattern"))
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if value < schema.get("minimum", value) or value > schema.get("maximum", value):
+            errors.append((path, "range"))
+        if "exclusiveMinimum" in schema and value <= schema["exclusiveMinimum"]:
+            errors.append((path, "range"))
+    return errors
+
+
+@pytest.mark.parametrize("mode", ["compiled", "interpreted"])
+def test_validation_cost(benchmark, mode):
+    if mode == "compiled":
+        validator = RequestValidator(ORDER_SCHEMA)
+        assert benchmark(validator.validate, VALID_ORDER) == []
+    else:
+        assert benchmark(_interpret, ORDER_SCHEMA, VALID_ORDER) == []
+
+
+def test_handler_rejects_before_enqueue(monkeypatch, span_exporter):
+    reader = InMemoryMetricReader()
+    meter = MeterProvider(metric_readers=[reader]).get_meter("benchmarks")
+    monkeypatch.setattr(validation, "_rejected_counter", meter.create_counter("http.server.request.validation.rejected"))
+    monkeypatch.setattr(validation, "_validation_duration", meter.create_histogram("http.server.request.validation.duration"))
+    api = load_handler("lambda1")
+    monkeypatch.setattr(api, "test_connectivity", lambda: True)
+    monkeypatch.setattr(api, "sqs", CapturingSQS())
+    monkeypatch.setattr(api, "request_validator", RequestValidator(ORDER_SCHEMA))
+
+    def post(body: str) -> dict:
+        return api.handler({"httpMethod": "POST", "path": "/process", "body": body}, FakeLambdaContext())
+
+    response = post(json.dumps({"orderId": "ord-1", "items": [{"sku": "sku-1", "quantity": -1}]}))
+    assert response["statusCode"] == 400
+    assert json.loads(response["body"])["errors"] == [
+        {"path": "$.items[0].quantity", "keyword": "minimum", "message": "must be >= 1"},
+    ]
+    span = span_exporter.get_finished_spans()[-1]
+    assert span.attributes["http.request.validation.first_error"] == "$.items[0].quantity"
+
+    response = post("{not json")
+    assert response["statusCode"] == 400
+    assert json.loads(response["body"])["errors"][0]["keyword"] == "json"
+
+    assert post(json.dumps(VALID_ORDER))["statusCode"] == 200
+    assert len(api.sqs.sent) == 1
+
+    metrics = {
+        metric.name: metric.data.data_points
+        for metric in reader.get_metrics_data().resource_metrics[0].scope_metrics[0].metrics
+    }
+    assert {point.attributes["keyword"]: point.value for point in metrics["http.server.request.validation.rejected"]} == {
+        "minimum": 1, "json": 1,
+    }
+    assert metrics["http.server.request.validation.duration"][0].count == 2
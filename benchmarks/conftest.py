@@ -0,0 +1,209 @@
+"""
+Shared setup for the telemetry hot-path benchmarks.
+
+Run from the repository root:
+
+    pip install -r benchmarks/requirements.txt
+    python -m pytest benchmarks
+
+Every run is saved as JSON under ``benchmarks/.results`` (file names carry the
+commit id), compare two runs with ``pytest-benchmark compare 0001 0002``.
+"""
+
+import importlib.util
+import json
+import os
+import sys
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", ".results")
+
+# lambda1/packages is the superset of both functions' dependencies (boto3, X-Ray propagator)
+sys.path.insert(0, os.path.join(REPO_ROOT, "lambda1", "packages"))
+sys.path.insert(0, REPO_ROOT)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-central-1")
+os.environ.setdefault("SQS_QUEUE_URL", "https://sqs.eu-central-1.amazonaws.com/123456789012/otel-alml-poc-queue")
+# lambda1 would otherwise connect to the real SQS endpoint at import
+os.environ.setdefault("AWS_CLIENT_PRIME_CONNECTIONS", "0")
+# Keep the handlers from building their own OTLP pipeline; the in-memory one below is used instead
+os.environ["OBSERVABILITY_CONFIG"] = "newrelic_native"
+
+import pytest  # noqa: E402
+from opentelemetry import propagate, trace  # noqa: E402
+from opentelemetry.propagators.aws import AwsXRayPropagator  # noqa: E402
+from opentelemetry.propagators.composite import CompositePropagator  # noqa: E402
+from opentelemetry.sdk.trace import TracerProvider  # noqa: E402
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor  # noqa: E402
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter  # noqa: E402
+from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator  # noqa: E402
+
+from local_sqs import LocalSQS  # noqa: E402
+
+_exporter = InMemorySpanExporter()
+_provider = TracerProvider()
+_provider.add_span_processor(SimpleSpanProcessor(_exporter))
+trace.set_tracer_provider(_provider)
+
+# Same propagator stack the handlers install for the community configs
+propagate.set_global_textmap(CompositePropagator([AwsXRayPropagator(), TraceContextTextMapPropagator()]))
+
+
+def pytest_configure(config):
+    # Store results next to the suite rather than in the current working directory
+    if config.option.benchmark_storage == "file://./.benchmarks":
+        config.option.benchmark_storage = f"file://{RESULTS_DIR}"
+
+
+class FakeLambdaContext:
+    function_name = "otel-alml-poc-worker"
+
+    def __init__(self, remaining_ms: int = 30000):
+        self.aws_request_id = str(uuid.uuid4())
+        self._remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self) -> int:
+        return self._remaining_ms
+
+
+class Clock:
+    """Settable clock for the ``clock=`` parameters"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class CapturingSQS:
+    """Stands in for lambda1's SQS client and keeps every SendMessage"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, **kwargs):
+        self.sent.append(kwargs)
+        return {"MessageId": f"msg-{len(self.sent)}"}
+
+
+class HTTPStub:
+    """HTTP server on an ephemeral port; ``respond(method, path, headers, body)`` returns (status, headers, body)"""
+
+    def __init__(self, respond):
+        stub = self
+        self.requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.requests.append((self.command, self.path, self.headers, body))
+                status, headers, payload = respond(self.command, self.path, self.headers, body)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def load_handler(lambda_dir: str):
+    """Import ``<lambda_dir>/index.py`` under a unique module name"""
+    module_name = f"{lambda_dir}_index"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    sys.path.insert(0, os.path.join(REPO_ROOT, lambda_dir))
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(REPO_ROOT, lambda_dir, "index.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_sqs_record(body: dict, carrier: dict) -> dict:
+    """SQS event record as delivered by the Lambda event source mapping"""
+    return {
+        "messageId": str(uuid.uuid4()),
+        "receiptHandle": "AQEB" + uuid.uuid4().hex,
+        "body": json.dumps(body),
+        "attributes": {
+            "ApproximateReceiveCount": "1",
+            "SentTimestamp": "1700000000000",
+            "ApproximateFirstReceiveTimestamp": "1700000000100",
+        },
+        "messageAttributes": {
+            key: {"stringValue": value, "dataType": "String"} for key, value in carrier.items()
+        },
+        "eventSource": "aws:sqs",
+        "eventSourceARN": "arn:aws:sqs:eu-central-1:123456789012:otel-alml-poc-queue",
+    }
+
+
+@pytest.fixture(scope="module")
+def local_sqs():
+    """In-process SQS stand-in, one per test module"""
+    sqs = LocalSQS().start()
+    yield sqs
+    sqs.stop()
+
+
+@pytest.fixture
+def span_exporter():
+    _exporter.clear()
+    yield _exporter
+    _exporter.clear()
+
+
+@pytest.fixture
+def tracer(span_exporter):
+    return trace.get_tracer("benchmarks")
+
+
+@pytest.fixture
+def lambda_context():
+    return FakeLambdaContext()
+
+
+@pytest.fixture
+def trace_carrier(tracer):
+    """Carrier produced by lambda1's ``propagate.inject`` for an active request span"""
+    carrier = {}
+    with tracer.start_as_current_span("api_request_processing"):
+        propagate.inject(carrier)
+    return carrier
+
+
+@pytest.fixture
+def make_sqs_event(trace_carrier):
+    def _make(batch_size: int) -> dict:
+        records = []
+        for i in range(batch_size):
+            body = {
+                "requestId": str(uuid.uuid4()),
+                "timestamp": 1700000000000,
+                "data": {"message": "Testing trace propagation", "priority": "high", "test_id": f"bench-{i}"},
+                "traceContext": trace_carrier,
+            }
+            records.append(make_sqs_record(body, trace_carrier))
+        return {"Records": records}
+
+    return _make
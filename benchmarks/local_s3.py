@@ -0,0 +1,144 @@
+"""
+In-process S3 stand-in for the claim-check benchmarks.
+
+Serves the subset of the S3 REST API that ``s3transfer`` uploads and the
+claim-check consumer use (PutObject, multipart upload, GetObject, HeadObject,
+DeleteObject, DeleteObjects) over loopback HTTP. A real botocore client talks
+to it, so signing, multipart splitting and streaming bodies are exercised
+unchanged. Use path-style addressing.
+"""
+
+import hashlib
+import threading
+import uuid
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+_NS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class LocalS3:
+    def __init__(self):
+        self.objects: Dict[Tuple[str, str], bytes] = {}
+        self.uploads: Dict[str, Dict[int, bytes]] = {}
+        self.multipart_uploads = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(self))
+        self._server.daemon_threads = True
+        self.endpoint_url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "LocalS3":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def client(self):
+        import boto3
+        from botocore.config import Config
+
+        return boto3.client(
+            "s3",
+            endpoint_url=self.endpoint_url,
+            region_name="eu-central-1",
+            aws_access_key_id="local",
+            aws_secret_access_key="local",
+            config=Config(s3={"addressing_style": "path"}, max_pool_connections=20),
+        )
+
+
+def _make_handler(s3: LocalS3):
+    class S3RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _target(self):
+            url = urlsplit(self.path)
+            bucket, _, key = url.path.lstrip("/").partition("/")
+            query = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+            return bucket, unquote(key), query
+
+        def _body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def do_PUT(self):
+            bucket, key, query = self._target()
+            data = self._body()
+            etag = f'"{hashlib.md5(data).hexdigest()}"'
+            with s3._lock:
+                if "uploadId" in query:
+                    s3.uploads[query["uploadId"]][int(query["partNumber"])] = data
+                else:
+                    s3.objects[(bucket, key)] = data
+            self._respond(200, headers={"ETag": etag})
+
+        def do_POST(self):
+            bucket, key, query = self._target()
+            body = self._body()
+            if "uploads" in query:
+                upload_id = uuid.uuid4().hex
+                with s3._lock:
+                    s3.uploads[upload_id] = {}
+                    s3.multipart_uploads += 1
+                return self._xml(
+                    f'<InitiateMultipartUploadResult xmlns="{_NS}"><Bucket>{bucket}</Bucket>'
+                    f"<Key>{key}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+                )
+            if "uploadId" in query:
+                with s3._lock:
+                    parts = s3.uploads.pop(query["uploadId"])
+                    s3.objects[(bucket, key)] = b"".join(parts[n] for n in sorted(parts))
+                return self._xml(
+                    f'<CompleteMultipartUploadResult xmlns="{_NS}"><Bucket>{bucket}</Bucket>'
+                    f'<Key>{key}</Key><ETag>"{uuid.uuid4().hex}-{len(parts)}"</ETag></CompleteMultipartUploadResult>'
+                )
+            if "delete" in query:
+                keys = [element.text for element in ET.fromstring(body).iter(f"{{{_NS}}}Key")]
+                keys += [element.text for element in ET.fromstring(body).iter("Key")]
+                with s3._lock:
+                    for object_key in keys:
+                        s3.objects.pop((bucket, object_key), None)
+                return self._xml(f'<DeleteResult xmlns="{_NS}"></DeleteResult>')
+            self._respond(400)
+
+        def do_GET(self):
+            bucket, key, _ = self._target()
+            data = s3.objects.get((bucket, key))
+            if data is None:
+                return self._xml(f"<Error><Code>NoSuchKey</Code><Key>{key}</Key></Error>", status=404)
+            self._respond(200, data, {"Content-Type": "text/plain", "ETag": f'"{hashlib.md5(data).hexdigest()}"'})
+
+        def do_HEAD(self):
+            bucket, key, _ = self._target()
+            data = s3.objects.get((bucket, key))
+            self.send_response(200 if data is not None else 404)
+            self.send_header("Content-Length", str(len(data or b"")))
+            self.end_headers()
+
+        def do_DELETE(self):
+            bucket, key, query = self._target()
+            with s3._lock:
+                if "uploadId" in query:
+                    s3.uploads.pop(query["uploadId"], None)
+                else:
+                    s3.objects.pop((bucket, key), None)
+            self._respond(204)
+
+        def _xml(self, document: str, status: int = 200):
+            self._respond(status, document.encode(), {"Content-Type": "application/xml"})
+
+        def _respond(self, status: int, data: bytes = b"", headers: Dict[str, str] = None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return S3RequestHandler
@@ -0,0 +1,259 @@
+"""
+In-process SQS stand-in for the consumer benchmarks.
+
+Serves the SQS JSON protocol (``X-Amz-Target: AmazonSQS.<Operation>``) over
+loopback HTTP, so a real botocore client is used unchanged. Supported:
+SendMessage, SendMessageBatch, ReceiveMessage (long polling, visibility
+timeout, receive counts), DeleteMessage, DeleteMessageBatch,
+ChangeMessageVisibility(Batch) and GetQueueAttributes (message counts). Queues
+are created with ``create_queue``.
+"""
+
+import hashlib
+import json
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+ACCOUNT_ID = "123456789012"
+
+
+class _Message:
+    __slots__ = ("message_id", "body", "attributes", "message_attributes", "visible_at", "receipt_handles", "receive_count")
+
+    def __init__(self, body: str, attributes: Dict[str, str], message_attributes: Dict[str, Any], visible_at: float):
+        self.message_id = str(uuid.uuid4())
+        self.body = body
+        self.attributes = attributes
+        self.message_attributes = message_attributes
+        self.visible_at = visible_at
+        self.receipt_handles = set()
+        self.receive_count = 0
+
+
+class LocalQueue:
+    def __init__(self, name: str, visibility_timeout_s: float):
+        self.name = name
+        self.visibility_timeout_s = visibility_timeout_s
+        self.messages: "OrderedDict[str, _Message]" = OrderedDict()
+        self.by_receipt: Dict[str, str] = {}
+        self.deleted = 0
+        self.condition = threading.Condition()
+
+    def __len__(self) -> int:
+        with self.condition:
+            return len(self.messages)
+
+    def in_flight(self) -> int:
+        now = time.monotonic()
+        with self.condition:
+            return sum(1 for message in self.messages.values() if message.visible_at > now)
+
+    def send(self, body: str, message_attributes: Dict[str, Any], system_attributes: Dict[str, Any], delay_s: float = 0) -> _Message:
+        attributes = {"SentTimestamp": str(int(time.time() * 1000))}
+        trace_header = system_attributes.get("AWSTraceHeader", {}).get("StringValue")
+        if trace_header:
+            attributes["AWSTraceHeader"] = trace_header
+        message = _Message(body, attributes, message_attributes, time.monotonic() + delay_s)
+        with self.condition:
+            self.messages[message.message_id] = message
+            self.condition.notify_all()
+        return message
+
+    def receive(self, max_messages: int, wait_s: float, visibility_timeout_s: Optional[float]) -> List[Tuple[_Message, str]]:
+        """Visible messages with a fresh receipt handle each, waiting up to ``wait_s`` for any"""
+        deadline = time.monotonic() + wait_s
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                received = []
+                for message in self.messages.values():
+                    if message.visible_at <= now:
+                        received.append(message)
+                        if len(received) == max_messages:
+                            break
+                if received or now >= deadline:
+                    break
+                # Invisible messages come back without a notification, so wake up periodically
+                self.condition.wait(min(deadline - now, 0.05))
+            timeout = self.visibility_timeout_s if visibility_timeout_s is None else visibility_timeout_s
+            handles = []
+            for message in received:
+                message.visible_at = now + timeout
+                message.receive_count += 1
+                message.attributes.setdefault("ApproximateFirstReceiveTimestamp", str(int(time.time() * 1000)))
+                message.attributes["ApproximateReceiveCount"] = str(message.receive_count)
+                handle = "AQEB" + uuid.uuid4().hex
+                message.receipt_handles.add(handle)
+                self.by_receipt[handle] = message.message_id
+                handles.append(handle)
+            return list(zip(received, handles))
+
+    def change_visibility(self, receipt_handle: str, timeout_s: float) -> Optional[str]:
+        """Error code, or None if the message's visibility was changed"""
+        with self.condition:
+            message = self.messages.get(self.by_receipt.get(receipt_handle, ""))
+            if message is None:
+                return "ReceiptHandleIsInvalid"
+            now = time.monotonic()
+            if message.visible_at <= now:
+                return "MessageNotInflight"
+            message.visible_at = now + timeout_s
+            self.condition.notify_all()
+            return None
+
+    def delete(self, receipt_handle: str) -> bool:
+        with self.condition:
+            message_id = self.by_receipt.pop(receipt_handle, None)
+            if message_id is None:
+                return False
+            message = self.messages.pop(message_id, None)
+            if message is not None:
+                self.deleted += 1
+                for handle in message.receipt_handles:
+                    self.by_receipt.pop(handle, None)
+            return True
+
+
+class LocalSQS:
+    def __init__(self):
+        self.queues: Dict[str, LocalQueue] = {}
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(self))
+        self._server.daemon_threads = True
+        self.endpoint_url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "LocalSQS":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def create_queue(self, name: str, visibility_timeout_s: float = 30) -> str:
+        self.queues[name] = LocalQueue(name, visibility_timeout_s)
+        return self.queue_url(name)
+
+    def queue_url(self, name: str) -> str:
+        return f"{self.endpoint_url}/{ACCOUNT_ID}/{name}"
+
+    def queue(self, queue_url: str) -> LocalQueue:
+        return self.queues[queue_url.rstrip("/").rsplit("/", 1)[-1]]
+
+    def client(self):
+        import boto3
+        from botocore.config import Config
+
+        return boto3.client(
+            "sqs",
+            endpoint_url=self.endpoint_url,
+            region_name="eu-central-1",
+            aws_access_key_id="local",
+            aws_secret_access_key="local",
+            config=Config(max_pool_connections=20, read_timeout=60),
+        )
+
+    def _count(self, operation: str):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+
+    def handle(self, operation: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        self._count(operation)
+        queue = self.queue(request["QueueUrl"])
+        if operation == "SendMessage":
+            return _sent(queue.send(
+                request["MessageBody"], request.get("MessageAttributes", {}),
+                request.get("MessageSystemAttributes", {}), request.get("DelaySeconds", 0),
+            ), request["MessageBody"])
+        if operation == "SendMessageBatch":
+            successful = []
+            for entry in request["Entries"]:
+                message = queue.send(
+                    entry["MessageBody"], entry.get("MessageAttributes", {}),
+                    entry.get("MessageSystemAttributes", {}), entry.get("DelaySeconds", 0),
+                )
+                successful.append({"Id": entry["Id"], **_sent(message, entry["MessageBody"])})
+            return {"Successful": successful, "Failed": []}
+        if operation == "ReceiveMessage":
+            received = queue.receive(
+                request.get("MaxNumberOfMessages", 1), request.get("WaitTimeSeconds", 0), request.get("VisibilityTimeout")
+            )
+            messages = []
+            for message, handle in received:
+                messages.append({
+                    "MessageId": message.message_id,
+                    "ReceiptHandle": handle,
+                    "MD5OfBody": hashlib.md5(message.body.encode()).hexdigest(),
+                    "Body": message.body,
+                    "Attributes": dict(message.attributes),
+                    "MessageAttributes": message.message_attributes,
+                })
+            return {"Messages": messages} if messages else {}
+        if operation == "DeleteMessage":
+            queue.delete(request["ReceiptHandle"])
+            return {}
+        if operation == "DeleteMessageBatch":
+            successful, failed = [], []
+            for entry in request["Entries"]:
+                if queue.delete(entry["ReceiptHandle"]):
+                    successful.append({"Id": entry["Id"]})
+                else:
+                    failed.append({"Id": entry["Id"], "SenderFault": True, "Code": "ReceiptHandleIsInvalid", "Message": "Unknown receipt handle"})
+            return {"Successful": successful, "Failed": failed}
+        if operation == "ChangeMessageVisibility":
+            queue.change_visibility(request["ReceiptHandle"], request["VisibilityTimeout"])
+            return {}
+        if operation == "ChangeMessageVisibilityBatch":
+            successful, failed = [], []
+            for entry in request["Entries"]:
+                error = queue.change_visibility(entry["ReceiptHandle"], entry.get("VisibilityTimeout", 0))
+                if error is None:
+                    successful.append({"Id": entry["Id"]})
+                else:
+                    failed.append({"Id": entry["Id"], "SenderFault": True, "Code": error, "Message": error})
+            return {"Successful": successful, "Failed": failed}
+        if operation == "GetQueueAttributes":
+            return {"Attributes": {
+                "ApproximateNumberOfMessages": str(len(queue) - queue.in_flight()),
+                "ApproximateNumberOfMessagesNotVisible": str(queue.in_flight()),
+            }}
+        raise NotImplementedError(operation)
+
+
+def _sent(message: _Message, body: str) -> Dict[str, str]:
+    return {"MessageId": message.message_id, "MD5OfMessageBody": hashlib.md5(body.encode()).hexdigest()}
+
+
+def _make_handler(sqs: LocalSQS):
+    class SQSRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # Headers and body go out in separate writes; without this, Nagle + delayed ACK add ~40ms per call
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_POST(self):
+            operation = self.headers.get("X-Amz-Target", "").rpartition(".")[2]
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            try:
+                status, response = 200, sqs.handle(operation, request)
+            except KeyError as e:
+                status, response = 400, {"__type": "com.amazonaws.sqs#QueueDoesNotExist", "message": f"Unknown queue {e}"}
+            data = json.dumps(response).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/x-amz-json-1.0")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return SQSRequestHandler
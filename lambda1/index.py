@@ -4,9 +4,20 @@ import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'packages'))
 
 import json
-import boto3
 import logging
 import socket
+import time
+
+from otel_sqs.admission import AdmissionController
+from otel_sqs.codec import body_codec
+from otel_sqs.claim_check import claim_checks
+from otel_sqs.clients import create_client
+from otel_sqs.fifo import FifoAttributes
+from otel_sqs.idempotency import IdempotencyError, IdempotentRequests, RequestInProgress, idempotency_key
+from otel_sqs.lanes import DEFAULT_LANE, PriorityRouter
+from otel_sqs.rate_limit import RateLimiter, client_label, retry_after_header
+from otel_sqs.sharding import ShardRouter
+from otel_sqs.validation import RequestValidator, ValidationError
 
 # OpenTelemetry imports for force_flush
 try:
@@ -27,11 +38,13 @@ try:
         from opentelemetry.sdk.trace.export import BatchSpanProcessor
         from opentelemetry.sdk.metrics import MeterProvider
         from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
-        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-        from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
-        from opentelemetry.instrumentation.boto3sqs import Boto3SQSInstrumentor
         from opentelemetry.instrumentation.botocore import BotocoreInstrumentor
         from opentelemetry.sdk.resources import Resource
+        from otel_sqs.compression import GzipOTLPSpanExporter, GzipOTLPMetricExporter
+        from otel_sqs.circuit_breaker import CircuitBreakerSpanExporter, CircuitBreakerMetricExporter
+        from otel_sqs.accumulating import AccumulatingSpanProcessor, flush_on_shutdown
+        from otel_sqs.instrumentation import SQSInstrumentor
+        from otel_sqs.envelope import EnvelopePropagator
         
         # Create resource with Lambda identification
         resource = Resource.create({
@@ -58,12 +71,21 @@ try:
                     key, value = header.split('=', 1)
                     headers[key.strip()] = value.strip()
         
-        otlp_exporter = OTLPSpanExporter(
+        # "accumulate" batches spans across warm invocations instead of exporting per request
+        accumulate_spans = os.environ.get('TELEMETRY_EXPORT_MODE', 'per_invocation') == 'accumulate'
+        
+        otlp_exporter = GzipOTLPSpanExporter(
             endpoint=traces_endpoint,
             headers=headers,
             timeout=5  # 5 second timeout
         )
-        trace_provider.add_span_processor(BatchSpanProcessor(otlp_exporter, max_export_batch_size=50, schedule_delay_millis=1000))
+        # Fail fast instead of waiting on the exporter timeout while the endpoint is down
+        otlp_exporter = CircuitBreakerSpanExporter(otlp_exporter, endpoint=traces_endpoint)
+        if accumulate_spans:
+            # Keep spans across warm invocations and export them in large gzip batches
+            trace_provider.add_span_processor(AccumulatingSpanProcessor(otlp_exporter))
+        else:
+            trace_provider.add_span_processor(BatchSpanProcessor(otlp_exporter, max_export_batch_size=50, schedule_delay_millis=1000))
         trace.set_tracer_provider(trace_provider)
         
         # Set up propagation - use both X-Ray and W3C for AWS compatibility
@@ -83,18 +105,26 @@ try:
         
         # Set up metrics with specific endpoint
         metric_reader = PeriodicExportingMetricReader(
-            OTLPMetricExporter(
+            CircuitBreakerMetricExporter(GzipOTLPMetricExporter(
                 endpoint=metrics_endpoint,
                 headers=headers,
                 timeout=5  # 5 second timeout
-            ),
+            ), endpoint=metrics_endpoint),
             export_interval_millis=5000  # Export every 5 seconds
         )
-        metrics.set_meter_provider(MeterProvider(resource=resource, metric_readers=[metric_reader]))
+        meter_provider = MeterProvider(resource=resource, metric_readers=[metric_reader])
+        metrics.set_meter_provider(meter_provider)
+        if accumulate_spans:
+            flush_on_shutdown(trace_provider, meter_provider)
         
-        # Auto-instrument
-        Boto3SQSInstrumentor().instrument()
+        # Auto-instrument: botocore for AWS calls, SQSInstrumentor (outermost) for one
+        # PRODUCER span and a single context injection per sent message
         BotocoreInstrumentor().instrument()
+        # "envelope" propagates through one compact otel-ctx attribute instead of X-Ray + W3C headers
+        if os.environ.get('SQS_TRACE_PROPAGATION', 'headers') == 'envelope':
+            SQSInstrumentor().instrument(propagator=EnvelopePropagator())
+        else:
+            SQSInstrumentor().instrument()
         print(f"Lambda1: Initialized OpenTelemetry manual instrumentation (config: {observability_config})")
         
     elif observability_config == 'newrelic_native':
@@ -111,9 +141,24 @@ except ImportError as e:
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize SQS client
-sqs = boto3.client('sqs')
+# Response cache for Idempotency-Key requests: warm-container LRU, then IDEMPOTENCY_TABLE / IDEMPOTENCY_SQLITE_PATH
+idempotent_requests = IdempotentRequests.from_env()
+
+# Initialize SQS client: tuned pool, retries and timeouts (AWS_CLIENT_*), connected to the endpoint during init
+sqs = create_client('sqs', prime_connections=int(os.environ.get('AWS_CLIENT_PRIME_CONNECTIONS', '1')))
 SQS_QUEUE_URL = os.environ['SQS_QUEUE_URL']
+# Priority lanes: SQS_PRIORITY_QUEUE_URLS maps SQS_PRIORITY_FIELD values to their own queues
+priority_router = PriorityRouter.from_env(SQS_QUEUE_URL)
+# Default-lane shards (SQS_SHARD_QUEUE_URLS), picked by consistent hashing of SQS_SHARD_KEY_FIELD; one client for all
+shard_router = ShardRouter.from_env(SQS_QUEUE_URL, sqs)
+# Queue-depth admission control (ADMISSION_CONTROL=reject|shed|degrade); admits everything when unset
+admission_control = AdmissionController.from_env(priority_router, sqs)
+# Per-client token buckets (RATE_LIMIT_PER_SECOND); no limit when unset
+rate_limiter = RateLimiter.from_env()
+# /process body schema (REQUEST_SCHEMA_PATH), compiled once per container
+request_validator = RequestValidator.from_env(os.path.dirname(__file__))
+# MessageGroupId / MessageDeduplicationId for .fifo queues (SQS_MESSAGE_GROUP_FIELD, SQS_DEDUPLICATION_FIELD)
+fifo_attributes = FifoAttributes.from_env()
 
 def test_connectivity():
     """Test network connectivity to New Relic OTLP endpoint"""
@@ -142,22 +187,100 @@ def test_connectivity():
         logger.error(f"Connectivity test failed: {e}")
         return False
 
+def accepted_at_ms(event):
+    """Epoch ms at which API Gateway accepted the request (now when invoked directly)"""
+    request_time = (event.get('requestContext') or {}).get('requestTimeEpoch')
+    return int(request_time) if request_time else int(time.time() * 1000)
+
+def overloaded_response(admission):
+    """429 for a request refused by admission control"""
+    return {
+        'statusCode': 429,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Retry-After': str(admission.retry_after_s)
+        },
+        'body': json.dumps({
+            'error': 'Too many requests queued, retry later',
+            'queueDepth': admission.queue_depth
+        })
+    }
+
+def throttled_response(retry_after_s):
+    """429 for a client over its rate limit"""
+    return {
+        'statusCode': 429,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Retry-After': retry_after_header(retry_after_s)
+        },
+        'body': json.dumps({'error': 'Rate limit exceeded, retry later'})
+    }
+
+def parse_body(event):
+    """Request body of an API Gateway event and validation errors, empty if it may be enqueued"""
+    if 'body' not in event:
+        return {"message": "Hello from API"}, []
+    if not isinstance(event['body'], str):
+        body = event['body']
+    else:
+        try:
+            body = json.loads(event['body'])
+        except json.JSONDecodeError as e:
+            request_validator.record_malformed()
+            return None, [ValidationError('$', 'json', f'is not valid JSON: {e.msg} at position {e.pos}')]
+    return body, request_validator.validate(body)
+
+def invalid_request_response(errors):
+    """400 listing the path of every validation error"""
+    return {
+        'statusCode': 400,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps({
+            'error': 'Invalid request body',
+            'errors': [error.as_dict() for error in errors]
+        })
+    }
+
 def process_within_span(event, context, span):
     """Process the request within the provided span context"""
     
-    # Extract body from API Gateway event
-    if 'body' in event:
-        if isinstance(event['body'], str):
-            body = json.loads(event['body'])
-        else:
-            body = event['body']
-    else:
-        body = {"message": "Hello from API"}
+    # Extract body from API Gateway event; malformed payloads stop here instead of in the worker
+    body, validation_errors = parse_body(event)
+    if validation_errors:
+        span.set_attribute("http.request.validation.errors", len(validation_errors))
+        span.set_attribute("http.request.validation.first_error", validation_errors[0].path)
+        span.set_attribute("http.status_code", 400)
+        force_flush_telemetry()
+        return invalid_request_response(validation_errors)
+    
+    # Refuse or redirect the request while the worker is too far behind
+    lane, queue_url = priority_router.route(body)
+    if lane == DEFAULT_LANE and shard_router.enabled:
+        queue_url = shard_router.route(body, context.aws_request_id)
+    admission = admission_control.decide(lane, queue_url)
+    if admission_control.enabled:
+        span.set_attribute("http.admission.decision", admission.action)
+        if admission.queue_depth is not None:
+            span.set_attribute("http.admission.queue_depth", admission.queue_depth)
+        if admission.shed_probability:
+            span.set_attribute("http.admission.shed_probability", admission.shed_probability)
+    if not admission.admitted:
+        span.set_attribute("http.status_code", 429)
+        force_flush_telemetry()
+        return overloaded_response(admission)
+    lane, queue_url = admission.lane, admission.queue_url
     
     # Create message for SQS
     message = {
         "requestId": context.aws_request_id,
-        "timestamp": context.get_remaining_time_in_millis(),
+        # Wall-clock accept time; the worker measures end-to-end latency from it
+        "timestamp": accepted_at_ms(event),
         "data": body
     }
     
@@ -169,48 +292,34 @@ def process_within_span(event, context, span):
         }
     }
     
-    # Get current trace context for manual propagation to SQS message
-    trace_context = {}
-    propagate.inject(trace_context)
+    # Compress large bodies; adds the content-encoding attribute when it does
+    message_body = body_codec.encode_message(json.dumps(message), message_attributes)
+    # Still too large for SQS: upload to S3 and send a claim-check pointer instead
+    message_body = claim_checks.offload(message_body, message_attributes)
     
-    # Add trace context to message body for Lambda2 to extract
-    message["traceContext"] = trace_context
+    # FIFO queues: ordered per message group, deduplicated on the request rather than the message
+    fifo_args = fifo_attributes.send_args(queue_url, body, idempotency_key(event))
     
-    # Also add as message attributes for redundancy
-    if trace_context:
-        if 'traceparent' in trace_context:
-            message_attributes['traceparent'] = {
-                'StringValue': trace_context['traceparent'],
-                'DataType': 'String'
-            }
-        if 'tracestate' in trace_context:
-            message_attributes['tracestate'] = {
-                'StringValue': trace_context['tracestate'],
-                'DataType': 'String'
-            }
-        if 'X-Amzn-Trace-Id' in trace_context:
-            message_attributes['X-Amzn-Trace-Id'] = {
-                'StringValue': trace_context['X-Amzn-Trace-Id'],
-                'DataType': 'String'
-            }
-    
-    logger.info(f"Injected trace context: {trace_context}")
-            
-    # Send message to SQS - instrumentation will create producer spans automatically
-    response = sqs.send_message(
-        QueueUrl=SQS_QUEUE_URL,
-        MessageBody=json.dumps(message),
-        MessageAttributes=message_attributes
-    )
+    # Send message to SQS - SQSInstrumentor creates the producer span and injects the trace context
+    with shard_router.measure_send(queue_url):
+        response = sqs.send_message(
+            QueueUrl=queue_url,
+            MessageBody=message_body,
+            MessageAttributes=message_attributes,
+            **fifo_args
+        )
     
     logger.info(f"Message sent to SQS: {response['MessageId']}")
     
     # Add span attributes for SQS operation
     span.set_attribute("messaging.system", "sqs")
     span.set_attribute("messaging.operation", "publish")
-    span.set_attribute("messaging.destination", SQS_QUEUE_URL.split('/')[-1])
+    span.set_attribute("messaging.destination", queue_url.split('/')[-1])
     span.set_attribute("messaging.message_id", response['MessageId'])
-    span.set_attribute("messaging.url", SQS_QUEUE_URL)
+    span.set_attribute("messaging.url", queue_url)
+    span.set_attribute("messaging.sqs.lane", lane)
+    if fifo_args:
+        span.set_attribute("messaging.sqs.message_group_id", fifo_args["MessageGroupId"])
     # Mark this as the root span of the distributed trace
     span.set_attribute("span.kind", "server")
     
@@ -235,33 +344,44 @@ def process_without_span(event, context):
     """Process the request without OpenTelemetry tracing"""
     
     # Extract body from API Gateway event
-    if 'body' in event:
-        if isinstance(event['body'], str):
-            body = json.loads(event['body'])
-        else:
-            body = event['body']
-    else:
-        body = {"message": "Hello from API"}
+    body, validation_errors = parse_body(event)
+    if validation_errors:
+        return invalid_request_response(validation_errors)
+    
+    lane, queue_url = priority_router.route(body)
+    if lane == DEFAULT_LANE and shard_router.enabled:
+        queue_url = shard_router.route(body, context.aws_request_id)
+    admission = admission_control.decide(lane, queue_url)
+    if not admission.admitted:
+        return overloaded_response(admission)
+    queue_url = admission.queue_url
         
     # Create message for SQS
     message = {
         "requestId": context.aws_request_id,
-        "timestamp": context.get_remaining_time_in_millis(),
+        # Wall-clock accept time; the worker measures end-to-end latency from it
+        "timestamp": accepted_at_ms(event),
         "data": body,
         "traceContext": {}
     }
     
-    # Send message to SQS
-    response = sqs.send_message(
-        QueueUrl=SQS_QUEUE_URL,
-        MessageBody=json.dumps(message),
-        MessageAttributes={
-            'RequestId': {
-                'StringValue': context.aws_request_id,
-                'DataType': 'String'
-            }
+    message_attributes = {
+        'RequestId': {
+            'StringValue': context.aws_request_id,
+            'DataType': 'String'
         }
-    )
+    }
+    message_body = body_codec.encode_message(json.dumps(message), message_attributes)
+    message_body = claim_checks.offload(message_body, message_attributes)
+    
+    # Send message to SQS
+    with shard_router.measure_send(queue_url):
+        response = sqs.send_message(
+            QueueUrl=queue_url,
+            MessageBody=message_body,
+            MessageAttributes=message_attributes,
+            **fifo_attributes.send_args(queue_url, body, idempotency_key(event))
+        )
     
     logger.info(f"Message sent to SQS: {response['MessageId']}")
     
@@ -287,12 +407,20 @@ def handler(event, context):
         # Log OpenTelemetry status
         logger.info(f"OTEL_AVAILABLE = {OTEL_AVAILABLE}")
         
+        # Token bucket per client: throttled requests stop here, before any network, SQS or store call
+        client_key = rate_limiter.client_key(event)
+        retry_after_s = rate_limiter.acquire(client_key)
+        
         # Test network connectivity first
-        connectivity_ok = test_connectivity()
+        connectivity_ok = test_connectivity() if not retry_after_s else None
         
         # Log the incoming event
         logger.info(f"Received event: {json.dumps(event)}")
         
+        # Retries carrying the same Idempotency-Key get the first response instead of a second SQS send
+        request_key = idempotency_key(event)
+        request_body = event['body'] if isinstance(event.get('body'), str) else json.dumps(event.get('body'))
+        
         # Create spans for processing with Lambda identification
         if OTEL_AVAILABLE:
             tracer = trace.get_tracer(__name__)
@@ -319,14 +447,50 @@ def handler(event, context):
                 span.set_attribute("http.path", event.get('path', '/process'))
                 span.set_attribute("faas.execution", context.aws_request_id)
                 span.set_attribute("faas.id", context.function_name)
+                if rate_limiter.enabled:
+                    span.set_attribute("http.rate_limit.client", client_label(client_key))
+                    span.set_attribute("http.rate_limit.throttled", bool(retry_after_s))
+                if retry_after_s:
+                    span.set_attribute("http.status_code", 429)
+                    force_flush_telemetry()
+                    return throttled_response(retry_after_s)
                 
                 # All processing within span context
-                return process_within_span(event, context, span)
+                response, outcome = idempotent_requests.run(
+                    request_key, request_body, lambda: process_within_span(event, context, span)
+                )
+                if request_key:
+                    span.set_attribute("http.idempotency.outcome", outcome)
+                if outcome in ('replayed', 'coalesced'):
+                    # process_within_span did not run, so nothing flushed yet
+                    force_flush_telemetry()
+                return response
         else:
+            if retry_after_s:
+                return throttled_response(retry_after_s)
             # Process without tracing
-            return process_without_span(event, context)
+            response, _ = idempotent_requests.run(
+                request_key, request_body, lambda: process_without_span(event, context)
+            )
+            return response
 
         
+    except IdempotencyError as e:
+        logger.warning(f"Idempotency-Key rejected: {e}")
+        force_flush_telemetry()
+        
+        headers = {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        }
+        if isinstance(e, RequestInProgress):
+            headers['Retry-After'] = '1'
+        return {
+            'statusCode': e.status_code,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+        
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
         
@@ -0,0 +1,30 @@
+"""
+Worker as a long-lived container process instead of a Lambda function.
+
+Long-polls SQS_QUEUE_URL with otel_sqs.consumer.SQSConsumer and hands every
+received batch to the same process_records() the Lambda handler uses. Stops on
+SIGTERM after draining buffered messages and flushing telemetry.
+
+    SQS_QUEUE_URL=https://sqs.eu-central-1.amazonaws.com/123456789012/otel-alml-poc-queue python consumer.py
+
+boto3 is not bundled in packages/ (the Lambda runtime provides it) and must be
+installed in the container image.
+"""
+
+import logging
+import sys
+
+import index
+from otel_sqs.consumer import SQSConsumer
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(threadName)s %(name)s: %(message)s")
+    consumer = SQSConsumer.from_env(index.process_records)
+    drained = consumer.run()
+    index.force_flush_telemetry()
+    sys.exit(0 if drained else 1)
+
+
+if __name__ == "__main__":
+    main()
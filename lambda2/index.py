@@ -5,8 +5,16 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'packages'))
 
 import json
 import logging
+import time
 from datetime import datetime
 
+from otel_sqs.codec import body_codec
+from otel_sqs.claim_check import claim_checks
+from otel_sqs.idempotency import IdempotentConsumer
+from otel_sqs.scheduler import BatchScheduler
+from otel_sqs.latency import record_queue_latency
+from otel_sqs.fifo import message_group, process_groups
+
 # OpenTelemetry imports
 try:
     from opentelemetry import trace, metrics
@@ -14,12 +22,14 @@ try:
     from opentelemetry.sdk.trace.export import BatchSpanProcessor
     from opentelemetry.sdk.metrics import MeterProvider
     from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
-    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-    from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
     from opentelemetry.sdk.resources import Resource
     from opentelemetry import propagate
     from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
     from opentelemetry.trace import SpanKind, Status, StatusCode
+    from otel_sqs.compression import GzipOTLPSpanExporter, GzipOTLPMetricExporter
+    from otel_sqs.circuit_breaker import CircuitBreakerSpanExporter, CircuitBreakerMetricExporter
+    from otel_sqs.accumulating import AccumulatingSpanProcessor, flush_on_shutdown
+    from otel_sqs.extraction import extract_batch
     
     # Initialize manual instrumentation
     # Skip OTEL setup if using New Relic native layer
@@ -46,26 +56,38 @@ try:
                     key, value = header.split('=', 1)
                     headers[key.strip()] = value.strip()
         
+        # "accumulate" batches spans across warm invocations instead of exporting per request
+        accumulate_spans = os.environ.get('TELEMETRY_EXPORT_MODE', 'per_invocation') == 'accumulate'
+        
         # Set up tracing with specific endpoint
         trace_provider = TracerProvider(resource=resource)
-        otlp_exporter = OTLPSpanExporter(
+        otlp_exporter = GzipOTLPSpanExporter(
             endpoint=traces_endpoint,
             headers=headers,
             timeout=5
         )
-        trace_provider.add_span_processor(BatchSpanProcessor(otlp_exporter))
+        # Fail fast instead of waiting on the exporter timeout while the endpoint is down
+        otlp_exporter = CircuitBreakerSpanExporter(otlp_exporter, endpoint=traces_endpoint)
+        if accumulate_spans:
+            # Keep spans across warm invocations and export them in large gzip batches
+            trace_provider.add_span_processor(AccumulatingSpanProcessor(otlp_exporter))
+        else:
+            trace_provider.add_span_processor(BatchSpanProcessor(otlp_exporter))
         trace.set_tracer_provider(trace_provider)
         
         # Set up metrics with specific endpoint
         metric_reader = PeriodicExportingMetricReader(
-            OTLPMetricExporter(
+            CircuitBreakerMetricExporter(GzipOTLPMetricExporter(
                 endpoint=metrics_endpoint,
                 headers=headers,
                 timeout=5
-            ),
+            ), endpoint=metrics_endpoint),
             export_interval_millis=5000
         )
-        metrics.set_meter_provider(MeterProvider(resource=resource, metric_readers=[metric_reader]))
+        meter_provider = MeterProvider(resource=resource, metric_readers=[metric_reader])
+        metrics.set_meter_provider(meter_provider)
+        if accumulate_spans:
+            flush_on_shutdown(trace_provider, meter_provider)
         
         # Set up propagation - use both X-Ray and W3C for AWS compatibility
         try:
@@ -98,6 +120,15 @@ except ImportError as e:
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Skips redelivered records: warm-container LRU, then the store from IDEMPOTENCY_TABLE / IDEMPOTENCY_SQLITE_PATH
+idempotency = IdempotentConsumer.from_env()
+
+# Learns per-type processing times so a batch stops before the invocation times out
+scheduler = BatchScheduler.from_env()
+
+# FIFO batches: message groups processed in parallel, each one in order
+FIFO_GROUP_CONCURRENCY = int(os.environ.get('WORKER_FIFO_GROUP_CONCURRENCY', '4'))
+
 def handler(event, context):
     """
     Lambda 2 - Worker
@@ -106,69 +137,54 @@ def handler(event, context):
     
     logger.info(f"Received SQS event: {json.dumps(event)}")
     
+    result = process_records(event['Records'], context)
+    
+    # Force flush telemetry before Lambda freeze
+    force_flush_telemetry()
+    
+    return result
+
+def process_records(records, context=None):
+    """
+    Process a batch of SQS event records and report the failed ones.
+    Shared by the Lambda handler and the standalone consumer (consumer.py), which passes no context.
+    """
+    
+    processed_keys = []
+    deferred = []
     try:
-        # Process each record in the SQS event
-        for record in event['Records']:
-            # Extract message body
-            message_body = json.loads(record['body'])
-            
-            # Extract trace context - Priority: SQS attributes > message body > Lambda env
-            trace_context = {}
-            
-            # PRIORITY 1: Extract from SQS message attributes (from producer span)
-            if 'messageAttributes' in record:
-                msg_attrs = record['messageAttributes']
-                if 'X-Amzn-Trace-Id' in msg_attrs:
-                    trace_context['X-Amzn-Trace-Id'] = msg_attrs['X-Amzn-Trace-Id']['stringValue']
-                    logger.info(f"Found SQS message X-Ray trace: {msg_attrs['X-Amzn-Trace-Id']['stringValue']}")
-                if 'traceparent' in msg_attrs:
-                    trace_context['traceparent'] = msg_attrs['traceparent']['stringValue']
-                    logger.info(f"Found SQS message traceparent: {msg_attrs['traceparent']['stringValue']}")
-                if 'tracestate' in msg_attrs:
-                    trace_context['tracestate'] = msg_attrs['tracestate']['stringValue']
-            
-            # PRIORITY 2: Extract from SQS record attributes (AWS managed)
-            if 'attributes' in record and 'AWSTraceHeader' in record['attributes']:
-                if 'X-Amzn-Trace-Id' not in trace_context:  # Only if not already set
-                    aws_trace_header = record['attributes']['AWSTraceHeader']
-                    trace_context['X-Amzn-Trace-Id'] = aws_trace_header
-                    logger.info(f"Found SQS AWS trace header: {aws_trace_header}")
-            
-            # PRIORITY 3: Fallback to message body trace context
-            if not trace_context:
-                body_trace_context = message_body.get('traceContext', {})
-                if body_trace_context:
-                    trace_context.update(body_trace_context)
-                    logger.info(f"Using message body trace context: {list(body_trace_context.keys())}")
+        # Bodies above the producer's threshold arrive compressed (content-encoding attribute)
+        message_bodies = [json.loads(body_codec.decode_record(record)) for record in records]
+        
+        # Trace context - Priority: SQS attributes > message body > Lambda env, parsed once per distinct header
+        parent_contexts = extract_batch(records, message_bodies) if OTEL_AVAILABLE else [None] * len(records)
+        
+        # One batched lookup for the whole batch
+        idempotency_keys = [idempotency.key_for(record, body) for record, body in zip(records, message_bodies)]
+        duplicates = idempotency.find_duplicates(idempotency_keys)
+        
+        # Records not started by this deadline are deferred (None outside Lambda)
+        deadline = scheduler.deadline(context)
+        
+        claimed = []
+        
+        def process_record(record, message_body, parent_context, idempotency_key, message_type):
+            started = time.perf_counter()
             
-            # PRIORITY 4: Last resort - Lambda environment (should not be used for proper hierarchy)
-            if not trace_context:
-                trace_header = os.environ.get('_X_AMZN_TRACE_ID')
-                if trace_header:
-                    trace_context['X-Amzn-Trace-Id'] = trace_header
-                    logger.info(f"Fallback to Lambda env X-Ray trace: {trace_header}")
+            # Claim checks are resolved one record at a time, reading the object from S3 in chunks
+            pointer = None
+            if claim_checks.is_pointer(record):
+                pointer, message_body = message_body, claim_checks.load_json(message_body, body_codec)
             
             # Create span with Lambda identification and trace propagation
             if OTEL_AVAILABLE:
                 tracer = trace.get_tracer(__name__)
-                # Extract parent context if available
-                parent_context = None
-                if trace_context:
-                    try:
-                        parent_context = propagate.extract(trace_context)
-                        logger.info(f"Successfully extracted trace context: {list(trace_context.keys())}")
-                    except Exception as e:
-                        logger.warning(f"Failed to extract trace context: {e}")
-                        logger.info(f"Trace context content: {trace_context}")
-                else:
+                if parent_context is None:
                     logger.info("No trace context found in SQS message")
                 
-                # Determine the correct context for span creation
-                span_context = parent_context if parent_context else None
-                
                 with tracer.start_as_current_span(
                     "sqs_message_processing",
-                    context=span_context,
+                    context=parent_context,
                     kind=SpanKind.CONSUMER
                 ) as span:
                     span.set_attribute("lambda.function", "worker")
@@ -176,35 +192,79 @@ def handler(event, context):
                     span.set_attribute("messaging.system", "sqs")
                     span.set_attribute("messaging.operation", "process")
                     span.set_attribute("messaging.message_id", record.get('messageId', ''))
-                    span.set_attribute("faas.execution", context.aws_request_id)
-                    span.set_attribute("faas.id", context.function_name)
+                    if message_group(record) is not None:
+                        span.set_attribute("messaging.sqs.message_group_id", message_group(record))
+                    if context is not None:
+                        span.set_attribute("faas.execution", context.aws_request_id)
+                        span.set_attribute("faas.id", context.function_name)
                     # Mark this as a consumer span in the distributed trace
                     span.set_attribute("span.kind", "consumer")
                     
                     # Process the message
                     result = process_message_with_span(message_body, span)
+                    # Dwell, accept-to-complete and receive count, recorded with this span active
+                    record_queue_latency(record, message_body, span)
             else:
                 # Process without tracing
                 result = process_message(message_body)
+                record_queue_latency(record, message_body)
             
             logger.info(f"Message processed successfully: {result}")
+            processed_keys.append(idempotency_key)
+            if pointer is not None:
+                claimed.append(pointer)
+            scheduler.observe(message_type, (time.perf_counter() - started) * 1000)
+        
+        if any(message_group(record) is not None for record in records):
+            # FIFO queue: a failed or deferred record holds back only the rest of its own group
+            def process_fifo_record(i):
+                if duplicates[i]:
+                    logger.info(f"Skipping already processed message {records[i].get('messageId')} ({idempotency_keys[i]})")
+                    return True
+                message_type = scheduler.message_type(message_bodies[i], claim_check=claim_checks.is_pointer(records[i]))
+                if not scheduler.admit(message_type, deadline):
+                    return False
+                process_record(records[i], message_bodies[i], parent_contexts[i], idempotency_keys[i], message_type)
+                return True
+            
+            failed = process_groups(records, process_fifo_record, FIFO_GROUP_CONCURRENCY)
+            deferred = [record for i, record in enumerate(records) if i in failed]
+        else:
+            # Process each record in the SQS event
+            for record, message_body, parent_context, idempotency_key, duplicate in zip(
+                records, message_bodies, parent_contexts, idempotency_keys, duplicates
+            ):
+                if duplicate:
+                    logger.info(f"Skipping already processed message {record.get('messageId')} ({idempotency_key})")
+                    continue
+                
+                message_type = scheduler.message_type(message_body, claim_check=claim_checks.is_pointer(record))
+                if deferred or not scheduler.admit(message_type, deadline):
+                    # Not started: retried via batchItemFailures instead of timing out the whole batch
+                    deferred.append(record)
+                    continue
+                process_record(record, message_body, parent_context, idempotency_key, message_type)
         
-        # Force flush telemetry before Lambda freeze
-        force_flush_telemetry()
+        # Every record in claimed succeeded: their offloaded payloads are no longer needed
+        if claimed:
+            claim_checks.delete(claimed)
+        idempotency.mark_processed(processed_keys)
+        scheduler.record_deferred(len(deferred), len(records))
         
         return {
-            'batchItemFailures': []  # Return empty array to indicate all messages processed successfully
+            # Empty unless records were deferred for lack of time, or (FIFO) failed with the rest of their group
+            'batchItemFailures': [{'itemIdentifier': record['messageId']} for record in deferred]
         }
         
     except Exception as e:
         logger.error(f"Error processing SQS messages: {str(e)}")
         
-        # Force flush telemetry even on error
-        force_flush_telemetry()
+        # The whole batch is retried: make sure the records that did succeed are skipped then
+        idempotency.mark_processed(processed_keys)
         
         # Return the failed message for retry
         return {
-            'batchItemFailures': [{'itemIdentifier': record['messageId']} for record in event['Records']]
+            'batchItemFailures': [{'itemIdentifier': record['messageId']} for record in records]
         }
 
 def process_message_with_span(message_body, span):
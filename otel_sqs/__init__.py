@@ -0,0 +1,6 @@
+"""
+Shared helpers for the OpenTelemetry Lambda / SQS pipeline.
+
+This package lives at the repository root and is symlinked into both
+``lambda1/`` and ``lambda2/`` so each function archive ships the same code.
+"""
@@ -0,0 +1,221 @@
+"""
+Warm-container span accumulation.
+
+``force_flush_telemetry()`` runs at the end of every invocation, so with the
+``BatchSpanProcessor`` each request pays for its own OTLP POST carrying a handful
+of spans. ``AccumulatingSpanProcessor`` keeps finished spans in memory across
+warm invocations and exports them as one large batch once a count, size or age
+threshold is reached, or when the execution environment shuts down.
+
+The shutdown export relies on ``SIGTERM`` (``flush_on_shutdown``). Lambda only
+sends ``SIGTERM`` to the runtime when at least one external extension is
+registered, such as the collector layer or ``otlp_relay``. Without one, the
+environment is frozen and discarded silently, and spans still buffered below
+the thresholds are lost. Keep ``TELEMETRY_ACCUMULATE_MAX_AGE_SECONDS`` short in
+that case.
+
+Configuration (environment variables, used when ``TELEMETRY_EXPORT_MODE=accumulate``):
+
+- ``TELEMETRY_ACCUMULATE_MAX_SPANS``: export once this many spans are buffered (default 512)
+- ``TELEMETRY_ACCUMULATE_MAX_BYTES``: export once the buffer reaches this estimated size (default 1 MiB)
+- ``TELEMETRY_ACCUMULATE_MAX_AGE_SECONDS``: export once the oldest span is this old (default 60)
+- ``TELEMETRY_ACCUMULATE_MEMORY_CAP_BYTES``: hard cap, spans beyond it are dropped and counted (default 8 MiB)
+"""
+
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from typing import Callable, List, Optional
+
+from opentelemetry import metrics
+from opentelemetry.context import (
+    _SUPPRESS_INSTRUMENTATION_KEY,
+    attach,
+    detach,
+    set_value,
+)
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+logger = logging.getLogger(__name__)
+
+# Rough per-span overhead of the OTLP encoding (ids, timestamps, name, kind, status)
+_SPAN_BASE_BYTES = 160
+
+_meter = metrics.get_meter(__name__)
+_exported_counter = _meter.create_counter(
+    "telemetry.accumulator.spans_exported",
+    unit="{span}",
+    description="Spans exported by the warm-container accumulator",
+)
+_dropped_counter = _meter.create_counter(
+    "telemetry.accumulator.spans_dropped",
+    unit="{span}",
+    description="Spans lost by the warm-container accumulator, by reason",
+)
+
+
+def estimate_span_bytes(span: ReadableSpan) -> int:
+    """Cheap estimate of the encoded size of ``span`` used for the memory cap"""
+    size = _SPAN_BASE_BYTES + len(span.name)
+    for key, value in (span.attributes or {}).items():
+        size += len(key) + (len(value) if isinstance(value, str) else 8)
+    for event in span.events:
+        size += 32 + len(event.name)
+    return size
+
+
+class AccumulatingSpanProcessor(SpanProcessor):
+    """Buffers spans across invocations and exports them in large batches"""
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        max_spans: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_age_s: Optional[float] = None,
+        memory_cap_bytes: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._exporter = exporter
+        self.max_spans = max_spans or int(os.environ.get("TELEMETRY_ACCUMULATE_MAX_SPANS", "512"))
+        self.max_bytes = max_bytes or int(os.environ.get("TELEMETRY_ACCUMULATE_MAX_BYTES", str(1024 * 1024)))
+        self.max_age_s = max_age_s or float(os.environ.get("TELEMETRY_ACCUMULATE_MAX_AGE_SECONDS", "60"))
+        self.memory_cap_bytes = memory_cap_bytes or int(
+            os.environ.get("TELEMETRY_ACCUMULATE_MEMORY_CAP_BYTES", str(8 * 1024 * 1024))
+        )
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._spans: List[ReadableSpan] = []
+        self._bytes = 0
+        self._oldest = 0.0
+        self._shutdown = False
+
+        # Loss accounting, also exported as metrics
+        self.exported_spans = 0
+        self.dropped_spans = 0
+
+        # Size/count thresholds can trip mid-invocation; export those off the request path
+        self._wake = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="otel-span-accumulator", daemon=True)
+        self._worker.start()
+
+    @property
+    def buffered_spans(self) -> int:
+        return len(self._spans)
+
+    def on_start(self, span, parent_context=None) -> None:
+        pass
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if self._shutdown or not span.context.trace_flags.sampled:
+            return
+        size = estimate_span_bytes(span)
+        with self._lock:
+            if self._bytes + size > self.memory_cap_bytes:
+                self._drop(1, "memory_cap")
+                return
+            if not self._spans:
+                self._oldest = self._clock()
+            self._spans.append(span)
+            self._bytes += size
+            full = len(self._spans) >= self.max_spans or self._bytes >= self.max_bytes
+        if full:
+            self._wake.set()
+
+    def is_due(self) -> bool:
+        """True when any export threshold has been reached"""
+        with self._lock:
+            if not self._spans:
+                return False
+            return (
+                len(self._spans) >= self.max_spans
+                or self._bytes >= self.max_bytes
+                or self._clock() - self._oldest >= self.max_age_s
+            )
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        """Called at the end of every invocation: export only if a threshold is reached"""
+        if not self.is_due():
+            return True
+        return self.export_now()
+
+    def export_now(self) -> bool:
+        """Export everything buffered, regardless of thresholds"""
+        with self._export_lock:
+            with self._lock:
+                batch, self._spans, self._bytes = self._spans, [], 0
+            if not batch:
+                return True
+            token = attach(set_value(_SUPPRESS_INSTRUMENTATION_KEY, True))
+            try:
+                result = self._exporter.export(batch)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.warning(f"Accumulated span export raised: {e}")
+                result = SpanExportResult.FAILURE
+            finally:
+                detach(token)
+
+        if result == SpanExportResult.SUCCESS:
+            with self._lock:
+                self.exported_spans += len(batch)
+            _exported_counter.add(len(batch))
+            logger.info(f"Exported {len(batch)} accumulated spans")
+            return True
+        with self._lock:
+            self._drop(len(batch), "export_failed")
+        return False
+
+    def shutdown(self) -> None:
+        if self._shutdown:
+            return
+        self.export_now()
+        self._shutdown = True
+        self._wake.set()
+        self._exporter.shutdown()
+        logger.info(
+            f"Span accumulator shut down: exported={self.exported_spans}, dropped={self.dropped_spans}"
+        )
+
+    def _drop(self, count: int, reason: str):
+        # Caller holds self._lock
+        self.dropped_spans += count
+        _dropped_counter.add(count, {"reason": reason})
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._shutdown:
+                return
+            self.export_now()
+
+
+def flush_on_shutdown(*providers) -> bool:
+    """Export buffered telemetry when the execution environment shuts down
+
+    Lambda forwards the Extensions API ``SHUTDOWN`` event to the runtime process
+    as ``SIGTERM`` whenever an external extension (such as the collector layer)
+    is registered. Returns False if the handler could not be installed.
+    """
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def _handle_sigterm(signum, frame):
+        logger.info("SIGTERM received, flushing accumulated telemetry")
+        for provider in providers:
+            provider.shutdown()
+        if callable(previous):
+            previous(signum, frame)
+        elif previous == signal.SIG_DFL:
+            sys.exit(0)
+
+    try:
+        signal.signal(signal.SIGTERM, _handle_sigterm)
+    except ValueError:
+        # Not on the main thread (e.g. imported by a test runner worker)
+        return False
+    return True
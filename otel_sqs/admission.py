@@ -0,0 +1,183 @@
+"""
+Queue-depth admission control for the API handler.
+
+Without it, lambda1 enqueues every request however far behind the worker is,
+and a backlog turns into minutes of latency nobody sees at the API. The
+``AdmissionController`` reads ``ApproximateNumberOfMessages`` of the queue a
+request is routed to with ``GetQueueAttributes``. The value is cached per warm
+container for ``ADMISSION_REFRESH_SECONDS`` (``otel_sqs.queue_depth``), so only
+one request per interval pays for the call. When the backlog crosses the thresholds, the configured
+policy applies:
+
+- ``reject``: 429 with ``Retry-After`` from ``ADMISSION_MAX_DEPTH`` on
+- ``shed``: 429 with a probability rising linearly from 0 at
+  ``ADMISSION_SOFT_DEPTH`` to 1 at ``ADMISSION_MAX_DEPTH``
+- ``degrade``: from ``ADMISSION_MAX_DEPTH`` on, requests go to the
+  ``ADMISSION_DEGRADE_LANE`` priority lane (``otel_sqs.lanes``) instead; they
+  are rejected once that lane is full too
+
+If SQS cannot be asked, the last known depth is used, and without one the
+request is admitted: admission control must not take the API down.
+
+``ApproximateAgeOfOldestMessage`` is a CloudWatch metric, not a queue
+attribute, and is published once a minute. Depth is what ``GetQueueAttributes``
+returns in real time, so the thresholds are in messages.
+
+Every decision is counted in ``http.server.admission.decisions`` (``decision``,
+``lane``) and set as ``http.admission.*`` span attributes by the caller.
+
+Configuration (environment variables):
+
+- ``ADMISSION_CONTROL``: ``reject``, ``shed`` or ``degrade`` (unset: admit everything)
+- ``ADMISSION_MAX_DEPTH``: backlog at which the policy applies (default 10000)
+- ``ADMISSION_SOFT_DEPTH``: backlog at which ``shed`` starts (default half the maximum)
+- ``ADMISSION_DEGRADE_LANE``: lane that takes requests under ``degrade`` (default ``low``)
+- ``ADMISSION_RETRY_AFTER_SECONDS``: ``Retry-After`` of rejected requests (default 30)
+- ``ADMISSION_REFRESH_SECONDS``: how long a queue depth is cached (default 5)
+"""
+
+import logging
+import os
+import random
+import time
+import weakref
+from typing import Callable, Dict, NamedTuple, Optional
+
+from opentelemetry import metrics
+from opentelemetry.metrics import Observation
+
+from otel_sqs.lanes import PriorityRouter
+from otel_sqs.queue_depth import QueueDepthCache
+
+logger = logging.getLogger(__name__)
+
+_meter = metrics.get_meter(__name__)
+_decision_counter = _meter.create_counter(
+    "http.server.admission.decisions",
+    description="Admission decisions of the API handler by decision (admit, reject, shed, degrade) and lane",
+)
+
+ADMIT = "admit"
+REJECT = "reject"
+SHED = "shed"
+DEGRADE = "degrade"
+POLICIES = (REJECT, SHED, DEGRADE)
+
+
+class AdmissionDecision(NamedTuple):
+    action: str
+    lane: str
+    queue_url: str
+    queue_depth: Optional[int] = None
+    shed_probability: float = 0.0
+    retry_after_s: int = 0
+
+    @property
+    def admitted(self) -> bool:
+        return self.action in (ADMIT, DEGRADE)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        policy: Optional[str] = None,
+        max_depth: int = 10000,
+        soft_depth: Optional[int] = None,
+        degrade_lane: str = "low",
+        retry_after_s: int = 30,
+        refresh_s: float = 5.0,
+        router: Optional[PriorityRouter] = None,
+        sqs_client=None,
+        clock: Callable[[], float] = time.monotonic,
+        rng: Callable[[], float] = random.random,
+    ):
+        if policy is not None and policy not in POLICIES:
+            raise ValueError(f"Unknown admission policy {policy!r}, expected one of {', '.join(POLICIES)}")
+        self.policy = policy
+        self.max_depth = max_depth
+        self.soft_depth = max_depth // 2 if soft_depth is None else soft_depth
+        self.degrade_lane = degrade_lane
+        self.retry_after_s = retry_after_s
+        self.refresh_s = refresh_s
+        self.router = router
+        self._rng = rng
+        self._depths = QueueDepthCache(sqs_client, refresh_s, clock)
+        _controllers.add(self)
+
+    @classmethod
+    def from_env(cls, router: Optional[PriorityRouter] = None, sqs_client=None) -> "AdmissionController":
+        max_depth = int(os.environ.get("ADMISSION_MAX_DEPTH", "10000"))
+        soft_depth = os.environ.get("ADMISSION_SOFT_DEPTH")
+        return cls(
+            policy=os.environ.get("ADMISSION_CONTROL") or None,
+            max_depth=max_depth,
+            soft_depth=int(soft_depth) if soft_depth else None,
+            degrade_lane=os.environ.get("ADMISSION_DEGRADE_LANE", "low"),
+            retry_after_s=int(os.environ.get("ADMISSION_RETRY_AFTER_SECONDS", "30")),
+            refresh_s=float(os.environ.get("ADMISSION_REFRESH_SECONDS", "5")),
+            router=router,
+            sqs_client=sqs_client,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.policy is not None
+
+    def queue_depth(self, queue_url: str) -> Optional[int]:
+        """Cached ApproximateNumberOfMessages; the last known value (or None) if SQS cannot be asked"""
+        return self._depths.get(queue_url)
+
+    def decide(self, lane: str, queue_url: str) -> AdmissionDecision:
+        """Admit, degrade or refuse a request routed to ``lane``/``queue_url``"""
+        if not self.enabled:
+            return AdmissionDecision(ADMIT, lane, queue_url)
+        depth = self.queue_depth(queue_url)
+        decision = self._apply(lane, queue_url, depth)
+        _decision_counter.add(1, {"decision": decision.action, "lane": decision.lane})
+        return decision
+
+    def _apply(self, lane: str, queue_url: str, depth: Optional[int]) -> AdmissionDecision:
+        if depth is None:
+            return AdmissionDecision(ADMIT, lane, queue_url)
+        if self.policy == SHED:
+            probability = self.shed_probability(depth)
+            if probability > 0 and self._rng() < probability:
+                return AdmissionDecision(SHED, lane, queue_url, depth, probability, self.retry_after_s)
+            return AdmissionDecision(ADMIT, lane, queue_url, depth, probability)
+        if depth < self.max_depth:
+            return AdmissionDecision(ADMIT, lane, queue_url, depth)
+        if self.policy == DEGRADE and lane != self.degrade_lane and self.router is not None:
+            degrade_url = self.router.queue_urls.get(self.degrade_lane)
+            if degrade_url:
+                degrade_depth = self.queue_depth(degrade_url)
+                if degrade_depth is None or degrade_depth < self.max_depth:
+                    return AdmissionDecision(DEGRADE, self.degrade_lane, degrade_url, degrade_depth)
+        return AdmissionDecision(REJECT, lane, queue_url, depth, retry_after_s=self.retry_after_s)
+
+    def shed_probability(self, depth: int) -> float:
+        if depth >= self.max_depth:
+            return 1.0
+        if depth <= self.soft_depth:
+            return 0.0
+        return (depth - self.soft_depth) / (self.max_depth - self.soft_depth)
+
+    def cached_depths(self) -> Dict[str, int]:
+        return self._depths.cached()
+
+
+# Controllers whose cached depths the gauge reports
+_controllers: "weakref.WeakSet[AdmissionController]" = weakref.WeakSet()
+
+
+def _observe_depth(options):
+    for controller in list(_controllers):
+        for queue_url, depth in controller.cached_depths().items():
+            yield Observation(depth, {"messaging.destination.name": queue_url.rsplit("/", 1)[-1]})
+
+
+_meter.create_observable_gauge(
+    "http.server.admission.queue_depth",
+    callbacks=[_observe_depth],
+    unit="{message}",
+    description="Queue depth the API handler last based admission decisions on",
+)
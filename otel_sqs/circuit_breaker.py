@@ -0,0 +1,263 @@
+"""
+Circuit breaker for the OTLP span, metric and log exporters.
+
+When the telemetry endpoint is down every invocation would otherwise wait for
+the exporter timeout (plus retry sleeps) inside ``force_flush``. The wrappers in
+this module track failures and latency per endpoint and, once the circuit is
+open, skip (or spool) batches immediately. A single background probe tries the
+endpoint again after ``reset_timeout_s`` and closes the circuit on success.
+
+Configuration (environment variables):
+
+- ``TELEMETRY_CIRCUIT_FAILURE_THRESHOLD``: consecutive failures before opening (default 3)
+- ``TELEMETRY_CIRCUIT_RESET_SECONDS``: time the circuit stays open before probing (default 30)
+- ``TELEMETRY_CIRCUIT_SLOW_CALL_MS``: exports slower than this count as failures (default 2000)
+- ``TELEMETRY_CIRCUIT_SPOOL_BATCHES``: batches kept while open, 0 drops them (default 0)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+from opentelemetry import metrics
+from opentelemetry.context import (
+    _SUPPRESS_INSTRUMENTATION_KEY,
+    attach,
+    detach,
+    set_value,
+)
+from opentelemetry.metrics import Observation
+from opentelemetry.sdk._logs.export import LogExporter, LogExportResult
+from opentelemetry.sdk.metrics.export import MetricExporter, MetricExportResult
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Numeric encoding used for the state gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Failure and latency tracking for a single telemetry endpoint"""
+
+    def __init__(
+        self,
+        endpoint: str,
+        failure_threshold: int = 3,
+        reset_timeout_s: float = 30.0,
+        slow_call_ms: float = 2000.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.slow_call_ms = slow_call_ms
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.latency_ms = 0.0  # EWMA of export latency
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        """Return True if exports may be sent to the endpoint right now"""
+        return self.state == CLOSED
+
+    def try_begin_probe(self) -> bool:
+        """Move an expired OPEN circuit to HALF_OPEN; True if the caller owns the probe"""
+        with self._lock:
+            if self.state != OPEN or self._clock() - self._opened_at < self.reset_timeout_s:
+                return False
+            self._transition(HALF_OPEN)
+            return True
+
+    def record(self, success: bool, latency_ms: float):
+        """Record the outcome of an export call"""
+        with self._lock:
+            self.latency_ms = latency_ms if self.latency_ms == 0.0 else 0.8 * self.latency_ms + 0.2 * latency_ms
+            if success and latency_ms < self.slow_call_ms:
+                self.consecutive_failures = 0
+                if self.state != CLOSED:
+                    self._transition(CLOSED)
+                return
+
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+                if self.state != OPEN:
+                    self._transition(OPEN)
+
+    def _transition(self, state: str):
+        previous, self.state = self.state, state
+        log = logger.info if state == CLOSED else logger.warning
+        log(
+            f"Telemetry circuit {previous} -> {state} for {self.endpoint} "
+            f"(failures={self.consecutive_failures}, latency_ms={self.latency_ms:.1f})",
+            extra={"circuit.endpoint": self.endpoint, "circuit.state": state},
+        )
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    """Return the shared breaker for the host behind ``endpoint``
+
+    Traces, metrics and logs usually go to the same collector, so breakers are
+    keyed by ``scheme://host:port``: one signal failing opens the circuit for all.
+    """
+    parts = urlsplit(endpoint)
+    key = f"{parts.scheme}://{parts.netloc}" if parts.netloc else endpoint
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                key,
+                failure_threshold=int(os.environ.get("TELEMETRY_CIRCUIT_FAILURE_THRESHOLD", "3")),
+                reset_timeout_s=float(os.environ.get("TELEMETRY_CIRCUIT_RESET_SECONDS", "30")),
+                slow_call_ms=float(os.environ.get("TELEMETRY_CIRCUIT_SLOW_CALL_MS", "2000")),
+            )
+            _breakers[key] = breaker
+        return breaker
+
+
+def _observe_state(options):
+    for breaker in list(_breakers.values()):
+        yield Observation(STATE_VALUES[breaker.state], {"endpoint": breaker.endpoint})
+
+
+_meter = metrics.get_meter(__name__)
+_meter.create_observable_gauge(
+    "telemetry.exporter.circuit.state",
+    callbacks=[_observe_state],
+    description="Exporter circuit state per endpoint (0=closed, 1=half_open, 2=open)",
+)
+_skipped_counter = _meter.create_counter(
+    "telemetry.exporter.circuit.skipped",
+    unit="{batch}",
+    description="Export batches skipped or spooled while the circuit was not closed",
+)
+
+
+class _CircuitGuard:
+    """Shared export logic for the signal-specific wrappers below"""
+
+    def __init__(self, signal: str, endpoint: str, spool_batches: Optional[int] = None):
+        if spool_batches is None:
+            spool_batches = int(os.environ.get("TELEMETRY_CIRCUIT_SPOOL_BATCHES", "0"))
+        self.signal = signal
+        self.breaker = get_breaker(endpoint)
+        self._spool = deque(maxlen=spool_batches) if spool_batches > 0 else None
+        self._attributes = {"endpoint": self.breaker.endpoint, "signal": signal}
+
+    def export(self, batch, send: Callable, succeeded: Callable) -> bool:
+        """Send ``batch`` through ``send`` unless the circuit is open"""
+        if self.breaker.allow():
+            return self._call(batch, send, succeeded)
+
+        if self._spool is not None:
+            self._spool.append(batch)
+        _skipped_counter.add(1, self._attributes)
+
+        if self.breaker.try_begin_probe():
+            probe = self._spool.popleft() if self._spool else batch
+            threading.Thread(
+                target=self._probe,
+                args=(probe, send, succeeded),
+                name=f"otel-circuit-probe-{self.signal}",
+                daemon=True,
+            ).start()
+        return False
+
+    def _call(self, batch, send: Callable, succeeded: Callable) -> bool:
+        start = time.perf_counter()
+        try:
+            ok = succeeded(send(batch))
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning(f"Telemetry {self.signal} export raised: {e}")
+            ok = False
+        self.breaker.record(ok, (time.perf_counter() - start) * 1000.0)
+        return ok
+
+    def _probe(self, batch, send: Callable, succeeded: Callable):
+        token = attach(set_value(_SUPPRESS_INSTRUMENTATION_KEY, True))
+        try:
+            if not self._call(batch, send, succeeded):
+                return
+            # Circuit closed again - replay whatever was spooled while it was open
+            while self._spool and self.breaker.allow():
+                self._call(self._spool.popleft(), send, succeeded)
+        finally:
+            detach(token)
+
+
+class CircuitBreakerSpanExporter(SpanExporter):
+    """SpanExporter wrapper that fails fast while the endpoint is unhealthy"""
+
+    def __init__(self, exporter: SpanExporter, endpoint: str, spool_batches: Optional[int] = None):
+        self._exporter = exporter
+        self._guard = _CircuitGuard("traces", endpoint, spool_batches)
+
+    def export(self, spans) -> SpanExportResult:
+        ok = self._guard.export(
+            list(spans), self._exporter.export, lambda result: result == SpanExportResult.SUCCESS
+        )
+        return SpanExportResult.SUCCESS if ok else SpanExportResult.FAILURE
+
+    def shutdown(self):
+        self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._exporter.force_flush(timeout_millis)
+
+
+class CircuitBreakerMetricExporter(MetricExporter):
+    """MetricExporter wrapper that fails fast while the endpoint is unhealthy"""
+
+    def __init__(self, exporter: MetricExporter, endpoint: str, spool_batches: Optional[int] = None):
+        super().__init__(
+            preferred_temporality=exporter._preferred_temporality,
+            preferred_aggregation=exporter._preferred_aggregation,
+        )
+        self._exporter = exporter
+        self._guard = _CircuitGuard("metrics", endpoint, spool_batches)
+
+    def export(self, metrics_data, timeout_millis: float = 10_000, **kwargs) -> MetricExportResult:
+        ok = self._guard.export(
+            metrics_data,
+            lambda data: self._exporter.export(data, timeout_millis=timeout_millis, **kwargs),
+            lambda result: result == MetricExportResult.SUCCESS,
+        )
+        return MetricExportResult.SUCCESS if ok else MetricExportResult.FAILURE
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return self._exporter.force_flush(timeout_millis=timeout_millis)
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs) -> None:
+        self._exporter.shutdown(timeout_millis=timeout_millis, **kwargs)
+
+
+class CircuitBreakerLogExporter(LogExporter):
+    """LogExporter wrapper that fails fast while the endpoint is unhealthy"""
+
+    def __init__(self, exporter: LogExporter, endpoint: str, spool_batches: Optional[int] = None):
+        self._exporter = exporter
+        self._guard = _CircuitGuard("logs", endpoint, spool_batches)
+
+    def export(self, batch) -> LogExportResult:
+        ok = self._guard.export(
+            list(batch), self._exporter.export, lambda result: result == LogExportResult.SUCCESS
+        )
+        return LogExportResult.SUCCESS if ok else LogExportResult.FAILURE
+
+    def shutdown(self):
+        self._exporter.shutdown()
@@ -0,0 +1,163 @@
+"""
+Claim-check offload of oversized SQS payloads to S3.
+
+SQS rejects messages above 256 KB. When a body (after ``otel_sqs.codec``
+compression) plus its attributes would exceed ``threshold``, the producer
+uploads the body to S3 with an ``s3transfer`` ``TransferManager``. Large
+bodies go up as a concurrent multipart upload. The producer then sends a small
+pointer message instead::
+
+    {"s3ClaimCheck": {"bucket": "...", "key": "...", "size": 1234567, "contentEncoding": "zlib+base64"}}
+
+The pointer carries a ``claim-check`` message attribute. It is an ordinary SQS
+message, so ``SQSInstrumentor`` injects the trace context into it as usual. The
+worker resolves pointers one record at a time and reads the object through the
+codec in chunks instead of downloading the encoded body whole. The processing
+step needs the parsed dict, so ``load_json`` still holds the decoded payload in
+memory: it collects the chunks into one ``bytearray`` (no second joined copy)
+and parses that. ``stream`` yields the decoded chunks for callers that can
+consume them incrementally. The worker deletes the objects once the batch
+succeeded. Objects of failed batches stay in place for the retry. A bucket
+lifecycle rule removes anything left behind.
+
+Configuration (environment variables):
+
+- ``CLAIM_CHECK_BUCKET``: bucket for offloaded payloads; the producer only offloads when set
+- ``CLAIM_CHECK_THRESHOLD``: offload messages of at least this many bytes (default 240 KiB)
+- ``CLAIM_CHECK_PREFIX``: object key prefix (default ``claim-check/``)
+"""
+
+import io
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+from s3transfer.manager import TransferConfig, TransferManager
+
+from otel_sqs.clients import create_client
+from otel_sqs.codec import CONTENT_ENCODING_ATTRIBUTE, BodyCodec
+
+logger = logging.getLogger(__name__)
+
+CLAIM_CHECK_ATTRIBUTE = "claim-check"
+POINTER_KEY = "s3ClaimCheck"
+
+MiB = 1024 * 1024
+
+
+def _attributes_size(message_attributes: Mapping[str, Any]) -> int:
+    # SQS counts name, data type and value of every attribute against the 256 KB limit
+    size = 0
+    for name, attribute in message_attributes.items():
+        size += len(name) + len(attribute.get("DataType", ""))
+        size += len(attribute.get("StringValue", "")) + len(attribute.get("BinaryValue", b""))
+    return size
+
+
+class ClaimCheckStore:
+    def __init__(
+        self,
+        bucket: Optional[str] = None,
+        s3_client=None,
+        threshold: int = 240 * 1024,
+        prefix: str = "claim-check/",
+        transfer_config: Optional[TransferConfig] = None,
+        chunk_size: int = MiB,
+    ):
+        self.bucket = bucket
+        self.threshold = threshold
+        self.prefix = prefix
+        self.chunk_size = chunk_size
+        self._client = s3_client
+        self._transfer_config = transfer_config or TransferConfig(
+            multipart_threshold=8 * MiB, multipart_chunksize=8 * MiB, max_request_concurrency=10
+        )
+        self._transfer_manager: Optional[TransferManager] = None
+
+    @classmethod
+    def from_env(cls, s3_client=None) -> "ClaimCheckStore":
+        return cls(
+            bucket=os.environ.get("CLAIM_CHECK_BUCKET") or None,
+            s3_client=s3_client,
+            threshold=int(os.environ.get("CLAIM_CHECK_THRESHOLD", str(240 * 1024))),
+            prefix=os.environ.get("CLAIM_CHECK_PREFIX", "claim-check/"),
+        )
+
+    @property
+    def client(self):
+        # Created on first use: most invocations never touch S3
+        if self._client is None:
+            self._client = create_client("s3", max_pool_connections=self._transfer_config.max_request_concurrency)
+        return self._client
+
+    def offload(self, body: str, message_attributes: Dict[str, Any]) -> str:
+        """Body to send: unchanged if it fits into SQS, otherwise a pointer to the uploaded body"""
+        raw = body.encode("utf-8")
+        if not self.bucket or len(raw) + _attributes_size(message_attributes) < self.threshold:
+            return body
+
+        if self._transfer_manager is None:
+            self._transfer_manager = TransferManager(self.client, self._transfer_config)
+        key = f"{self.prefix}{uuid.uuid4()}"
+        start = time.perf_counter()
+        self._transfer_manager.upload(
+            io.BytesIO(raw), self.bucket, key, extra_args={"ContentType": "text/plain; charset=utf-8"}
+        ).result()
+        logger.info(f"Offloaded {len(raw)} byte message body to s3://{self.bucket}/{key} in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+        pointer = {"bucket": self.bucket, "key": key, "size": len(raw)}
+        # The content-encoding now describes the object, not the (plain JSON) pointer body
+        encoding = message_attributes.pop(CONTENT_ENCODING_ATTRIBUTE, None)
+        if encoding:
+            pointer["contentEncoding"] = encoding["StringValue"]
+        message_attributes[CLAIM_CHECK_ATTRIBUTE] = {"StringValue": "s3", "DataType": "String"}
+        return json.dumps({POINTER_KEY: pointer})
+
+    @staticmethod
+    def is_pointer(record: Mapping[str, Any]) -> bool:
+        """Whether a Lambda SQS event record or ReceiveMessage message is a claim check"""
+        message_attributes = record.get("messageAttributes") or record.get("MessageAttributes") or {}
+        return CLAIM_CHECK_ATTRIBUTE in message_attributes
+
+    def stream(self, pointer_body: Mapping[str, Any], codec: BodyCodec) -> Iterator[bytes]:
+        """Decoded payload bytes of a pointer, streamed from S3 in ``chunk_size`` pieces"""
+        pointer = pointer_body[POINTER_KEY]
+        response = self.client.get_object(Bucket=pointer["bucket"], Key=pointer["key"])
+        return codec.decode_chunks(response["Body"].iter_chunks(self.chunk_size), pointer.get("contentEncoding"))
+
+    def load_json(self, pointer_body: Mapping[str, Any], codec: BodyCodec) -> Any:
+        """Parsed payload of a pointer; the decoded bytes are collected in place rather than joined"""
+        start = time.perf_counter()
+        decoded = bytearray()
+        for chunk in self.stream(pointer_body, codec):
+            decoded += chunk
+        payload = json.loads(decoded)
+        pointer = pointer_body[POINTER_KEY]
+        logger.info(f"Resolved claim check s3://{pointer['bucket']}/{pointer['key']} in {(time.perf_counter() - start) * 1000:.1f}ms")
+        return payload
+
+    def delete(self, pointer_bodies: List[Mapping[str, Any]]):
+        """Delete the objects behind processed pointers (DeleteObjects, 1000 keys per call); best effort, never raises"""
+        keys_by_bucket: Dict[str, List[str]] = {}
+        for pointer_body in pointer_bodies:
+            pointer = pointer_body[POINTER_KEY]
+            keys_by_bucket.setdefault(pointer["bucket"], []).append(pointer["key"])
+        for bucket, keys in keys_by_bucket.items():
+            for i in range(0, len(keys), 1000):
+                try:
+                    response = self.client.delete_objects(
+                        Bucket=bucket, Delete={"Objects": [{"Key": key} for key in keys[i:i + 1000]], "Quiet": True}
+                    )
+                except Exception as e:
+                    # The records are processed; failing them now would redeliver them as duplicates
+                    logger.warning(f"Failed to delete {len(keys[i:i + 1000])} claim check(s) in s3://{bucket}, left for the lifecycle rule: {e}")
+                    continue
+                for error in response.get("Errors", []):
+                    # Left for the bucket lifecycle rule
+                    logger.warning(f"Failed to delete claim check s3://{bucket}/{error.get('Key')}: {error.get('Code')}")
+
+
+claim_checks = ClaimCheckStore.from_env()
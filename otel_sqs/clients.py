@@ -0,0 +1,220 @@
+"""
+Pooled, connection-primed AWS clients.
+
+``boto3.client(...)`` with the default ``Config`` keeps 10 pooled connections,
+uses the legacy retry mode, sets no TCP keepalive and waits 60s both to connect
+and to read. A fresh container also pays DNS, TCP and TLS to the endpoint inside
+its first request. ``create_client`` builds clients with a tuned ``Config``:
+
+- ``max_pool_connections`` sized by the caller to its concurrency, e.g. the
+  standalone consumer's pollers and workers
+- ``standard`` (or ``adaptive``) retries, which back off with jitter and budget
+  retries instead of the legacy mode's fixed schedule
+- TCP keepalive, so NAT gateways and load balancers do not silently drop idle
+  pooled connections between warm invocations
+- connect and read timeouts in seconds, not a minute
+- SigV4 signing with cached signing keys and header lines (``otel_sqs.signing``)
+
+``prime`` opens pooled connections to the client's endpoint ahead of time.
+lambda1 calls it during init, so the first request finds a warm TLS connection.
+Priming is best effort: a failure is logged and the connection is opened on
+first use as usual.
+
+Priming and the pool statistics below reach into private botocore and urllib3
+internals, while the Lambda runtime supplies its own boto3. Both are guarded:
+if those internals change, priming is skipped and the client reports no pool
+statistics instead of failing init or the metric callbacks.
+
+Pool reuse is exported per service as observable counters, from the urllib3 pool
+statistics of botocore's ``URLLib3Session``:
+
+- ``aws.client.connection_pool.hits``: requests sent on an already open pooled connection
+- ``aws.client.connection_pool.misses``: requests that had to open a new connection
+
+A pooled connection that the server closed while idle is reopened in place and
+counts as a hit. TCP keepalive keeps those rare.
+
+Configuration (environment variables):
+
+- ``AWS_CLIENT_MAX_POOL_CONNECTIONS``: pooled connections per client unless the caller sizes it (default 10)
+- ``AWS_CLIENT_RETRY_MODE``: ``standard`` or ``adaptive`` (default ``standard``)
+- ``AWS_CLIENT_MAX_ATTEMPTS``: attempts per call, retries included (default 3)
+- ``AWS_CLIENT_CONNECT_TIMEOUT_SECONDS``: default 2
+- ``AWS_CLIENT_READ_TIMEOUT_SECONDS``: default 10, unless the caller needs longer (long polling)
+- ``AWS_CLIENT_TCP_KEEPALIVE``: default ``true``
+- ``AWS_CLIENT_PRIME_CONNECTIONS``: connections lambda1 opens to SQS during init (default 1)
+- ``AWS_CLIENT_SIGNING_CACHE``: sign with cached SigV4 keys (``otel_sqs.signing``, default ``true``)
+"""
+
+import logging
+import os
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from opentelemetry import metrics
+from opentelemetry.metrics import Observation
+
+logger = logging.getLogger(__name__)
+
+_meter = metrics.get_meter(__name__)
+
+
+def client_config(max_pool_connections: Optional[int] = None, read_timeout_s: Optional[float] = None):
+    """botocore ``Config`` from the AWS_CLIENT_* settings"""
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=max_pool_connections or int(os.environ.get("AWS_CLIENT_MAX_POOL_CONNECTIONS", "10")),
+        retries={
+            "mode": os.environ.get("AWS_CLIENT_RETRY_MODE", "standard"),
+            "max_attempts": int(os.environ.get("AWS_CLIENT_MAX_ATTEMPTS", "3")),
+        },
+        connect_timeout=float(os.environ.get("AWS_CLIENT_CONNECT_TIMEOUT_SECONDS", "2")),
+        read_timeout=read_timeout_s or float(os.environ.get("AWS_CLIENT_READ_TIMEOUT_SECONDS", "10")),
+        tcp_keepalive=os.environ.get("AWS_CLIENT_TCP_KEEPALIVE", "true").lower() == "true",
+    )
+
+
+def create_client(
+    service: str,
+    max_pool_connections: Optional[int] = None,
+    read_timeout_s: Optional[float] = None,
+    prime_connections: int = 0,
+    **client_kwargs,
+):
+    """boto3 client with the tuned ``Config``, optionally with ``prime_connections`` opened up front"""
+    import boto3
+
+    client = boto3.client(service, config=client_config(max_pool_connections, read_timeout_s), **client_kwargs)
+    _clients.add(client)
+    if os.environ.get("AWS_CLIENT_SIGNING_CACHE", "true").lower() == "true":
+        from otel_sqs.signing import enable_signing_cache
+
+        enable_signing_cache(client)
+    if prime_connections > 0:
+        prime(client, prime_connections)
+    return client
+
+
+def _pool(client):
+    """urllib3 connection pool for the client's endpoint, or None behind a proxy"""
+    url = client.meta.endpoint_url
+    session = client._endpoint.http_session
+    if session._proxy_config.proxy_url_for(url):
+        return None
+    pool = session._manager.connection_from_url(url)
+    # What URLLib3Session.send does before every request
+    session._setup_ssl_cert(pool, url, session._verify)
+    return pool
+
+
+def _connect(connection) -> bool:
+    try:
+        connection.connect()
+        return True
+    except Exception as e:
+        logger.warning(f"Could not prime connection to {connection.host}: {e}")
+        connection.close()
+        return False
+
+
+def prime(client, connections: int = 1) -> int:
+    """Open up to ``connections`` pooled connections to the client's endpoint; returns how many were opened"""
+    start = time.perf_counter()
+    try:
+        opened = _prime(client, connections)
+    except Exception as e:
+        # Private botocore/urllib3 internals: a different runtime version must not break init
+        logger.warning(f"Could not prime connections to {client.meta.endpoint_url}: {e}")
+        return 0
+    if opened:
+        logger.info(f"Primed {opened} connection(s) to {client.meta.endpoint_url} in {(time.perf_counter() - start) * 1000:.0f}ms")
+    return opened
+
+
+def _prime(client, connections: int) -> int:
+    pool = _pool(client)
+    if pool is None:
+        return 0
+    # Taken out all at once, so each one is a separate connection
+    taken = []
+    try:
+        for _ in range(min(connections, pool.pool.maxsize)):
+            taken.append(pool._get_conn())
+        if len(taken) == 1:
+            opened = [_connect(taken[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(taken), thread_name_prefix="prime") as executor:
+                opened = list(executor.map(_connect, taken))
+    finally:
+        for connection in taken:
+            pool._put_conn(connection)
+    # A connection whose priming failed is opened by its first request: that one is a miss
+    _primed[pool] = _primed.get(pool, 0) + sum(opened)
+    return sum(opened)
+
+
+def pool_stats(client) -> Optional[Tuple[int, int]]:
+    """(hits, misses) over the client's connection pools; None if the pools cannot be inspected"""
+    try:
+        return _pool_stats(client)
+    except Exception as e:
+        logger.debug(f"No connection pool statistics for {client.meta.endpoint_url}: {e}")
+        return None
+
+
+def _pool_stats(client) -> Tuple[int, int]:
+    manager = client._endpoint.http_session._manager
+    hits = misses = 0
+    for key in manager.pools.keys():
+        pool = manager.pools.get(key)
+        if pool is None:
+            continue
+        # Connections opened by prime() were not opened for a request
+        opened = max(0, pool.num_connections - _primed.get(pool, 0))
+        misses += opened
+        hits += max(0, pool.num_requests - opened)
+    return hits, misses
+
+
+_clients: "weakref.WeakSet" = weakref.WeakSet()
+_primed: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _stats_by_service() -> Dict[str, Tuple[int, int]]:
+    stats: Dict[str, Tuple[int, int]] = {}
+    for client in list(_clients):
+        client_stats = pool_stats(client)
+        if client_stats is None:
+            continue
+        hits, misses = client_stats
+        service = client.meta.service_model.endpoint_prefix
+        previous_hits, previous_misses = stats.get(service, (0, 0))
+        stats[service] = (previous_hits + hits, previous_misses + misses)
+    return stats
+
+
+def _observe_hits(options):
+    for service, (hits, _) in _stats_by_service().items():
+        yield Observation(hits, {"service": service})
+
+
+def _observe_misses(options):
+    for service, (_, misses) in _stats_by_service().items():
+        yield Observation(misses, {"service": service})
+
+
+_meter.create_observable_counter(
+    "aws.client.connection_pool.hits",
+    callbacks=[_observe_hits],
+    unit="{request}",
+    description="AWS API requests sent on an already open pooled connection",
+)
+_meter.create_observable_counter(
+    "aws.client.connection_pool.misses",
+    callbacks=[_observe_misses],
+    unit="{request}",
+    description="AWS API requests that had to open a new connection",
+)
@@ -0,0 +1,137 @@
+"""
+Transparent SQS message body compression.
+
+SQS bills every 64 KB chunk of a message and rejects messages above 256 KB.
+``BodyCodec`` compresses bodies above a size threshold with zlib (optionally
+primed with a preset dictionary), base64-encodes them so they stay valid SQS
+text, and marks them with a ``content-encoding`` message attribute. Bodies
+without the attribute are passed through unchanged, so producers and consumers
+can be switched over independently as long as consumers go first.
+
+Encodings:
+
+- ``zlib+base64``: zlib stream, base64
+- ``zlib+base64;dict=<id>``: zlib stream primed with the dictionary whose
+  SHA-256 starts with ``<id>``; the consumer must be configured with the same
+  dictionary
+
+Configuration (environment variables, shared by producer and consumer):
+
+- ``SQS_BODY_COMPRESSION_THRESHOLD``: compress bodies of at least this many bytes (default 1024, 0 disables)
+- ``SQS_BODY_COMPRESSION_LEVEL``: zlib level (default 6)
+- ``SQS_BODY_COMPRESSION_DICTIONARY``: path of a preset dictionary file (optional)
+"""
+
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import zlib
+from typing import Any, Dict, Iterable, Iterator, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_ENCODING_ATTRIBUTE = "content-encoding"
+ZLIB_BASE64 = "zlib+base64"
+
+
+class BodyCodec:
+    def __init__(self, threshold: int = 1024, level: int = 6, dictionary: Optional[bytes] = None):
+        self.threshold = threshold
+        self.level = level
+        self.dictionary = dictionary
+        self.dictionary_id = hashlib.sha256(dictionary).hexdigest()[:8] if dictionary else None
+        self.encoding = f"{ZLIB_BASE64};dict={self.dictionary_id}" if dictionary else ZLIB_BASE64
+        # Priming a compressor with a dictionary is not free; copy() reuses the primed state
+        if dictionary:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS, zdict=dictionary)
+        else:
+            self._compressor = zlib.compressobj(level)
+
+    @classmethod
+    def from_env(cls) -> "BodyCodec":
+        dictionary = None
+        dictionary_path = os.environ.get("SQS_BODY_COMPRESSION_DICTIONARY")
+        if dictionary_path:
+            with open(dictionary_path, "rb") as f:
+                dictionary = f.read()
+        return cls(
+            threshold=int(os.environ.get("SQS_BODY_COMPRESSION_THRESHOLD", "1024")),
+            level=int(os.environ.get("SQS_BODY_COMPRESSION_LEVEL", "6")),
+            dictionary=dictionary,
+        )
+
+    def encode(self, body: str) -> Tuple[str, Optional[str]]:
+        """Body to send and its content-encoding (None if sent as is)"""
+        raw = body.encode("utf-8")
+        if not self.threshold or len(raw) < self.threshold:
+            return body, None
+        compressor = self._compressor.copy()
+        encoded = base64.b64encode(compressor.compress(raw) + compressor.flush()).decode("ascii")
+        # base64 adds a third; incompressible bodies are cheaper to send raw
+        if len(encoded) >= len(raw):
+            return body, None
+        return encoded, self.encoding
+
+    def encode_message(self, body: str, message_attributes: Dict[str, Any]) -> str:
+        """Encode a body for SendMessage, adding the content-encoding attribute when compressed"""
+        encoded, encoding = self.encode(body)
+        if encoding is not None:
+            message_attributes[CONTENT_ENCODING_ATTRIBUTE] = {"StringValue": encoding, "DataType": "String"}
+        return encoded
+
+    def decode(self, body: str, encoding: Optional[str]) -> str:
+        """Original body; raises ValueError for unknown encodings or a mismatched dictionary"""
+        if not encoding:
+            return body
+        decompressor = self._decompressor(encoding)
+        try:
+            data = base64.b64decode(body, validate=True)
+            return (decompressor.decompress(data) + decompressor.flush()).decode("utf-8")
+        except (binascii.Error, zlib.error) as e:
+            raise ValueError(f"Corrupt {encoding} message body: {e}") from e
+
+    def decode_chunks(self, chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+        """Incrementally decode an encoded body read in chunks (e.g. a streamed S3 object)"""
+        if not encoding:
+            yield from chunks
+            return
+        decompressor = self._decompressor(encoding)
+        pending = b""
+        try:
+            for chunk in chunks:
+                pending += chunk
+                # base64 decodes in 4-character groups; carry the remainder to the next chunk
+                usable = len(pending) - len(pending) % 4
+                if usable:
+                    yield decompressor.decompress(base64.b64decode(pending[:usable], validate=True))
+                    pending = pending[usable:]
+            if pending:
+                yield decompressor.decompress(base64.b64decode(pending, validate=True))
+            yield decompressor.flush()
+        except (binascii.Error, zlib.error) as e:
+            raise ValueError(f"Corrupt {encoding} message body: {e}") from e
+
+    def _decompressor(self, encoding: str):
+        scheme, _, parameter = encoding.partition(";")
+        if scheme != ZLIB_BASE64:
+            raise ValueError(f"Unsupported message content-encoding: {encoding}")
+        if not parameter:
+            return zlib.decompressobj()
+        dictionary_id = parameter.partition("=")[2]
+        if dictionary_id != self.dictionary_id:
+            raise ValueError(f"Message was compressed with dictionary {dictionary_id}, consumer has {self.dictionary_id}")
+        return zlib.decompressobj(zdict=self.dictionary)
+
+    def decode_record(self, record: Mapping[str, Any]) -> str:
+        """Body of a Lambda SQS event record or a ReceiveMessage message"""
+        if "body" in record:
+            body, message_attributes = record["body"], record.get("messageAttributes") or {}
+        else:
+            body, message_attributes = record["Body"], record.get("MessageAttributes") or {}
+        attribute = message_attributes.get(CONTENT_ENCODING_ATTRIBUTE) or {}
+        return self.decode(body, attribute.get("stringValue", attribute.get("StringValue")))
+
+
+body_codec = BodyCodec.from_env()
@@ -0,0 +1,172 @@
+"""
+Streaming gzip stage for the OTLP/HTTP trace, metric and log exporters.
+
+The stock exporters serialize the whole request, write it through
+``gzip.GzipFile`` into a ``BytesIO`` and copy it out again with ``getvalue()``;
+every retry compresses the payload once more. The exporters below instead feed
+the request to a ``zlib`` compressor one ``Resource*`` message at a time, so the
+full uncompressed payload is never materialized, and compress once per batch
+no matter how many retries follow.
+
+Configuration (environment variables):
+
+- ``TELEMETRY_GZIP_LEVEL``: gzip level used by the exporters (default 6)
+"""
+
+import logging
+import os
+import time
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from opentelemetry import metrics
+from opentelemetry.exporter.otlp.proto.common._internal import (
+    _create_exp_backoff_generator,
+)
+from opentelemetry.exporter.otlp.proto.common.metrics_encoder import encode_metrics
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.exporter.otlp.proto.http import Compression
+from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.sdk._logs.export import LogExportResult
+from opentelemetry.sdk.metrics.export import MetricExportResult
+from opentelemetry.sdk.trace.export import SpanExportResult
+
+try:
+    from opentelemetry.exporter.otlp.proto.common._log_encoder import encode_logs
+    from opentelemetry.exporter.otlp.proto.http._log_exporter import OTLPLogExporter
+    LOGS_AVAILABLE = True
+except ImportError:
+    # The vendored opentelemetry-proto build does not always ship the logs service
+    LOGS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# All OTLP Export*ServiceRequest messages hold their payload in repeated field 1
+# (resource_spans / resource_metrics / resource_logs): tag = (1 << 3) | LEN
+_FIELD_1_TAG = b"\x0a"
+
+_meter = metrics.get_meter(__name__)
+_ratio_histogram = _meter.create_histogram(
+    "telemetry.exporter.compression.ratio",
+    description="Uncompressed / compressed size of exported OTLP batches",
+)
+_duration_histogram = _meter.create_histogram(
+    "telemetry.exporter.compression.duration",
+    unit="ms",
+    description="Time spent compressing exported OTLP batches",
+)
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def request_chunks(resource_messages: Iterable) -> Iterator[bytes]:
+    """Wire-format chunks of an export request, one resource message at a time"""
+    for message in resource_messages:
+        payload = message.SerializeToString()
+        yield _FIELD_1_TAG + _varint(len(payload))
+        yield payload
+
+
+class GzipStage:
+    """Incremental gzip compressor with a fixed level, reused for every batch"""
+
+    def __init__(self, signal: str, level: Optional[int] = None):
+        if level is None:
+            level = int(os.environ.get("TELEMETRY_GZIP_LEVEL", "6"))
+        self.signal = signal
+        self.level = level
+        # wbits=31 selects the gzip container; copy() skips re-initialising the stream
+        self._template = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, chunks: Iterable[bytes]) -> bytes:
+        start = time.perf_counter()
+        compressor = self._template.copy()
+        raw_size = 0
+        parts = []
+        for chunk in chunks:
+            raw_size += len(chunk)
+            parts.append(compressor.compress(chunk))
+        parts.append(compressor.flush())
+        data = b"".join(parts)
+
+        attributes = {"signal": self.signal}
+        _duration_histogram.record((time.perf_counter() - start) * 1000.0, attributes)
+        if data:
+            _ratio_histogram.record(raw_size / len(data), attributes)
+        return data
+
+
+class _GzipExportMixin:
+    """Retry loop of the stock OTLP/HTTP exporters, posting a pre-compressed body"""
+
+    def _post_compressed(self, data: bytes) -> bool:
+        for delay in _create_exp_backoff_generator(max_value=self._MAX_RETRY_TIMEOUT):
+            if delay == self._MAX_RETRY_TIMEOUT:
+                return False
+
+            resp = self._session.post(
+                url=self._endpoint,
+                data=data,
+                verify=self._certificate_file,
+                timeout=self._timeout,
+            )
+            if resp.status_code in (200, 202):
+                return True
+            if self._retryable(resp):
+                logger.warning(
+                    f"Transient error {resp.reason} exporting {self._gzip.signal}, retrying in {delay}s"
+                )
+                time.sleep(delay)
+                continue
+            logger.error(f"Failed to export {self._gzip.signal} batch code: {resp.status_code}, reason: {resp.text}")
+            return False
+        return False
+
+
+class GzipOTLPSpanExporter(_GzipExportMixin, OTLPSpanExporter):
+    def __init__(self, *args, compression_level: Optional[int] = None, **kwargs):
+        kwargs["compression"] = Compression.Gzip
+        super().__init__(*args, **kwargs)
+        self._gzip = GzipStage("traces", compression_level)
+
+    def export(self, spans) -> SpanExportResult:
+        if self._shutdown:
+            logger.warning("Exporter already shutdown, ignoring batch")
+            return SpanExportResult.FAILURE
+        data = self._gzip.compress(request_chunks(encode_spans(spans).resource_spans))
+        return SpanExportResult.SUCCESS if self._post_compressed(data) else SpanExportResult.FAILURE
+
+
+class GzipOTLPMetricExporter(_GzipExportMixin, OTLPMetricExporter):
+    def __init__(self, *args, compression_level: Optional[int] = None, **kwargs):
+        kwargs["compression"] = Compression.Gzip
+        super().__init__(*args, **kwargs)
+        self._gzip = GzipStage("metrics", compression_level)
+
+    def export(self, metrics_data, timeout_millis: float = 10_000, **kwargs) -> MetricExportResult:
+        data = self._gzip.compress(request_chunks(encode_metrics(metrics_data).resource_metrics))
+        return MetricExportResult.SUCCESS if self._post_compressed(data) else MetricExportResult.FAILURE
+
+
+if LOGS_AVAILABLE:
+
+    class GzipOTLPLogExporter(_GzipExportMixin, OTLPLogExporter):
+        def __init__(self, *args, compression_level: Optional[int] = None, **kwargs):
+            kwargs["compression"] = Compression.Gzip
+            super().__init__(*args, **kwargs)
+            self._gzip = GzipStage("logs", compression_level)
+
+        def export(self, batch) -> LogExportResult:
+            if self._shutdown:
+                logger.warning("Exporter already shutdown, ignoring batch")
+                return LogExportResult.FAILURE
+            data = self._gzip.compress(request_chunks(encode_logs(batch).resource_logs))
+            return LogExportResult.SUCCESS if self._post_compressed(data) else LogExportResult.FAILURE
@@ -0,0 +1,406 @@
+"""
+Standalone long-polling SQS consumer.
+
+Runs the worker's batch processing outside of the Lambda event source mapping,
+as a long-lived container process:
+
+- ``pollers`` threads long-poll ``ReceiveMessage`` (``MaxNumberOfMessages=10``)
+  and put each received batch into a bounded in-process buffer. When the buffer
+  is full, pollers block, so at most ``buffer_batches`` batches plus one per
+  poller are held invisible without being worked on.
+- ``workers`` threads turn each batch into Lambda-shaped event records and pass
+  them to ``process_batch(records)``, the same function the Lambda handler uses.
+  Trace extraction and spans are therefore identical. It returns the usual
+  ``{"batchItemFailures": [...]}``.
+- Successful messages are acknowledged through ``DeleteBatcher``, which
+  coalesces receipt handles across batches into ``DeleteMessageBatch`` calls of
+  up to 10 entries. Failed messages are not deleted and reappear after the
+  visibility timeout, like a partial batch response in Lambda.
+- With a ``VisibilityHeartbeat`` (``otel_sqs.heartbeat``), messages are tracked
+  from the moment they are received, buffered ones included, until their batch
+  is done. Receives then request the heartbeat's visibility timeout explicitly.
+
+With priority lanes (``otel_sqs.lanes``), every lane's queue gets its own
+pollers, bounded buffer and delete batcher, and the workers take batches from
+the lanes by weight. ``messaging.sqs.lane.wait_time`` records how long batches
+waited for a worker, ``messaging.sqs.lane.buffered`` and
+``messaging.sqs.lane.depth`` (``ApproximateNumberOfMessages``) how much work each
+lane has.
+
+``run()`` blocks until SIGTERM/SIGINT. Then the consumer drains: pollers stop
+after their current long poll, workers finish everything already buffered, and
+pending deletes are flushed. Whatever is left after ``drain_timeout_s`` is
+redelivered after its visibility timeout.
+
+Configuration (environment variables):
+
+- ``SQS_QUEUE_URL``: queue to consume
+- ``SQS_PRIORITY_QUEUE_URLS``, ``CONSUMER_LANE_WEIGHTS``, ``CONSUMER_LANE_MAX_WAIT_SECONDS``: priority lanes, see ``otel_sqs.lanes``
+- ``CONSUMER_POLLERS``: concurrent long-poll loops per queue (default 2)
+- ``CONSUMER_WORKERS``: concurrent batch workers (default 4)
+- ``CONSUMER_BUFFER_BATCHES``: bounded buffer size per queue in batches of up to 10 messages (default 2 per worker)
+- ``CONSUMER_WAIT_TIME_SECONDS``: ``ReceiveMessage`` long-poll wait (default 20)
+- ``CONSUMER_DELETE_DELAY_MS``: how long an acknowledgement may wait to fill a delete batch (default 200)
+- ``CONSUMER_DRAIN_TIMEOUT_SECONDS``: time allowed for the drain on shutdown (default 25)
+"""
+
+import base64
+import logging
+import os
+import signal
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+from urllib.parse import urlsplit
+
+from opentelemetry import metrics
+from opentelemetry.metrics import Observation
+
+from otel_sqs.clients import create_client
+from otel_sqs.heartbeat import VisibilityHeartbeat, visibility_heartbeat
+from otel_sqs.lanes import DEFAULT_LANE, Lane, LaneBuffer, lanes_from_env
+
+logger = logging.getLogger(__name__)
+
+_meter = metrics.get_meter(__name__)
+_message_counter = _meter.create_counter(
+    "messaging.sqs.consumer.messages",
+    description="Messages handled by the standalone consumer by result (processed, failed, delete_failed)",
+)
+_lane_wait_time = _meter.create_histogram(
+    "messaging.sqs.lane.wait_time",
+    unit="ms",
+    description="Time received batches waited in the consumer's buffer for a worker, per priority lane",
+)
+
+# ReceiveMessage and DeleteMessageBatch limit
+MAX_BATCH_SIZE = 10
+
+
+def queue_arn(queue_url: str) -> str:
+    """``arn:aws:sqs:<region>:<account>:<name>`` for a queue URL"""
+    url = urlsplit(queue_url)
+    account, _, name = url.path.strip("/").partition("/")
+    host = url.hostname or ""
+    if host.startswith("sqs.") and host.count(".") >= 3:
+        region = host.split(".")[1]
+    else:
+        region = os.environ.get("AWS_REGION") or os.environ.get("AWS_DEFAULT_REGION", "")
+    return f"arn:aws:sqs:{region}:{account}:{name}"
+
+
+def lambda_record(message: Mapping[str, Any], event_source_arn: str) -> Dict[str, Any]:
+    """A ReceiveMessage message in the shape of a Lambda SQS event record"""
+    message_attributes = {}
+    for name, attribute in (message.get("MessageAttributes") or {}).items():
+        converted = {"dataType": attribute["DataType"]}
+        if "StringValue" in attribute:
+            converted["stringValue"] = attribute["StringValue"]
+        if "BinaryValue" in attribute:
+            converted["binaryValue"] = base64.b64encode(attribute["BinaryValue"]).decode("ascii")
+        message_attributes[name] = converted
+    return {
+        "messageId": message["MessageId"],
+        "receiptHandle": message["ReceiptHandle"],
+        "body": message["Body"],
+        "attributes": dict(message.get("Attributes") or {}),
+        "messageAttributes": message_attributes,
+        "md5OfBody": message.get("MD5OfBody"),
+        "eventSource": "aws:sqs",
+        "eventSourceARN": event_source_arn,
+    }
+
+
+class DeleteBatcher:
+    """Coalesces acknowledgements from all workers into DeleteMessageBatch calls"""
+
+    def __init__(self, sqs_client, queue_url: str, max_delay_s: float = 0.2):
+        self.queue_url = queue_url
+        self.max_delay_s = max_delay_s
+        self.calls = 0
+        self._client = sqs_client
+        self._pending: List[str] = []
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="sqs-delete-batcher", daemon=True)
+        self._thread.start()
+
+    def add(self, receipt_handles: Sequence[str]):
+        if not receipt_handles:
+            return
+        with self._condition:
+            self._pending.extend(receipt_handles)
+            self._condition.notify()
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """Flush what is pending and stop; False if the flush did not finish in time"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                # Give other workers a moment to fill the batch
+                deadline = time.monotonic() + self.max_delay_s
+                while len(self._pending) < MAX_BATCH_SIZE and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                pending, self._pending = self._pending, []
+                closed = self._closed
+            for i in range(0, len(pending), MAX_BATCH_SIZE):
+                self._delete(pending[i:i + MAX_BATCH_SIZE])
+            if closed and not pending:
+                return
+
+    def _delete(self, receipt_handles: List[str]):
+        self.calls += 1
+        try:
+            response = self._client.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[{"Id": str(i), "ReceiptHandle": handle} for i, handle in enumerate(receipt_handles)],
+            )
+            failed = response.get("Failed", [])
+        except Exception as e:
+            # The messages come back after their visibility timeout; the idempotent consumer skips them
+            logger.warning(f"DeleteMessageBatch of {len(receipt_handles)} messages failed: {e}")
+            failed = receipt_handles
+        for entry in failed:
+            if isinstance(entry, dict):
+                logger.warning(f"Failed to delete message {entry.get('Id')}: {entry.get('Code')} {entry.get('Message')}")
+        if failed:
+            _message_counter.add(len(failed), {"result": "delete_failed"})
+
+
+class SQSConsumer:
+    def __init__(
+        self,
+        queue_url: Optional[str],
+        process_batch: Callable[[List[Dict[str, Any]]], Mapping[str, Any]],
+        sqs_client=None,
+        pollers: int = 2,
+        workers: int = 4,
+        buffer_batches: Optional[int] = None,
+        wait_time_s: int = 20,
+        delete_delay_s: float = 0.2,
+        drain_timeout_s: float = 25.0,
+        heartbeat: Optional[VisibilityHeartbeat] = None,
+        lanes: Optional[Sequence[Lane]] = None,
+        lane_max_wait_s: float = 10.0,
+    ):
+        self.lanes = list(lanes) if lanes else [Lane(DEFAULT_LANE, queue_url)]
+        self.queue_url = self.lanes[0].queue_url
+        self.process_batch = process_batch
+        self.pollers = pollers
+        self.workers = workers
+        self.wait_time_s = wait_time_s
+        self.delete_delay_s = delete_delay_s
+        self.drain_timeout_s = drain_timeout_s
+        self.heartbeat = heartbeat if heartbeat is not None and heartbeat.enabled else None
+        self.event_source_arns = {lane.name: queue_arn(lane.queue_url) for lane in self.lanes}
+        self._client = sqs_client
+        self._buffer = LaneBuffer(self.lanes, buffer_batches or 2 * workers, lane_max_wait_s)
+        self._stopping = threading.Event()
+        self._pollers: List[threading.Thread] = []
+        self._workers: List[threading.Thread] = []
+        self._deleters: Dict[str, DeleteBatcher] = {}
+
+    @classmethod
+    def from_env(cls, process_batch, sqs_client=None) -> "SQSConsumer":
+        workers = int(os.environ.get("CONSUMER_WORKERS", "4"))
+        return cls(
+            queue_url=os.environ["SQS_QUEUE_URL"],
+            process_batch=process_batch,
+            sqs_client=sqs_client,
+            pollers=int(os.environ.get("CONSUMER_POLLERS", "2")),
+            workers=workers,
+            buffer_batches=int(os.environ.get("CONSUMER_BUFFER_BATCHES", str(2 * workers))),
+            wait_time_s=int(os.environ.get("CONSUMER_WAIT_TIME_SECONDS", "20")),
+            delete_delay_s=int(os.environ.get("CONSUMER_DELETE_DELAY_MS", "200")) / 1000,
+            drain_timeout_s=float(os.environ.get("CONSUMER_DRAIN_TIMEOUT_SECONDS", "25")),
+            heartbeat=visibility_heartbeat,
+            lanes=lanes_from_env(os.environ["SQS_QUEUE_URL"]),
+            lane_max_wait_s=float(os.environ.get("CONSUMER_LANE_MAX_WAIT_SECONDS", "10")),
+        )
+
+    @property
+    def client(self):
+        if self._client is None:
+            # One connection per poller and worker (heartbeats, deletes) per lane; reads outlast the long poll
+            self._client = create_client(
+                "sqs",
+                max_pool_connections=(self.pollers + 1) * len(self.lanes) + self.workers,
+                read_timeout_s=self.wait_time_s + 10,
+            )
+        return self._client
+
+    @property
+    def delete_calls(self) -> int:
+        return sum(deleter.calls for deleter in self._deleters.values())
+
+    def buffered(self, lane: str) -> int:
+        """Received messages of a lane waiting for a worker"""
+        return self._buffer.buffered(lane)
+
+    def queue_depth(self, lane: Lane) -> Optional[int]:
+        """ApproximateNumberOfMessages of a lane's queue; None if SQS cannot be asked"""
+        try:
+            response = self.client.get_queue_attributes(QueueUrl=lane.queue_url, AttributeNames=["ApproximateNumberOfMessages"])
+            return int(response["Attributes"]["ApproximateNumberOfMessages"])
+        except Exception as e:
+            logger.debug(f"GetQueueAttributes for {lane.name} failed: {e}")
+            return None
+
+    def start(self) -> "SQSConsumer":
+        for lane in self.lanes:
+            self._deleters[lane.name] = DeleteBatcher(self.client, lane.queue_url, self.delete_delay_s)
+            for i in range(self.pollers):
+                self._pollers.append(threading.Thread(target=self._poll_loop, args=(lane,), name=f"sqs-poller-{lane.name}-{i}", daemon=True))
+        for i in range(self.workers):
+            self._workers.append(threading.Thread(target=self._work_loop, name=f"sqs-worker-{i}", daemon=True))
+        for thread in self._pollers + self._workers:
+            thread.start()
+        _active_consumers.add(self)
+        lanes = ", ".join(f"{lane.queue_url} ({lane.name}, weight {lane.weight})" for lane in self.lanes)
+        logger.info(f"Consuming {lanes} with {self.pollers} pollers per queue and {self.workers} workers")
+        return self
+
+    def stop(self):
+        """Stop receiving; buffered messages are still processed by ``drain()``"""
+        self._stopping.set()
+
+    def run(self, handle_signals: bool = True) -> bool:
+        """Consume until SIGTERM/SIGINT (or ``stop()``), then drain; returns whether the drain completed"""
+        previous_handlers = {}
+        if handle_signals:
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                previous_handlers[signum] = signal.signal(signum, self._on_signal)
+        try:
+            self.start()
+            # Short waits keep the main thread responsive to signals
+            while not self._stopping.wait(1.0):
+                pass
+            return self.drain()
+        finally:
+            for signum, previous in previous_handlers.items():
+                signal.signal(signum, previous)
+
+    def drain(self) -> bool:
+        """Stop polling, finish buffered batches and flush pending deletes"""
+        self.stop()
+        start = time.monotonic()
+        deadline = start + self.drain_timeout_s
+        for thread in self._pollers:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        # Workers exit once everything buffered so far is processed
+        self._buffer.close()
+        for thread in self._workers:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        drained = True
+        for deleter in self._deleters.values():
+            drained = deleter.close(max(0.0, deadline - time.monotonic())) and drained
+        drained = drained and not any(thread.is_alive() for thread in self._pollers + self._workers)
+        _active_consumers.discard(self)
+        if drained:
+            logger.info(f"Consumer drained in {(time.monotonic() - start) * 1000:.0f}ms")
+        else:
+            logger.warning(f"Consumer drain did not finish within {self.drain_timeout_s}s; unfinished messages will be redelivered")
+        return drained
+
+    def _on_signal(self, signum, frame):
+        logger.info(f"Received signal {signum}, draining")
+        self.stop()
+
+    def _poll_loop(self, lane: Lane):
+        backoff_s = 0.0
+        receive_args = {}
+        if self.heartbeat is not None:
+            # The heartbeat's deadlines must match the visibility the messages actually get
+            receive_args["VisibilityTimeout"] = int(self.heartbeat.visibility_timeout_s)
+        while not self._stopping.is_set():
+            try:
+                response = self.client.receive_message(
+                    QueueUrl=lane.queue_url,
+                    MaxNumberOfMessages=MAX_BATCH_SIZE,
+                    WaitTimeSeconds=self.wait_time_s,
+                    AttributeNames=["All"],
+                    MessageAttributeNames=["All"],
+                    **receive_args,
+                )
+                backoff_s = 0.0
+            except Exception as e:
+                backoff_s = min(max(backoff_s * 2, 0.1), float(self.wait_time_s or 1))
+                logger.warning(f"ReceiveMessage from {lane.name} failed, retrying in {backoff_s:.1f}s: {e}")
+                self._stopping.wait(backoff_s)
+                continue
+            messages = response.get("Messages", [])
+            if messages and self.heartbeat is not None:
+                self.heartbeat.track(lane.queue_url, [message["ReceiptHandle"] for message in messages])
+            if messages:
+                # Blocks while the lane's buffer is full: backpressure instead of unbounded prefetch
+                self._buffer.put(lane.name, messages, len(messages))
+
+    def _work_loop(self):
+        while True:
+            item = self._buffer.get()
+            if item is None:
+                return
+            lane, messages, buffered_s = item
+            _lane_wait_time.record(buffered_s * 1000, {"lane": lane.name})
+            self._process(lane, messages)
+
+    def _process(self, lane: Lane, messages: List[Mapping[str, Any]]):
+        records = [lambda_record(message, self.event_source_arns[lane.name]) for message in messages]
+        try:
+            result = self.process_batch(records)
+            failed = {failure["itemIdentifier"] for failure in result.get("batchItemFailures", [])}
+        except Exception as e:
+            logger.error(f"Processing a batch of {len(records)} messages failed: {e}")
+            failed = {record["messageId"] for record in records}
+        if self.heartbeat is not None:
+            # Failed messages come back after the visibility already granted
+            self.heartbeat.untrack([record["receiptHandle"] for record in records])
+        self._deleters[lane.name].add([record["receiptHandle"] for record in records if record["messageId"] not in failed])
+        if failed:
+            _message_counter.add(len(failed), {"result": "failed", "lane": lane.name})
+        if len(records) > len(failed):
+            _message_counter.add(len(records) - len(failed), {"result": "processed", "lane": lane.name})
+
+
+# Consumers between start() and drain(), observed by the lane gauges
+_active_consumers: "weakref.WeakSet[SQSConsumer]" = weakref.WeakSet()
+
+
+def _observe_buffered(options):
+    for consumer in list(_active_consumers):
+        for lane in consumer.lanes:
+            yield Observation(consumer.buffered(lane.name), {"lane": lane.name})
+
+
+def _observe_depth(options):
+    for consumer in list(_active_consumers):
+        for lane in consumer.lanes:
+            depth = consumer.queue_depth(lane)
+            if depth is not None:
+                yield Observation(depth, {"lane": lane.name})
+
+
+_meter.create_observable_gauge(
+    "messaging.sqs.lane.buffered",
+    callbacks=[_observe_buffered],
+    unit="{message}",
+    description="Received messages per priority lane waiting in the consumer's buffer",
+)
+_meter.create_observable_gauge(
+    "messaging.sqs.lane.depth",
+    callbacks=[_observe_depth],
+    unit="{message}",
+    description="ApproximateNumberOfMessages of each priority lane's queue",
+)
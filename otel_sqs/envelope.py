@@ -0,0 +1,130 @@
+"""
+Compact trace-context envelope for SQS message attributes.
+
+Propagating with the default stack costs up to three message attributes per
+message (``X-Amzn-Trace-Id``, ``traceparent``, ``tracestate``): about 150
+bytes of values plus attribute names, and three slots of SQS's 10-attribute
+limit. The envelope carries the same information in one String attribute,
+``otel-ctx``: a base64url (unpadded) encoding of
+
+    version (1 byte) | trace id (16) | span id (8) | trace flags (1) | tracestate (UTF-8, rest)
+
+which is 35 characters without a tracestate. Version 1 is the only version;
+envelopes with an unknown version are ignored. A decoded envelope converts to
+both W3C (``traceparent``/``tracestate``) and X-Ray (``X-Amzn-Trace-Id``)
+headers.
+
+Configuration (environment variables):
+
+- ``SQS_TRACE_PROPAGATION``: ``headers`` (default) injects the global propagator's
+  headers, ``envelope`` injects the single ``otel-ctx`` attribute
+"""
+
+import base64
+import binascii
+import logging
+from typing import Dict, NamedTuple, Optional, Set
+
+from opentelemetry import trace
+from opentelemetry.context import Context
+from opentelemetry.propagators.textmap import (
+    CarrierT,
+    Getter,
+    Setter,
+    TextMapPropagator,
+    default_getter,
+    default_setter,
+)
+from opentelemetry.trace import NonRecordingSpan, SpanContext, TraceFlags, TraceState
+
+logger = logging.getLogger(__name__)
+
+ENVELOPE_ATTRIBUTE = "otel-ctx"
+ENVELOPE_VERSION = 1
+
+_HEADER_SIZE = 26  # version + trace id + span id + flags
+
+
+class TraceEnvelope(NamedTuple):
+    trace_id: int
+    span_id: int
+    trace_flags: int
+    trace_state: str = ""
+
+    def w3c_carrier(self) -> Dict[str, str]:
+        carrier = {"traceparent": f"00-{self.trace_id:032x}-{self.span_id:016x}-{self.trace_flags:02x}"}
+        if self.trace_state:
+            carrier["tracestate"] = self.trace_state
+        return carrier
+
+    def xray_header(self) -> str:
+        trace_id = f"{self.trace_id:032x}"
+        sampled = 1 if self.trace_flags & TraceFlags.SAMPLED else 0
+        return f"Root=1-{trace_id[:8]}-{trace_id[8:]};Parent={self.span_id:016x};Sampled={sampled}"
+
+    def span_context(self) -> SpanContext:
+        return SpanContext(
+            trace_id=self.trace_id,
+            span_id=self.span_id,
+            is_remote=True,
+            trace_flags=TraceFlags(self.trace_flags),
+            trace_state=TraceState.from_header([self.trace_state]) if self.trace_state else TraceState(),
+        )
+
+
+def encode(span_context: SpanContext) -> str:
+    """Envelope string for a span context"""
+    raw = (
+        bytes((ENVELOPE_VERSION,))
+        + span_context.trace_id.to_bytes(16, "big")
+        + span_context.span_id.to_bytes(8, "big")
+        + bytes((span_context.trace_flags,))
+    )
+    if span_context.trace_state:
+        raw += span_context.trace_state.to_header().encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode(value: str) -> Optional[TraceEnvelope]:
+    """Parse an envelope string; None if it is malformed or of an unknown version"""
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+    except (binascii.Error, ValueError):
+        return None
+    if len(raw) < _HEADER_SIZE or raw[0] != ENVELOPE_VERSION:
+        return None
+    envelope = TraceEnvelope(
+        trace_id=int.from_bytes(raw[1:17], "big"),
+        span_id=int.from_bytes(raw[17:25], "big"),
+        trace_flags=raw[25],
+        trace_state=raw[_HEADER_SIZE:].decode("utf-8", errors="replace"),
+    )
+    if not envelope.trace_id or not envelope.span_id:
+        return None
+    return envelope
+
+
+class EnvelopePropagator(TextMapPropagator):
+    """Injects and extracts the span context as the single ``otel-ctx`` field
+
+    Use it with ``sqs_setter``/``sqs_getter`` from ``otel_sqs.instrumentation``
+    for message attributes, or with the default getter/setter for plain dicts.
+    """
+
+    def extract(self, carrier: CarrierT, context: Optional[Context] = None, getter: Getter = default_getter) -> Context:
+        if context is None:
+            context = Context()
+        values = getter.get(carrier, ENVELOPE_ATTRIBUTE)
+        envelope = decode(values[0]) if values else None
+        if envelope is None:
+            return context
+        return trace.set_span_in_context(NonRecordingSpan(envelope.span_context()), context)
+
+    def inject(self, carrier: CarrierT, context: Optional[Context] = None, setter: Setter = default_setter) -> None:
+        span_context = trace.get_current_span(context).get_span_context()
+        if span_context.is_valid:
+            setter.set(carrier, ENVELOPE_ATTRIBUTE, encode(span_context))
+
+    @property
+    def fields(self) -> Set[str]:
+        return {ENVELOPE_ATTRIBUTE}
@@ -0,0 +1,154 @@
+"""
+Trace-context extraction for SQS records.
+
+The worker used to build a carrier dict per record by walking four sources in
+priority order and then run the full ``CompositePropagator.extract`` on it,
+including the X-Ray header parsing, even when every record of a batch carries
+the same header. ``extract_batch`` reads each record's sources in a single pass
+and memoizes the extracted context by the raw header strings, so a batch with
+one distinct header is parsed once.
+
+Source priority (first match wins, message attributes and ``AWSTraceHeader``
+are merged):
+
+1. ``messageAttributes``: the ``otel-ctx`` envelope (decoded to W3C headers), or
+   ``X-Amzn-Trace-Id`` / ``traceparent`` / ``tracestate``
+2. ``attributes.AWSTraceHeader`` (only if no X-Ray header was found in 1)
+3. the body's ``traceContext`` dict
+4. the ``_X_AMZN_TRACE_ID`` environment variable of the Lambda invocation
+
+Configuration (environment variables):
+
+- ``TELEMETRY_EXTRACT_CACHE_SIZE``: distinct header sets kept (default 256)
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, List, Mapping, Optional, Sequence, Tuple
+
+from opentelemetry import propagate
+from opentelemetry.context import Context
+
+from otel_sqs.envelope import ENVELOPE_ATTRIBUTE, decode
+
+logger = logging.getLogger(__name__)
+
+XRAY_HEADER = "X-Amzn-Trace-Id"
+_ATTRIBUTE_FIELDS = (XRAY_HEADER, "traceparent", "tracestate")
+
+SOURCE_MESSAGE_ATTRIBUTES = "message_attributes"
+SOURCE_MESSAGE_BODY = "message_body"
+SOURCE_LAMBDA_ENV = "lambda_env"
+
+
+def _attribute_value(attribute: Any) -> Optional[str]:
+    if not isinstance(attribute, dict):
+        return None
+    # Lambda events use stringValue, the SDK's ReceiveMessage response StringValue
+    return attribute.get("stringValue", attribute.get("StringValue"))
+
+
+def record_carrier(record: Mapping[str, Any], message_body: Optional[Mapping[str, Any]] = None) -> Tuple[dict, Optional[str]]:
+    """Carrier for one record and the source it came from, in a single pass over the sources"""
+    carrier = {}
+    message_attributes = record.get("messageAttributes") or record.get("MessageAttributes")
+    if message_attributes:
+        envelope_value = _attribute_value(message_attributes.get(ENVELOPE_ATTRIBUTE))
+        envelope = decode(envelope_value) if envelope_value else None
+        if envelope is not None:
+            return envelope.w3c_carrier(), SOURCE_MESSAGE_ATTRIBUTES
+        for field in _ATTRIBUTE_FIELDS:
+            value = _attribute_value(message_attributes.get(field))
+            if value is not None:
+                carrier[field] = value
+
+    if XRAY_HEADER not in carrier:
+        attributes = record.get("attributes") or record.get("Attributes") or {}
+        aws_trace_header = attributes.get("AWSTraceHeader")
+        if aws_trace_header:
+            carrier[XRAY_HEADER] = aws_trace_header
+    if carrier:
+        return carrier, SOURCE_MESSAGE_ATTRIBUTES
+
+    body_trace_context = message_body.get("traceContext") if isinstance(message_body, dict) else None
+    if body_trace_context:
+        return dict(body_trace_context), SOURCE_MESSAGE_BODY
+
+    trace_header = os.environ.get("_X_AMZN_TRACE_ID")
+    if trace_header:
+        return {XRAY_HEADER: trace_header}, SOURCE_LAMBDA_ENV
+    return carrier, None
+
+
+class ContextCache:
+    """LRU of extracted contexts keyed by the propagator and the raw header strings"""
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._entries: "OrderedDict[tuple, Context]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def extract(self, carrier: Mapping[str, str]) -> Context:
+        propagator = propagate.get_global_textmap()
+        # record_carrier builds carriers in a fixed field order, so items() is a stable key
+        key = (id(propagator), *carrier.items())
+        try:
+            hash(key)
+        except TypeError:
+            # Body trace contexts are free-form JSON; unhashable values skip the cache
+            return propagator.extract(carrier)
+        with self._lock:
+            parent = self._entries.get(key)
+            if parent is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return parent
+            self.misses += 1
+
+        # Extracted outside the lock; two threads missing on the same key both extract
+        parent = propagator.extract(carrier)
+        with self._lock:
+            self._entries[key] = parent
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return parent
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+# Shared by the standalone consumer's worker threads, hence the lock
+context_cache = ContextCache(int(os.environ.get("TELEMETRY_EXTRACT_CACHE_SIZE", "256")))
+
+
+def extract_record(record: Mapping[str, Any], message_body: Optional[Mapping[str, Any]] = None) -> Optional[Context]:
+    """Parent context for one record, or None if it carries no trace context"""
+    carrier, source = record_carrier(record, message_body)
+    if source is None:
+        return None
+    try:
+        return context_cache.extract(carrier)
+    except Exception as e:
+        logger.warning(f"Failed to extract trace context from {source}: {e}")
+        return None
+
+
+def extract_batch(
+    records: Sequence[Mapping[str, Any]], message_bodies: Optional[Sequence[Optional[Mapping[str, Any]]]] = None
+) -> List[Optional[Context]]:
+    """Parent contexts for all records of a batch, in record order"""
+    if message_bodies is None:
+        message_bodies = [None] * len(records)
+    contexts = [extract_record(record, body) for record, body in zip(records, message_bodies)]
+    logger.info(
+        f"Extracted trace context for {sum(c is not None for c in contexts)}/{len(records)} records "
+        f"(cache hits={context_cache.hits}, misses={context_cache.misses})"
+    )
+    return contexts
@@ -0,0 +1,180 @@
+"""
+FIFO queue support: message group and deduplication ids on the producer side,
+group-parallel, in-order processing on the worker side.
+
+SQS FIFO queues only keep order within a ``MessageGroupId``. ``FifoAttributes``
+derives it from a request body field, so every entity (customer, order, ...)
+is its own ordered stream. The ``MessageDeduplicationId`` comes from a body
+field, else the request's ``Idempotency-Key``, else a SHA-256 of the request
+body. An identical request sent again within SQS's five-minute deduplication
+window is then accepted but not delivered twice.
+
+``send_batch`` sends many bodies with ``SendMessageBatch``, 10 entries per call,
+and resends entries that SQS reports as failed. FIFO keeps order per group
+within and across those calls.
+
+``process_groups`` is the worker side. A FIFO batch may hold several groups.
+Each group runs sequentially, in receive order, on a thread pool, so a slow
+group does not hold up the others. When a record fails, the rest of its group
+is not started. The failed record and everything after it in that group are
+returned, to be reported as ``batchItemFailures``, while other groups continue.
+SQS then redelivers the group from the failed record on, in order.
+
+Configuration (environment variables):
+
+- ``SQS_MESSAGE_GROUP_FIELD``: dotted request body field giving the group (e.g. ``customerId``)
+- ``SQS_DEFAULT_MESSAGE_GROUP``: group of requests without that field (default ``default``)
+- ``SQS_DEDUPLICATION_FIELD``: dotted request body field giving the deduplication id (optional)
+- ``WORKER_FIFO_GROUP_CONCURRENCY``: message groups processed in parallel per batch (default 4)
+"""
+
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Set
+
+from opentelemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+_meter = metrics.get_meter(__name__)
+_group_failure_counter = _meter.create_counter(
+    "messaging.sqs.fifo.skipped_records",
+    description="FIFO records not started because an earlier record of their message group failed",
+)
+
+# SendMessageBatch limit
+MAX_BATCH_SIZE = 10
+# MessageGroupId / MessageDeduplicationId limit
+MAX_ID_LENGTH = 128
+
+
+def is_fifo(queue_url: str) -> bool:
+    return queue_url.endswith(".fifo")
+
+
+def _field(body: Any, path: Optional[str]) -> Any:
+    if not path:
+        return None
+    value = body
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _bounded(value: Any) -> str:
+    value = str(value)
+    # Longer ids are hashed rather than truncated, so they stay distinct
+    return value if len(value) <= MAX_ID_LENGTH else hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+class FifoAttributes:
+    def __init__(self, group_field: Optional[str] = None, default_group: str = "default", dedup_field: Optional[str] = None):
+        self.group_field = group_field
+        self.default_group = default_group
+        self.dedup_field = dedup_field
+
+    @classmethod
+    def from_env(cls) -> "FifoAttributes":
+        return cls(
+            group_field=os.environ.get("SQS_MESSAGE_GROUP_FIELD") or None,
+            default_group=os.environ.get("SQS_DEFAULT_MESSAGE_GROUP", "default"),
+            dedup_field=os.environ.get("SQS_DEDUPLICATION_FIELD") or None,
+        )
+
+    def message_group_id(self, body: Any) -> str:
+        value = _field(body, self.group_field)
+        return _bounded(value) if value not in (None, "") else self.default_group
+
+    def deduplication_id(self, body: Any, idempotency_key: Optional[str] = None) -> str:
+        value = _field(body, self.dedup_field)
+        if value not in (None, ""):
+            return _bounded(value)
+        if idempotency_key:
+            return _bounded(idempotency_key)
+        # Content hash: the same request body within five minutes is delivered once
+        canonical = json.dumps(body, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def send_args(self, queue_url: str, body: Any, idempotency_key: Optional[str] = None) -> Dict[str, str]:
+        """Extra SendMessage parameters for ``queue_url``: none for standard queues"""
+        if not is_fifo(queue_url):
+            return {}
+        return {
+            "MessageGroupId": self.message_group_id(body),
+            "MessageDeduplicationId": self.deduplication_id(body, idempotency_key),
+        }
+
+
+def send_batch(sqs_client, queue_url: str, bodies: Sequence[Any], fifo: Optional[FifoAttributes] = None, max_attempts: int = 3) -> List[str]:
+    """Send JSON bodies with SendMessageBatch; returns the message ids in order, raises if entries keep failing"""
+    fifo = fifo or FifoAttributes()
+    message_ids: List[Optional[str]] = [None] * len(bodies)
+    for start in range(0, len(bodies), MAX_BATCH_SIZE):
+        entries = {
+            str(i): {"Id": str(i), "MessageBody": json.dumps(bodies[i]), **fifo.send_args(queue_url, bodies[i])}
+            for i in range(start, min(start + MAX_BATCH_SIZE, len(bodies)))
+        }
+        for _ in range(max_attempts):
+            response = sqs_client.send_message_batch(QueueUrl=queue_url, Entries=list(entries.values()))
+            for success in response.get("Successful", []):
+                message_ids[int(success["Id"])] = success["MessageId"]
+                entries.pop(success["Id"], None)
+            failed = response.get("Failed", [])
+            if any(failure.get("SenderFault") for failure in failed):
+                raise ValueError(f"SendMessageBatch rejected entries: {failed}")
+            if not entries:
+                break
+        else:
+            # Later entries are not sent, or they would overtake these within their group
+            raise RuntimeError(f"{len(entries)} SendMessageBatch entries still failing after {max_attempts} attempts")
+    return message_ids
+
+
+def message_group(record: Mapping[str, Any]) -> Optional[str]:
+    """MessageGroupId of a Lambda SQS record; None for standard queues"""
+    return (record.get("attributes") or {}).get("MessageGroupId")
+
+
+def process_groups(
+    records: Sequence[Mapping[str, Any]],
+    process: Callable[[int], bool],
+    max_workers: int = 4,
+) -> Set[int]:
+    """Run ``process(index)`` per record, groups in parallel and in order within a group.
+
+    ``process`` returns False for a record it did not start (e.g. no time left) and
+    raises if it failed. Returns the indexes of that record and the rest of its group.
+    """
+    groups: "OrderedDict[Optional[str], List[int]]" = OrderedDict()
+    for i, record in enumerate(records):
+        groups.setdefault(message_group(record), []).append(i)
+
+    def run_group(indexes: List[int]) -> List[int]:
+        for position, i in enumerate(indexes):
+            try:
+                done = process(i)
+            except Exception as e:
+                logger.error(f"Record {records[i].get('messageId')} of group {message_group(records[i])} failed: {e}")
+                done = False
+            if not done:
+                skipped = len(indexes) - position - 1
+                if skipped:
+                    _group_failure_counter.add(skipped)
+                return indexes[position:]
+        return []
+
+    failed: Set[int] = set()
+    if len(groups) == 1 or max_workers <= 1:
+        for indexes in groups.values():
+            failed.update(run_group(indexes))
+        return failed
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(groups)), thread_name_prefix="fifo-group") as pool:
+        for group_failed in pool.map(run_group, groups.values()):
+            failed.update(group_failed)
+    return failed
@@ -0,0 +1,219 @@
+"""
+Visibility-timeout heartbeat for messages that take long to process.
+
+A message whose processing outlives the queue's visibility timeout is
+redelivered while it is still being worked on. Raising the timeout for everyone
+delays the retry of messages that genuinely failed. ``VisibilityHeartbeat``
+instead tracks in-flight receipt handles and, on a background thread, extends
+the visibility of those close to expiry with ``ChangeMessageVisibilityBatch``
+(up to 10 entries per call, grouped by queue). Tracking stops when the message
+is done. Messages that crashed or failed then come back after at most one
+extension.
+
+Extensions never go past SQS's 12-hour limit from receipt. Handles SQS no
+longer accepts (already deleted, or received again elsewhere) are dropped.
+
+Only the standalone consumer (``otel_sqs.consumer``) uses it. Lambda requires
+the queue's visibility timeout to be at least the function timeout, so a record
+cannot become visible again while its invocation runs; a heartbeat there would
+cost a thread and API calls for nothing.
+
+Configuration (environment variables):
+
+- ``SQS_VISIBILITY_HEARTBEAT``: ``true`` to enable (default off)
+- ``SQS_VISIBILITY_TIMEOUT_SECONDS``: the queue's visibility timeout (default 300)
+- ``SQS_HEARTBEAT_EXTENSION_SECONDS``: visibility granted per extension (default: the queue's timeout)
+- ``SQS_HEARTBEAT_MARGIN_SECONDS``: extend when less than this is left (default: a third of the extension)
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from opentelemetry import metrics
+
+from otel_sqs.clients import create_client
+
+logger = logging.getLogger(__name__)
+
+_meter = metrics.get_meter(__name__)
+_extension_counter = _meter.create_counter(
+    "messaging.sqs.visibility.extensions",
+    description="Visibility extensions by result (extended, failed, expired)",
+)
+_extension_duration = _meter.create_histogram(
+    "messaging.sqs.visibility.extend.duration",
+    unit="ms",
+    description="ChangeMessageVisibilityBatch latency",
+)
+
+# ChangeMessageVisibilityBatch limit
+MAX_BATCH_SIZE = 10
+# SQS rejects visibility beyond 12 hours from the receive
+MAX_VISIBILITY_S = 12 * 3600
+
+
+class _Tracked:
+    __slots__ = ("queue_url", "received_at", "due_at")
+
+    def __init__(self, queue_url: str, received_at: float, due_at: float):
+        self.queue_url = queue_url
+        self.received_at = received_at
+        # When to extend next
+        self.due_at = due_at
+
+
+class VisibilityHeartbeat:
+    def __init__(
+        self,
+        sqs_client=None,
+        visibility_timeout_s: float = 300.0,
+        extension_s: Optional[float] = None,
+        margin_s: Optional[float] = None,
+        enabled: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.visibility_timeout_s = visibility_timeout_s
+        self.extension_s = extension_s or visibility_timeout_s
+        self.margin_s = margin_s if margin_s is not None else self.extension_s / 3
+        self.enabled = enabled
+        self._client = sqs_client
+        self._clock = clock
+        self._tracked: Dict[str, _Tracked] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    @classmethod
+    def from_env(cls, sqs_client=None) -> "VisibilityHeartbeat":
+        extension = os.environ.get("SQS_HEARTBEAT_EXTENSION_SECONDS")
+        margin = os.environ.get("SQS_HEARTBEAT_MARGIN_SECONDS")
+        return cls(
+            sqs_client=sqs_client,
+            visibility_timeout_s=float(os.environ.get("SQS_VISIBILITY_TIMEOUT_SECONDS", "300")),
+            extension_s=float(extension) if extension else None,
+            margin_s=float(margin) if margin else None,
+            enabled=os.environ.get("SQS_VISIBILITY_HEARTBEAT", "").lower() == "true",
+        )
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = create_client("sqs")
+        return self._client
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._tracked)
+
+    def track(self, queue_url: str, receipt_handles: Iterable[str], received_at: Optional[float] = None):
+        """Keep extending these messages until ``untrack``; ``received_at`` is a ``clock`` reading"""
+        if not self.enabled:
+            return
+        received_at = self._clock() if received_at is None else received_at
+        due_at = received_at + self.visibility_timeout_s - self.margin_s
+        with self._condition:
+            if self._closed:
+                return
+            for handle in receipt_handles:
+                self._tracked.setdefault(handle, _Tracked(queue_url, received_at, due_at))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sqs-visibility-heartbeat", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def untrack(self, receipt_handles: Iterable[str]):
+        if not self.enabled:
+            return
+        with self._condition:
+            for handle in receipt_handles:
+                self._tracked.pop(handle, None)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._tracked.clear()
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    now = self._clock()
+                    next_due = min((tracked.due_at for tracked in self._tracked.values()), default=None)
+                    if next_due is not None and next_due <= now:
+                        break
+                    self._condition.wait(None if next_due is None else next_due - now)
+                if self._closed:
+                    return
+                now = self._clock()
+                due: Dict[str, List[str]] = {}
+                for handle, tracked in self._tracked.items():
+                    if tracked.due_at <= now:
+                        due.setdefault(tracked.queue_url, []).append(handle)
+            for queue_url, handles in due.items():
+                for i in range(0, len(handles), MAX_BATCH_SIZE):
+                    self._extend(queue_url, handles[i:i + MAX_BATCH_SIZE])
+
+    def _extend(self, queue_url: str, handles: List[str]):
+        now = self._clock()
+        entries = []
+        extended_to: Dict[str, float] = {}
+        with self._condition:
+            for handle in handles:
+                tracked = self._tracked.get(handle)
+                if tracked is None:
+                    continue
+                # ChangeMessageVisibility counts from now, capped at 12 hours after the receive
+                timeout = int(min(self.extension_s, tracked.received_at + MAX_VISIBILITY_S - now))
+                if timeout <= 0:
+                    logger.warning("Message reached the 12 hour visibility limit, no longer extending it")
+                    self._tracked.pop(handle)
+                    _extension_counter.add(1, {"result": "expired"})
+                    continue
+                extended_to[handle] = now + timeout
+                entries.append({"Id": str(len(entries)), "ReceiptHandle": handle, "VisibilityTimeout": timeout})
+        if not entries:
+            return
+
+        start = time.perf_counter()
+        try:
+            response = self.client.change_message_visibility_batch(QueueUrl=queue_url, Entries=entries)
+        except Exception as e:
+            logger.warning(f"ChangeMessageVisibilityBatch for {len(entries)} messages failed, retrying: {e}")
+            _extension_counter.add(len(entries), {"result": "failed"})
+            with self._condition:
+                for entry in entries:
+                    tracked = self._tracked.get(entry["ReceiptHandle"])
+                    if tracked is not None:
+                        tracked.due_at = now + min(1.0, self.margin_s / 2)
+            return
+        finally:
+            _extension_duration.record(
+                (time.perf_counter() - start) * 1000, {"messaging.destination.name": queue_url.rsplit("/", 1)[-1]}
+            )
+        failed_ids = {failure["Id"]: failure for failure in response.get("Failed", [])}
+
+        with self._condition:
+            for entry in entries:
+                handle = entry["ReceiptHandle"]
+                tracked = self._tracked.get(handle)
+                if tracked is None:
+                    continue
+                if entry["Id"] in failed_ids:
+                    # Deleted or received again meanwhile; retrying the same handle would not help
+                    logger.warning(f"Could not extend visibility: {failed_ids[entry['Id']].get('Code')}")
+                    self._tracked.pop(handle)
+                else:
+                    tracked.due_at = extended_to[handle] - self.margin_s
+        if len(entries) > len(failed_ids):
+            _extension_counter.add(len(entries) - len(failed_ids), {"result": "extended"})
+        if failed_ids:
+            _extension_counter.add(len(failed_ids), {"result": "failed"})
+
+
+visibility_heartbeat = VisibilityHeartbeat.from_env()
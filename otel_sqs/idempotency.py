@@ -0,0 +1,504 @@
+"""
+Idempotency for at-least-once SQS delivery and retried API requests.
+
+Standard queues redeliver messages (visibility timeouts, whole-batch retries
+after a failure). ``IdempotentConsumer`` remembers which keys were processed, in
+a per-container LRU first and then in a pluggable persistent store, so
+redelivered records are skipped. Lookups and writes are batched per SQS batch.
+
+On the API side, ``IdempotentRequests`` caches the response of requests that
+carry an ``Idempotency-Key`` header. A retry with the same key gets the stored
+response without a second SQS send. Concurrent duplicates are coalesced onto
+the first request: in-process waiters share its result, and other containers
+see its ``IN_PROGRESS`` claim in the store and poll until it completes. Reusing
+a key for a different body is rejected.
+
+Stores implement ``get_many``, ``put_many`` and ``put_if_absent``:
+
+- ``DynamoDBIdempotencyStore``: BatchGetItem / BatchWriteItem, conditional PutItem,
+  ``expires_at`` as the table's TTL attribute
+- ``SQLiteIdempotencyStore``: local file or ``:memory:`` database, for tests and local runs
+- ``InMemoryIdempotencyStore``: dict-backed stand-in
+
+Configuration (environment variables):
+
+- ``IDEMPOTENCY_TABLE``: DynamoDB table name (partition key ``id``, string)
+- ``IDEMPOTENCY_SQLITE_PATH``: SQLite database path, used if no table is set
+- ``IDEMPOTENCY_KEY_FIELD``: dotted body field used as the key (e.g. ``data.orderId``);
+  records without it fall back to ``messageId``
+- ``IDEMPOTENCY_TTL_SECONDS``: how long processed keys are remembered (default 86400)
+- ``IDEMPOTENCY_CACHE_SIZE``: per-container LRU size (default 10000)
+- ``IDEMPOTENCY_WAIT_SECONDS``: how long a duplicate API request waits for the
+  in-flight original before getting 409 (default 5)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from opentelemetry import metrics
+
+from otel_sqs.clients import create_client
+
+logger = logging.getLogger(__name__)
+
+_meter = metrics.get_meter(__name__)
+_lookup_counter = _meter.create_counter(
+    "messaging.dedup.lookups",
+    description="Idempotency lookups by result (cache_hit, store_hit, miss, store_error)",
+)
+_request_counter = _meter.create_counter(
+    "http.idempotency.requests",
+    description="Requests with an Idempotency-Key by outcome (new, replayed, coalesced, conflict, mismatch)",
+)
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyError(Exception):
+    status_code = 409
+
+
+class RequestInProgress(IdempotencyError):
+    """The original request with this key is still running"""
+
+    status_code = 409
+
+
+class KeyReuseMismatch(IdempotencyError):
+    """The key was already used for a request with a different body"""
+
+    status_code = 422
+
+
+class InMemoryIdempotencyStore:
+    """Dict-backed store with the same semantics as the persistent stores"""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._items: Dict[str, tuple] = {}
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, dict]:
+        now = self._clock()
+        with self._lock:
+            return {key: self._items[key][0] for key in keys if key in self._items and self._items[key][1] > now}
+
+    def put_many(self, items: Mapping[str, dict], ttl_s: float):
+        expires_at = self._clock() + ttl_s
+        with self._lock:
+            for key, value in items.items():
+                self._items[key] = (value, expires_at)
+
+    def put_if_absent(self, key: str, value: dict, ttl_s: float) -> bool:
+        now = self._clock()
+        with self._lock:
+            existing = self._items.get(key)
+            if existing is not None and existing[1] > now:
+                return False
+            self._items[key] = (value, now + ttl_s)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+class SQLiteIdempotencyStore:
+    def __init__(self, path: str = ":memory:", clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("CREATE TABLE IF NOT EXISTS idempotency (id TEXT PRIMARY KEY, data TEXT, expires_at REAL)")
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, dict]:
+        found = {}
+        now = self._clock()
+        with self._lock:
+            # SQLite caps bound parameters at 999 on older builds
+            for i in range(0, len(keys), 900):
+                chunk = list(keys[i:i + 900])
+                rows = self._db.execute(
+                    f"SELECT id, data FROM idempotency WHERE expires_at > ? AND id IN ({','.join('?' * len(chunk))})",
+                    [now, *chunk],
+                )
+                found.update((key, json.loads(data)) for key, data in rows)
+        return found
+
+    def put_many(self, items: Mapping[str, dict], ttl_s: float):
+        expires_at = self._clock() + ttl_s
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO idempotency (id, data, expires_at) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), expires_at) for key, value in items.items()],
+            )
+
+    def put_if_absent(self, key: str, value: dict, ttl_s: float) -> bool:
+        now = self._clock()
+        with self._lock:
+            # No UPSERT ... WHERE: the Lambda runtime's SQLite predates it
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM idempotency WHERE id = ? AND expires_at <= ?", (key, now))
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO idempotency (id, data, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), now + ttl_s),
+                )
+            finally:
+                self._db.execute("COMMIT")
+            return cursor.rowcount == 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM idempotency WHERE id = ?", (key,))
+
+
+class DynamoDBIdempotencyStore:
+    """Table with partition key ``id`` (S); enable TTL on ``expires_at``"""
+
+    def __init__(self, table_name: str, client=None, clock: Callable[[], float] = time.time):
+        self.table_name = table_name
+        self._client = client
+        self._clock = clock
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = create_client("dynamodb")
+        return self._client
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, dict]:
+        found = {}
+        now = self._clock()
+        unique_keys = list(dict.fromkeys(keys))
+        for i in range(0, len(unique_keys), 100):
+            request = {
+                self.table_name: {
+                    "Keys": [{"id": {"S": key}} for key in unique_keys[i:i + 100]],
+                    "ProjectionExpression": "id, #d, expires_at",
+                    "ExpressionAttributeNames": {"#d": "data"},
+                    "ConsistentRead": True,
+                }
+            }
+            while request:
+                response = self.client.batch_get_item(RequestItems=request)
+                for item in response.get("Responses", {}).get(self.table_name, []):
+                    # TTL deletion is lazy: expired items can still be returned
+                    if float(item["expires_at"]["N"]) > now:
+                        found[item["id"]["S"]] = json.loads(item["data"]["S"])
+                request = response.get("UnprocessedKeys") or None
+        return found
+
+    def put_many(self, items: Mapping[str, dict], ttl_s: float):
+        expires_at = str(int(self._clock() + ttl_s))
+        requests = [
+            {"PutRequest": {"Item": {"id": {"S": key}, "data": {"S": json.dumps(value)}, "expires_at": {"N": expires_at}}}}
+            for key, value in items.items()
+        ]
+        for i in range(0, len(requests), 25):
+            request = {self.table_name: requests[i:i + 25]}
+            while request:
+                response = self.client.batch_write_item(RequestItems=request)
+                request = response.get("UnprocessedItems") or None
+
+    def put_if_absent(self, key: str, value: dict, ttl_s: float) -> bool:
+        now = self._clock()
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={"id": {"S": key}, "data": {"S": json.dumps(value)}, "expires_at": {"N": str(int(now + ttl_s))}},
+                ConditionExpression="attribute_not_exists(id) OR expires_at <= :now",
+                ExpressionAttributeValues={":now": {"N": str(int(now))}},
+            )
+            return True
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+
+    def delete(self, key: str):
+        self.client.delete_item(TableName=self.table_name, Key={"id": {"S": key}})
+
+
+def store_from_env():
+    """Persistent store configured by IDEMPOTENCY_TABLE / IDEMPOTENCY_SQLITE_PATH, or None"""
+    table_name = os.environ.get("IDEMPOTENCY_TABLE")
+    if table_name:
+        return DynamoDBIdempotencyStore(table_name)
+    sqlite_path = os.environ.get("IDEMPOTENCY_SQLITE_PATH")
+    if sqlite_path:
+        return SQLiteIdempotencyStore(sqlite_path)
+    return None
+
+
+class LRUCache:
+    """Size- and age-bounded mapping, shared by the standalone consumer's worker threads"""
+
+    def __init__(self, max_size: int, ttl_s: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (value, self._clock() + self.ttl_s)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _field(body: Any, path: str) -> Any:
+    for part in path.split("."):
+        if not isinstance(body, dict):
+            return None
+        body = body.get(part)
+    return body
+
+
+class IdempotentConsumer:
+    def __init__(
+        self,
+        store=None,
+        key_field: Optional[str] = None,
+        ttl_s: float = 86400.0,
+        cache_size: int = 10000,
+    ):
+        self.store = store
+        self.key_field = key_field
+        self.ttl_s = ttl_s
+        self.cache = LRUCache(cache_size, ttl_s)
+
+    @classmethod
+    def from_env(cls) -> "IdempotentConsumer":
+        return cls(
+            store=store_from_env(),
+            key_field=os.environ.get("IDEMPOTENCY_KEY_FIELD") or None,
+            ttl_s=float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400")),
+            cache_size=int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "10000")),
+        )
+
+    def key_for(self, record: Mapping[str, Any], message_body: Any) -> str:
+        if self.key_field:
+            value = _field(message_body, self.key_field)
+            if value is not None:
+                return f"{self.key_field}:{value}"
+        return f"messageId:{record.get('messageId') or record.get('MessageId')}"
+
+    def find_duplicates(self, keys: Sequence[str]) -> List[bool]:
+        """Whether each key was already processed; repeats within the batch count as duplicates"""
+        duplicates = [False] * len(keys)
+        seen = set()
+        to_check: Dict[str, List[int]] = {}
+        cache_hits = 0
+        for i, key in enumerate(keys):
+            if key in seen:
+                duplicates[i] = True
+                cache_hits += 1
+                continue
+            seen.add(key)
+            if self.cache.get(key) is not None:
+                duplicates[i] = True
+                cache_hits += 1
+            else:
+                to_check.setdefault(key, []).append(i)
+
+        store_hits = 0
+        if to_check and self.store is not None:
+            try:
+                for key in self.store.get_many(list(to_check)):
+                    self.cache.put(key, True)
+                    for i in to_check.pop(key):
+                        duplicates[i] = True
+                        store_hits += 1
+            except Exception as e:
+                # Fail open: processing twice is better than not processing at all
+                logger.warning(f"Idempotency store lookup failed, processing batch without it: {e}")
+                _lookup_counter.add(len(to_check), {"result": "store_error"})
+                to_check = {}
+
+        misses = sum(len(indexes) for indexes in to_check.values())
+        for result, count in (("cache_hit", cache_hits), ("store_hit", store_hits), ("miss", misses)):
+            if count:
+                _lookup_counter.add(count, {"result": result})
+        return duplicates
+
+    def mark_processed(self, keys: Iterable[str]):
+        """Remember processed keys in the LRU and, in one batched write, in the store"""
+        keys = list(keys)
+        for key in keys:
+            self.cache.put(key, True)
+        if keys and self.store is not None:
+            try:
+                self.store.put_many({key: {"status": "COMPLETED"} for key in keys}, self.ttl_s)
+            except Exception as e:
+                logger.warning(f"Failed to persist {len(keys)} idempotency keys: {e}")
+
+
+def idempotency_key(event: Mapping[str, Any]) -> Optional[str]:
+    """``Idempotency-Key`` header of an API Gateway proxy event (header names are case-insensitive)"""
+    for name, value in (event.get("headers") or {}).items():
+        if name.lower() == IDEMPOTENCY_HEADER and value:
+            if len(value) > MAX_KEY_LENGTH:
+                raise KeyReuseMismatch(f"Idempotency-Key longer than {MAX_KEY_LENGTH} characters")
+            return value
+    return None
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry: Optional[dict] = None
+
+
+class IdempotentRequests:
+    def __init__(
+        self,
+        store=None,
+        ttl_s: float = 86400.0,
+        wait_s: float = 5.0,
+        cache_size: int = 1000,
+        poll_interval_s: float = 0.1,
+    ):
+        self.store = store
+        self.ttl_s = ttl_s
+        self.wait_s = wait_s
+        self.poll_interval_s = poll_interval_s
+        self.cache = LRUCache(cache_size, ttl_s)
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, _InFlight] = {}
+
+    @classmethod
+    def from_env(cls) -> "IdempotentRequests":
+        return cls(
+            store=store_from_env(),
+            ttl_s=float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400")),
+            wait_s=float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "5")),
+        )
+
+    def run(self, key: Optional[str], payload: Optional[str], produce: Callable[[], dict]) -> Tuple[dict, str]:
+        """Response for the request and how it was obtained: new, replayed, coalesced or none (no key)"""
+        if not key:
+            return produce(), "none"
+        key = f"request:{key}"
+        fingerprint = hashlib.sha256((payload or "").encode("utf-8")).hexdigest()
+
+        with self._lock:
+            entry = self.cache.get(key)
+            in_flight = self._in_flight.get(key) if entry is None else None
+            owner = entry is None and in_flight is None
+            if owner:
+                in_flight = self._in_flight[key] = _InFlight()
+
+        if entry is not None:
+            return self._replay(entry, fingerprint, "replayed")
+        if not owner:
+            # Same container, e.g. a threaded caller: share the original's result
+            if not in_flight.done.wait(self.wait_s) or in_flight.entry is None:
+                _request_counter.add(1, {"result": "conflict"})
+                raise RequestInProgress("A request with this Idempotency-Key is still in progress")
+            return self._replay(in_flight.entry, fingerprint, "coalesced")
+
+        try:
+            try:
+                entry = self._claim(key, fingerprint)
+            except IdempotencyError:
+                raise
+            except Exception as e:
+                # Fail open like the consumer: a store outage must not take the API down
+                logger.warning(f"Idempotency store unavailable, processing request without it: {e}")
+                entry = None
+            if entry is not None:
+                in_flight.entry = entry
+                return self._replay(entry, fingerprint, "coalesced")
+
+            response = produce()
+            if 200 <= response.get("statusCode", 500) < 300:
+                entry = {"status": "COMPLETED", "fingerprint": fingerprint, "response": response}
+                with self._lock:
+                    self.cache.put(key, entry)
+                in_flight.entry = entry
+                self._store_call("store response", self.store and self.store.put_many, {key: entry}, self.ttl_s)
+            else:
+                # Errors are not cached: release the claim so the client can retry
+                self._store_call("release claim", self.store and self.store.delete, key)
+            _request_counter.add(1, {"result": "new"})
+            return response, "new"
+        except IdempotencyError:
+            raise
+        except Exception:
+            self._store_call("release claim", self.store and self.store.delete, key)
+            raise
+        finally:
+            in_flight.done.set()
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    @staticmethod
+    def _store_call(action: str, method, *args):
+        if method is None:
+            return
+        try:
+            method(*args)
+        except Exception as e:
+            logger.warning(f"Idempotency store failed to {action}: {e}")
+
+    def _claim(self, key: str, fingerprint: str) -> Optional[dict]:
+        """None once this request owns the key, or the completed entry of another container's request"""
+        if self.store is None:
+            return None
+        claim = {"status": "IN_PROGRESS", "fingerprint": fingerprint}
+        deadline = time.monotonic() + self.wait_s
+        while True:
+            # The claim expires by itself if its owner dies mid-request
+            if self.store.put_if_absent(key, claim, max(self.wait_s * 2, 30.0)):
+                return None
+            entry = self.store.get_many([key]).get(key)
+            if entry is not None and entry.get("status") == "COMPLETED":
+                with self._lock:
+                    self.cache.put(key, entry)
+                return entry
+            if entry is not None and entry.get("fingerprint") != fingerprint:
+                _request_counter.add(1, {"result": "mismatch"})
+                raise KeyReuseMismatch("Idempotency-Key was already used for a different request body")
+            if time.monotonic() >= deadline:
+                _request_counter.add(1, {"result": "conflict"})
+                raise RequestInProgress("A request with this Idempotency-Key is still in progress")
+            time.sleep(self.poll_interval_s)
+
+    def _replay(self, entry: dict, fingerprint: str, outcome: str) -> Tuple[dict, str]:
+        if entry.get("fingerprint") != fingerprint:
+            _request_counter.add(1, {"result": "mismatch"})
+            raise KeyReuseMismatch("Idempotency-Key was already used for a different request body")
+        _request_counter.add(1, {"result": outcome})
+        response = dict(entry["response"])
+        response["headers"] = {**response.get("headers", {}), "Idempotent-Replayed": "true"}
+        return response, outcome
@@ -0,0 +1,339 @@
+"""
+Single-span SQS producer instrumentation.
+
+Enabling both ``Boto3SQSInstrumentor`` and ``BotocoreInstrumentor`` wraps every
+``send_message`` twice: a PRODUCER span plus ``propagate.inject`` from boto3sqs,
+then a second CLIENT span from botocore. ``SQSInstrumentor`` replaces the
+boto3sqs wrapper: it creates exactly one PRODUCER span per message (one per
+entry for ``SendMessageBatch``), injects the context once into that message's
+``MessageAttributes`` and suppresses the botocore span for the call. Other SQS
+operations and other AWS services are left to ``BotocoreInstrumentor``.
+
+On the receive side, ``ReceiveMessage`` gets one CONSUMER receive span, and a
+process span is started for every returned message. Those spans are tracked by
+receipt handle in a bounded TTL/LRU store (``ReceivedSpanStore``) instead of an
+unbounded class-level dict. They end on ``DeleteMessage``/``DeleteMessageBatch``.
+Spans of messages that are never deleted through this client are ended and
+flagged when they expire or are evicted. Activating a process span goes through
+``SQSInstrumentor().processing(message)``, which uses the per-thread OTel
+context, so messages can be handled concurrently on several threads.
+
+Instrument it *after* ``BotocoreInstrumentor`` so this wrapper is the outer one::
+
+    BotocoreInstrumentor().instrument()
+    SQSInstrumentor().instrument()
+
+Message attributes use the global propagator unless another one is passed, e.g.
+``SQSInstrumentor().instrument(propagator=EnvelopePropagator())`` for the
+single-attribute envelope of ``otel_sqs.envelope``.
+
+Configuration (environment variables):
+
+- ``SQS_RECEIVE_SPAN_TTL_SECONDS``: end process spans not deleted within this time (default 900)
+- ``SQS_RECEIVE_SPAN_MAX_TRACKED``: maximum process spans tracked at once (default 10000)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Collection, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from botocore.client import BaseClient
+from wrapt import wrap_function_wrapper
+
+from opentelemetry import context, metrics, propagate, trace
+from opentelemetry.instrumentation.instrumentor import BaseInstrumentor
+from opentelemetry.instrumentation.utils import _SUPPRESS_INSTRUMENTATION_KEY, unwrap
+from opentelemetry.metrics import Observation
+from opentelemetry.propagators.textmap import Getter, Setter
+from opentelemetry.semconv.trace import (
+    MessagingDestinationKindValues,
+    MessagingOperationValues,
+    SpanAttributes,
+)
+from opentelemetry.trace import INVALID_SPAN, Link, Span, SpanKind, Status, StatusCode
+
+logger = logging.getLogger(__name__)
+
+# SQS rejects messages carrying more than 10 message attributes
+MAX_MESSAGE_ATTRIBUTES = 10
+
+_SEND_OPERATIONS = ("SendMessage", "SendMessageBatch")
+_RECEIVE_OPERATIONS = ("ReceiveMessage", "DeleteMessage", "DeleteMessageBatch")
+
+# Set on process spans that were ended by the store instead of by a delete
+TRACKING_ENDED_ATTRIBUTE = "messaging.sqs.tracking_ended"
+
+
+class SQSMessageAttributeSetter(Setter):
+    """Writes propagation fields as String message attributes"""
+
+    def set(self, carrier: Dict[str, Any], key: str, value: str) -> None:
+        if key not in carrier and len(carrier) >= MAX_MESSAGE_ATTRIBUTES:
+            logger.warning(f"Cannot propagate {key}: message already has {MAX_MESSAGE_ATTRIBUTES} attributes")
+            return
+        carrier[key] = {"StringValue": value, "DataType": "String"}
+
+
+class SQSMessageAttributeGetter(Getter):
+    """Reads propagation fields from message attributes
+
+    Accepts both the SDK shape (``StringValue``) and the Lambda event shape
+    (``stringValue``).
+    """
+
+    def get(self, carrier: Mapping[str, Any], key: str) -> Optional[List[str]]:
+        attribute = carrier.get(key)
+        if not isinstance(attribute, Mapping):
+            return None
+        value = attribute.get("StringValue", attribute.get("stringValue"))
+        return None if value is None else [value]
+
+    def keys(self, carrier: Mapping[str, Any]) -> List[str]:
+        return list(carrier.keys())
+
+
+sqs_setter = SQSMessageAttributeSetter()
+sqs_getter = SQSMessageAttributeGetter()
+
+
+@lru_cache(maxsize=64)
+def queue_attributes(queue_url: str) -> Tuple[str, Mapping[str, str]]:
+    """Queue name and static span attributes for a queue, computed once per URL"""
+    queue_name = queue_url.rsplit("/", 1)[-1]
+    attributes = {
+        SpanAttributes.MESSAGING_SYSTEM: "aws.sqs",
+        SpanAttributes.MESSAGING_DESTINATION: queue_name,
+        SpanAttributes.MESSAGING_DESTINATION_KIND: MessagingDestinationKindValues.QUEUE.value,
+        SpanAttributes.MESSAGING_URL: queue_url,
+    }
+    return queue_name, attributes
+
+
+class ReceivedSpanStore:
+    """Process spans of received messages keyed by receipt handle, bounded by size and age
+
+    Entries leave the store when the message is deleted, when they are older
+    than ``ttl_s``, or when ``max_size`` is exceeded (least recently received
+    first). Spans removed for any reason other than a delete are ended with
+    ``messaging.sqs.tracking_ended`` set to ``expired``, ``evicted`` or
+    ``redelivered``.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_s: float = 900.0, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._spans: "OrderedDict[str, Tuple[Span, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def add(self, receipt_handle: str, span: Span):
+        stale = []
+        with self._lock:
+            now = self._clock()
+            previous = self._spans.pop(receipt_handle, None)
+            if previous is not None:
+                stale.append((previous[0], "redelivered"))
+            self._spans[receipt_handle] = (span, now + self.ttl_s)
+            stale.extend(self._collect_expired(now))
+            while len(self._spans) > self.max_size:
+                _, (evicted, _) = self._spans.popitem(last=False)
+                stale.append((evicted, "evicted"))
+        _end_stale(stale)
+
+    def get(self, receipt_handle: str) -> Optional[Span]:
+        with self._lock:
+            entry = self._spans.get(receipt_handle)
+        return entry[0] if entry else None
+
+    def pop(self, receipt_handle: str) -> Optional[Span]:
+        with self._lock:
+            entry = self._spans.pop(receipt_handle, None)
+        return entry[0] if entry else None
+
+    def sweep(self) -> int:
+        """End and drop expired spans; returns how many were removed"""
+        with self._lock:
+            stale = self._collect_expired(self._clock())
+        _end_stale(stale)
+        return len(stale)
+
+    def _collect_expired(self, now: float) -> List[Tuple[Span, str]]:
+        # Caller holds self._lock. Insertion order == deadline order (constant TTL)
+        expired = []
+        while self._spans:
+            handle, (span, deadline) = next(iter(self._spans.items()))
+            if deadline > now:
+                break
+            del self._spans[handle]
+            expired.append((span, "expired"))
+        return expired
+
+
+def _end_stale(stale: List[Tuple[Span, str]]):
+    for span, reason in stale:
+        span.set_attribute(TRACKING_ENDED_ATTRIBUTE, reason)
+        span.end()
+
+
+received_spans = ReceivedSpanStore(
+    max_size=int(os.environ.get("SQS_RECEIVE_SPAN_MAX_TRACKED", "10000")),
+    ttl_s=float(os.environ.get("SQS_RECEIVE_SPAN_TTL_SECONDS", "900")),
+)
+
+_meter = metrics.get_meter(__name__)
+_meter.create_observable_gauge(
+    "messaging.sqs.receive_spans.tracked",
+    callbacks=[lambda options: [Observation(len(received_spans))]],
+    unit="{span}",
+    description="Process spans of received SQS messages waiting for delete or expiry",
+)
+
+
+class SQSInstrumentor(BaseInstrumentor):
+    def instrumentation_dependencies(self) -> Collection[str]:
+        return ("botocore ~= 1.0",)
+
+    def _instrument(self, **kwargs):
+        self._tracer = trace.get_tracer(__name__, tracer_provider=kwargs.get("tracer_provider"))
+        self._propagator = kwargs.get("propagator")
+        wrap_function_wrapper("botocore.client", "BaseClient._make_api_call", self._patched_api_call)
+
+    def _uninstrument(self, **kwargs):
+        unwrap(BaseClient, "_make_api_call")
+
+    def _patched_api_call(self, wrapped, instance, args, kwargs):
+        operation, params = args[0], args[1]
+        if (
+            (operation not in _SEND_OPERATIONS and operation not in _RECEIVE_OPERATIONS)
+            or instance.meta.service_model.service_name != "sqs"
+            or context.get_value(_SUPPRESS_INSTRUMENTATION_KEY)
+            or not params.get("QueueUrl")
+        ):
+            return wrapped(*args, **kwargs)
+
+        queue_name, attributes = queue_attributes(params["QueueUrl"])
+        if operation == "SendMessage":
+            return self._send_message(wrapped, args, kwargs, params, f"{queue_name} send", attributes)
+        if operation == "SendMessageBatch":
+            return self._send_message_batch(wrapped, args, kwargs, params, f"{queue_name} send", attributes)
+        if operation == "ReceiveMessage":
+            return self._receive_message(wrapped, args, kwargs, params, queue_name, attributes)
+
+        # Deletes keep their botocore CLIENT span; they only finish the tracked process spans
+        if operation == "DeleteMessage":
+            handles = [params.get("ReceiptHandle")]
+        else:
+            handles = [entry.get("ReceiptHandle") for entry in params.get("Entries") or []]
+        result = wrapped(*args, **kwargs)
+        for handle in handles:
+            span = received_spans.pop(handle) if handle else None
+            if span is not None:
+                span.end()
+        return result
+
+    def _textmap(self):
+        return self._propagator or propagate.get_global_textmap()
+
+    @contextmanager
+    def processing(self, message: Mapping[str, Any]) -> Iterator[Span]:
+        """Make the process span of a received message current for this thread"""
+        span = received_spans.get(message.get("ReceiptHandle", ""))
+        if span is None:
+            yield INVALID_SPAN
+            return
+        with trace.use_span(span, end_on_exit=False):
+            yield span
+
+    def _send_message(self, wrapped, args, kwargs, params, span_name, attributes):
+        with self._tracer.start_as_current_span(
+            span_name, kind=SpanKind.PRODUCER, attributes=attributes
+        ) as span:
+            params["MessageAttributes"] = dict(params.get("MessageAttributes") or {})
+            self._textmap().inject(params["MessageAttributes"], setter=sqs_setter)
+            result = _call_suppressed(wrapped, args, kwargs)
+            if span.is_recording() and result.get("MessageId"):
+                span.set_attribute(SpanAttributes.MESSAGING_MESSAGE_ID, result["MessageId"])
+            return result
+
+    def _send_message_batch(self, wrapped, args, kwargs, params, span_name, attributes):
+        textmap = self._textmap()
+        spans = {}
+        for entry in params.get("Entries") or []:
+            span = self._tracer.start_span(span_name, kind=SpanKind.PRODUCER, attributes=attributes)
+            span.set_attribute(SpanAttributes.MESSAGING_CONVERSATION_ID, entry["Id"])
+            entry["MessageAttributes"] = dict(entry.get("MessageAttributes") or {})
+            textmap.inject(entry["MessageAttributes"], context=trace.set_span_in_context(span), setter=sqs_setter)
+            spans[entry["Id"]] = span
+
+        try:
+            result = _call_suppressed(wrapped, args, kwargs)
+        except Exception as e:
+            for span in spans.values():
+                span.record_exception(e)
+                span.set_status(Status(StatusCode.ERROR, str(e)))
+                span.end()
+            raise
+
+        for success in result.get("Successful", []):
+            span = spans.pop(success["Id"], None)
+            if span is not None:
+                span.set_attribute(SpanAttributes.MESSAGING_MESSAGE_ID, success.get("MessageId"))
+                span.end()
+        for failure in result.get("Failed", []):
+            span = spans.pop(failure["Id"], None)
+            if span is not None:
+                span.set_status(Status(StatusCode.ERROR, failure.get("Code", "SendMessageBatch entry failed")))
+                span.end()
+        for span in spans.values():
+            span.end()
+        return result
+
+    def _receive_message(self, wrapped, args, kwargs, params, queue_name, attributes):
+        # Ask SQS for the propagation fields, otherwise the links below cannot be built
+        textmap = self._textmap()
+        names = list(params.get("MessageAttributeNames") or [])
+        if "All" not in names and ".*" not in names:
+            names.extend(field for field in textmap.fields if field not in names)
+            params["MessageAttributeNames"] = names
+
+        with self._tracer.start_as_current_span(
+            f"{queue_name} receive", kind=SpanKind.CONSUMER, attributes=attributes
+        ) as span:
+            span.set_attribute(SpanAttributes.MESSAGING_OPERATION, MessagingOperationValues.RECEIVE.value)
+            result = _call_suppressed(wrapped, args, kwargs)
+
+        received_spans.sweep()
+        for message in result.get("Messages", []):
+            receipt_handle = message.get("ReceiptHandle")
+            if not receipt_handle:
+                continue
+            parent = trace.get_current_span(
+                textmap.extract(message.get("MessageAttributes", {}), getter=sqs_getter)
+            ).get_span_context()
+            process_span = self._tracer.start_span(
+                f"{queue_name} process",
+                kind=SpanKind.CONSUMER,
+                attributes=attributes,
+                links=[Link(parent)] if parent.is_valid else None,
+            )
+            process_span.set_attribute(SpanAttributes.MESSAGING_OPERATION, MessagingOperationValues.PROCESS.value)
+            process_span.set_attribute(SpanAttributes.MESSAGING_MESSAGE_ID, message.get("MessageId", ""))
+            received_spans.add(receipt_handle, process_span)
+        return result
+
+
+def _call_suppressed(wrapped, args, kwargs):
+    # The PRODUCER span already covers this call: keep BotocoreInstrumentor from adding a CLIENT span
+    token = context.attach(context.set_value(_SUPPRESS_INSTRUMENTATION_KEY, True))
+    try:
+        return wrapped(*args, **kwargs)
+    finally:
+        context.detach(token)
@@ -0,0 +1,148 @@
+"""
+Priority lanes: one SQS queue per priority.
+
+Under backlog, a single queue makes urgent requests wait behind bulk traffic.
+The producer's ``PriorityRouter`` therefore sends each request to the queue of
+its lane, chosen by a body field (``priority`` by default). Unknown or missing
+values go to the default lane, which is ``SQS_QUEUE_URL``. On the consumer side,
+``LaneBuffer`` holds the received batches of every lane. Workers take batches
+from it by smooth weighted round robin over the lanes that have work, so a lane
+of weight 8 gets eight batches for every one of a lane of weight 1 while both
+are backlogged. Starvation protection: a batch that has waited longer than
+``max_wait_s`` is served next, whatever the weights.
+
+Configuration (environment variables):
+
+- ``SQS_PRIORITY_QUEUE_URLS``: lanes besides the default one, as ``name=queue_url`` pairs
+  separated by commas (e.g. ``high=https://sqs.../otel-alml-poc-high``)
+- ``SQS_PRIORITY_FIELD``: dotted request body field naming the lane (default ``priority``)
+- ``CONSUMER_LANE_WEIGHTS``: consumer weights as ``name=weight`` pairs (default 1 per lane)
+- ``CONSUMER_LANE_MAX_WAIT_SECONDS``: starvation limit for buffered batches (default 10)
+- ``SQS_SHARD_QUEUE_URLS``: shards of the default lane, consumed as lanes of their own (see ``otel_sqs.sharding``)
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from otel_sqs.sharding import shard_name, shard_queue_urls_from_env
+
+DEFAULT_LANE = "default"
+
+
+class Lane(NamedTuple):
+    name: str
+    queue_url: str
+    weight: int = 1
+
+
+def _pairs(spec: str) -> Dict[str, str]:
+    pairs = {}
+    for item in spec.split(","):
+        name, separator, value = item.strip().partition("=")
+        if separator and name.strip() and value.strip():
+            pairs[name.strip()] = value.strip()
+    return pairs
+
+
+def lanes_from_env(default_queue_url: str) -> List[Lane]:
+    """The default lane plus those in ``SQS_PRIORITY_QUEUE_URLS`` and the other queue shards, weighted by ``CONSUMER_LANE_WEIGHTS``"""
+    queue_urls = {DEFAULT_LANE: default_queue_url}
+    queue_urls.update(_pairs(os.environ.get("SQS_PRIORITY_QUEUE_URLS", "")))
+    # Shards of the default lane (SQS_SHARD_QUEUE_URLS) are lanes named after their queue
+    for queue_url in shard_queue_urls_from_env():
+        if queue_url != default_queue_url:
+            queue_urls[shard_name(queue_url)] = queue_url
+    weights = {name: int(weight) for name, weight in _pairs(os.environ.get("CONSUMER_LANE_WEIGHTS", "")).items()}
+    return [Lane(name, queue_url, max(1, weights.get(name, 1))) for name, queue_url in queue_urls.items()]
+
+
+class PriorityRouter:
+    def __init__(self, default_queue_url: str, queue_urls: Optional[Dict[str, str]] = None, field: str = "priority"):
+        self.default_queue_url = default_queue_url
+        self.queue_urls = dict(queue_urls or {})
+        self.field = field
+
+    @classmethod
+    def from_env(cls, default_queue_url: str) -> "PriorityRouter":
+        return cls(
+            default_queue_url,
+            _pairs(os.environ.get("SQS_PRIORITY_QUEUE_URLS", "")),
+            field=os.environ.get("SQS_PRIORITY_FIELD", "priority"),
+        )
+
+    def route(self, body: Any) -> Tuple[str, str]:
+        """Lane name and queue URL for a request body"""
+        if self.queue_urls:
+            value = body
+            for part in self.field.split("."):
+                value = value.get(part) if isinstance(value, dict) else None
+            queue_url = self.queue_urls.get(str(value)) if value is not None else None
+            if queue_url:
+                return str(value), queue_url
+        return DEFAULT_LANE, self.default_queue_url
+
+
+class LaneBuffer:
+    """Bounded per-lane buffer with weighted fair, starvation-protected ``get``"""
+
+    def __init__(self, lanes: Sequence[Lane], capacity: int, max_wait_s: float = 10.0, clock: Callable[[], float] = time.monotonic):
+        self.lanes = list(lanes)
+        self.capacity = capacity
+        self.max_wait_s = max_wait_s
+        self._clock = clock
+        # Per lane: (enqueued at, item, message count)
+        self._items: Dict[str, Deque[Tuple[float, Any, int]]] = {lane.name: deque() for lane in self.lanes}
+        self._current = {lane.name: 0 for lane in self.lanes}
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def put(self, lane: str, item: Any, size: int = 1):
+        """Blocks while the lane's buffer is full"""
+        with self._condition:
+            while len(self._items[lane]) >= self.capacity and not self._closed:
+                self._condition.wait()
+            self._items[lane].append((self._clock(), item, size))
+            self._condition.notify_all()
+
+    def get(self) -> Optional[Tuple[Lane, Any, float]]:
+        """Next lane, item and seconds it was buffered; None once closed and empty"""
+        with self._condition:
+            while True:
+                ready = [lane for lane in self.lanes if self._items[lane.name]]
+                if ready:
+                    break
+                if self._closed:
+                    return None
+                self._condition.wait()
+            now = self._clock()
+            lane = self._pick(ready, now)
+            enqueued_at, item, _ = self._items[lane.name].popleft()
+            self._condition.notify_all()
+            return lane, item, now - enqueued_at
+
+    def _pick(self, ready: List[Lane], now: float) -> Lane:
+        oldest = min(ready, key=lambda lane: self._items[lane.name][0][0])
+        if now - self._items[oldest.name][0][0] >= self.max_wait_s:
+            return oldest
+        # Smooth weighted round robin over the lanes with work
+        total = 0
+        for lane in ready:
+            self._current[lane.name] += lane.weight
+            total += lane.weight
+        chosen = max(ready, key=lambda lane: self._current[lane.name])
+        self._current[chosen.name] -= total
+        return chosen
+
+    def buffered(self, lane: str) -> int:
+        """Messages (not batches) waiting in a lane"""
+        with self._condition:
+            return sum(size for _, _, size in self._items[lane])
+
+    def close(self):
+        """No more puts; ``get`` returns the remaining items, then None"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
@@ -0,0 +1,93 @@
+"""
+End-to-end queue latency from SQS system attributes.
+
+lambda1 writes the API Gateway accept time (``requestContext.requestTimeEpoch``,
+epoch ms) into the message's ``timestamp``. For every processed record the
+worker records:
+
+- ``messaging.sqs.queue.dwell_time``: ``ApproximateFirstReceiveTimestamp`` minus
+  ``SentTimestamp``, i.e. how long the message waited before it was picked up
+  for the first time
+- ``messaging.sqs.end_to_end.duration``: from the API accepting the request to
+  the worker finishing the record, including retries
+- ``messaging.sqs.receive_count``: ``ApproximateReceiveCount``, i.e. how often
+  the message has been delivered
+
+Measurements are taken while the consumer span is active, so an SDK with
+exemplar support (trace-based filter) links them to that span. The values are
+also set as span attributes, because the SDK pinned here (1.21) does not record
+exemplars.
+
+The timestamps come from SQS, API Gateway and the worker's clock, so small
+negative differences from clock skew are clamped to zero. Bodies whose
+``timestamp`` is not an epoch-ms value (messages from older producers) are
+skipped for the end-to-end histogram.
+"""
+
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from opentelemetry import metrics
+
+_meter = metrics.get_meter(__name__)
+_dwell_time = _meter.create_histogram(
+    "messaging.sqs.queue.dwell_time",
+    unit="ms",
+    description="Time from SendMessage until SQS first handed the message to a consumer",
+)
+_end_to_end = _meter.create_histogram(
+    "messaging.sqs.end_to_end.duration",
+    unit="ms",
+    description="Time from the API accepting the request until the worker finished processing it",
+)
+_receive_count = _meter.create_histogram(
+    "messaging.sqs.receive_count",
+    unit="{delivery}",
+    description="ApproximateReceiveCount of processed messages",
+)
+
+# Anything earlier is not an epoch-ms timestamp (2001-09-09)
+_MIN_EPOCH_MS = 1_000_000_000_000
+
+
+def _epoch_ms(value: Any) -> Optional[int]:
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value >= _MIN_EPOCH_MS else None
+
+
+def queue_timings(record: Mapping[str, Any], message_body: Any, now_ms: Optional[int] = None) -> Dict[str, int]:
+    """Dwell time, accept-to-now time (ms) and receive count of one record, where known"""
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    attributes = record.get("attributes") or record.get("Attributes") or {}
+    timings = {}
+    sent = _epoch_ms(attributes.get("SentTimestamp"))
+    first_receive = _epoch_ms(attributes.get("ApproximateFirstReceiveTimestamp"))
+    if sent is not None and first_receive is not None:
+        timings["dwell_time_ms"] = max(0, first_receive - sent)
+    accepted = _epoch_ms(message_body.get("timestamp")) if isinstance(message_body, dict) else None
+    if accepted is not None:
+        timings["end_to_end_ms"] = max(0, now_ms - accepted)
+    receive_count = attributes.get("ApproximateReceiveCount")
+    if receive_count is not None:
+        timings["receive_count"] = int(receive_count)
+    return timings
+
+
+def record_queue_latency(record: Mapping[str, Any], message_body: Any, span=None) -> Dict[str, int]:
+    """Record the latency histograms for a processed record; call it with the consumer span active"""
+    timings = queue_timings(record, message_body)
+    arn = record.get("eventSourceARN") or ""
+    metric_attributes = {"messaging.destination.name": arn.rsplit(":", 1)[-1]}
+    if "dwell_time_ms" in timings:
+        _dwell_time.record(timings["dwell_time_ms"], metric_attributes)
+    if "end_to_end_ms" in timings:
+        _end_to_end.record(timings["end_to_end_ms"], metric_attributes)
+    if "receive_count" in timings:
+        _receive_count.record(timings["receive_count"], metric_attributes)
+    if span is not None and span.is_recording():
+        for name, value in timings.items():
+            span.set_attribute(f"messaging.sqs.{name}", value)
+    return timings
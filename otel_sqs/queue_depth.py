@@ -0,0 +1,98 @@
+"""
+Cached SQS queue depths.
+
+Admission control and the shard depth gauge both need
+``ApproximateNumberOfMessages`` of a few queues, and ``GetQueueAttributes`` is a
+network round trip of up to the client's read timeout. ``QueueDepthCache``
+keeps the last value per queue URL for ``refresh_s``:
+
+- ``get`` returns the cached depth, or fetches it once the entry is stale.
+  Admission control calls it on the request path: only one request per
+  interval pays for the call.
+- ``cached`` returns only what is cached, never calling SQS. Metric callbacks
+  use it, because lambda1 collects metrics in ``force_flush`` on every request.
+- ``refresh_in_background`` fetches the stale entries on a daemon thread, one
+  refresh at a time.
+
+If SQS cannot be asked, the last known depth is kept and retried after the next
+interval rather than on every call. A queue never read successfully has no
+depth (None).
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from otel_sqs.clients import create_client
+
+logger = logging.getLogger(__name__)
+
+
+class QueueDepthCache:
+    def __init__(self, sqs_client=None, refresh_s: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        self.refresh_s = refresh_s
+        self._client = sqs_client
+        self._clock = clock
+        self._depths: Dict[str, Tuple[float, int]] = {}
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = create_client("sqs")
+        return self._client
+
+    def _stale(self, queue_url: str, now: float) -> bool:
+        cached = self._depths.get(queue_url)
+        return cached is None or now - cached[0] >= self.refresh_s
+
+    def get(self, queue_url: str) -> Optional[int]:
+        """Cached ApproximateNumberOfMessages; the last known value (or None) if SQS cannot be asked"""
+        now = self._clock()
+        with self._lock:
+            cached = self._depths.get(queue_url)
+        if cached is not None and now - cached[0] < self.refresh_s:
+            return cached[1]
+        try:
+            response = self.client.get_queue_attributes(QueueUrl=queue_url, AttributeNames=["ApproximateNumberOfMessages"])
+            depth = int(response["Attributes"]["ApproximateNumberOfMessages"])
+        except Exception as e:
+            logger.warning(f"Could not read the depth of {queue_url}, keeping the last known value: {e}")
+            if cached is None:
+                return None
+            # Retry after the next interval instead of on every call
+            depth = cached[1]
+        with self._lock:
+            self._depths[queue_url] = (now, depth)
+        return depth
+
+    def cached(self, queue_urls: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """Cached depths by queue URL, stale ones included; never calls SQS"""
+        with self._lock:
+            if queue_urls is None:
+                return {queue_url: depth for queue_url, (_, depth) in self._depths.items()}
+            return {queue_url: self._depths[queue_url][1] for queue_url in queue_urls if queue_url in self._depths}
+
+    def refresh_in_background(self, queue_urls: Iterable[str]) -> Optional[threading.Thread]:
+        """Fetch the stale depths of ``queue_urls`` on a daemon thread; None if none are stale or a refresh is running"""
+        now = self._clock()
+        with self._lock:
+            if self._refreshing:
+                return None
+            stale = [queue_url for queue_url in queue_urls if self._stale(queue_url, now)]
+            if not stale:
+                return None
+            self._refreshing = True
+        thread = threading.Thread(target=self._refresh, args=(stale,), name="sqs-queue-depth", daemon=True)
+        thread.start()
+        return thread
+
+    def _refresh(self, queue_urls):
+        try:
+            for queue_url in queue_urls:
+                self.get(queue_url)
+        finally:
+            with self._lock:
+                self._refreshing = False
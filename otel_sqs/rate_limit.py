@@ -0,0 +1,262 @@
+"""
+Per-client token-bucket rate limiting for the API handler.
+
+Without it, one noisy caller can fill the queue and starve every other
+client's share of the worker. ``RateLimiter`` keeps a token bucket per client
+in the warm container: ``RATE_LIMIT_PER_SECOND`` tokens are added per second, up
+to ``RATE_LIMIT_BURST``, and every request takes one. A request without a token
+gets 429 with ``Retry-After`` before anything else runs. That costs a dict
+lookup, and no SQS or store call.
+
+The client is identified by the first of the ``RATE_LIMIT_KEY`` sources found in
+the event:
+
+- ``api_key``: ``requestContext.identity.apiKey``, else the ``x-api-key`` header
+- ``source_ip``: ``requestContext.identity.sourceIp``
+- ``header:<name>``: any request header, e.g. ``header:X-Client-Id``
+
+Requests with none of them share one ``anonymous`` bucket.
+
+Each warm container has its own buckets, so with N containers a client can get
+up to N times its rate. For cross-container fairness, a shared store holds the
+authoritative bucket. The local bucket still rejects first, so throttled
+clients cause no store traffic. Stores implement ``take(key, rate_per_s, burst)``,
+which returns 0 when a token was taken, else the seconds until one is available:
+
+- ``DynamoDBRateLimitStore``: bucket item updated with a conditional PutItem;
+  ``expires_at`` as the table's TTL attribute
+- ``InMemoryRateLimitStore``: dict-backed stand-in
+
+A store that cannot be reached is skipped, and the local bucket alone decides.
+
+The raw client key only names the local bucket and the store item. Telemetry
+never carries it: spans get ``client_label(key)``, the source and a truncated
+SHA-256 of the identifier, and ``http.server.rate_limit.throttled`` counts
+throttles per key source (``api_key``, ``source_ip``, ``header``,
+``anonymous``), which keeps the number of series bounded.
+
+Configuration (environment variables):
+
+- ``RATE_LIMIT_PER_SECOND``: sustained requests per second and client (unset: no limit)
+- ``RATE_LIMIT_BURST``: bucket size (default: the per-second rate, at least 1)
+- ``RATE_LIMIT_KEY``: comma-separated client key sources (default ``api_key,source_ip``)
+- ``RATE_LIMIT_TABLE``: DynamoDB table for shared buckets (partition key ``id``, string)
+- ``RATE_LIMIT_MAX_CLIENTS``: buckets kept per container (default 10000)
+"""
+
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from opentelemetry import metrics
+
+from otel_sqs.clients import create_client
+
+logger = logging.getLogger(__name__)
+
+_meter = metrics.get_meter(__name__)
+_throttle_counter = _meter.create_counter(
+    "http.server.rate_limit.throttled",
+    description="Requests rejected with 429 by the per-client rate limiter, by client key source and where (local, shared)",
+)
+
+ANONYMOUS = "anonymous"
+DEFAULT_KEY_SOURCES = "api_key,source_ip"
+
+
+def _refill(tokens: float, updated_at: float, now: float, rate_per_s: float, burst: float) -> float:
+    return min(burst, tokens + max(0.0, now - updated_at) * rate_per_s)
+
+
+class InMemoryRateLimitStore:
+    """Dict-backed stand-in for a shared bucket store"""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self._clock = clock
+
+    def take(self, key: str, rate_per_s: float, burst: float) -> float:
+        with self._lock:
+            now = self._clock()
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = _refill(tokens, updated_at, now, rate_per_s, burst)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / rate_per_s
+            self._buckets[key] = (tokens - 1, now)
+            return 0.0
+
+
+class DynamoDBRateLimitStore:
+    """Table with partition key ``id`` (S); enable TTL on ``expires_at``"""
+
+    def __init__(self, table_name: str, client=None, clock: Callable[[], float] = time.time, max_attempts: int = 3):
+        self.table_name = table_name
+        self.max_attempts = max_attempts
+        self._client = client
+        self._clock = clock
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = create_client("dynamodb")
+        return self._client
+
+    def take(self, key: str, rate_per_s: float, burst: float) -> float:
+        item_id = f"ratelimit:{key}"
+        for _ in range(self.max_attempts):
+            now = self._clock()
+            item = self.client.get_item(TableName=self.table_name, Key={"id": {"S": item_id}}, ConsistentRead=True).get("Item")
+            if item is None:
+                tokens, previous = burst, None
+            else:
+                previous = item["updated_at"]["N"]
+                tokens = _refill(float(item["tokens"]["N"]), float(previous), now, rate_per_s, burst)
+            if tokens < 1:
+                return (1 - tokens) / rate_per_s
+            # Compare-and-set on updated_at: a concurrent take from another container retries
+            condition = {"ConditionExpression": "attribute_not_exists(id)"}
+            if previous is not None:
+                condition = {"ConditionExpression": "updated_at = :previous", "ExpressionAttributeValues": {":previous": {"N": previous}}}
+            try:
+                self.client.put_item(
+                    TableName=self.table_name,
+                    Item={
+                        "id": {"S": item_id},
+                        "tokens": {"N": f"{tokens - 1:.6f}"},
+                        "updated_at": {"N": f"{now:.6f}"},
+                        # A full bucket needs no item
+                        "expires_at": {"N": str(int(now + burst / rate_per_s) + 60)},
+                    },
+                    **condition,
+                )
+                return 0.0
+            except self.client.exceptions.ConditionalCheckFailedException:
+                continue
+        # Heavy contention on one key: the local bucket has already limited this container
+        return 0.0
+
+
+def store_from_env():
+    """Shared bucket store configured by RATE_LIMIT_TABLE, or None"""
+    table_name = os.environ.get("RATE_LIMIT_TABLE")
+    return DynamoDBRateLimitStore(table_name) if table_name else None
+
+
+def client_key(event: Mapping[str, Any], sources: List[str]) -> str:
+    """First of the configured client identifiers present in an API Gateway proxy event"""
+    identity = (event.get("requestContext") or {}).get("identity") or {}
+    headers = {name.lower(): value for name, value in (event.get("headers") or {}).items() if value}
+    for source in sources:
+        if source == "api_key":
+            value = identity.get("apiKey") or headers.get("x-api-key")
+        elif source == "source_ip":
+            value = identity.get("sourceIp")
+        elif source.startswith("header:"):
+            value = headers.get(source[len("header:"):].lower())
+        else:
+            value = None
+        if value:
+            return f"{source.split(':')[0]}:{value}"
+    return ANONYMOUS
+
+
+def key_source(key: str) -> str:
+    """Where a client key came from: ``api_key``, ``source_ip``, ``header`` or ``anonymous``"""
+    return key.split(":", 1)[0]
+
+
+def client_label(key: str) -> str:
+    """Client key safe to export: API keys and addresses replaced by a short hash"""
+    source, _, value = key.partition(":")
+    if not value:
+        return key
+    return f"{source}:{hashlib.sha256(value.encode('utf-8')).hexdigest()[:12]}"
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        rate_per_s: Optional[float] = None,
+        burst: Optional[float] = None,
+        key_sources: str = DEFAULT_KEY_SOURCES,
+        store=None,
+        max_clients: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate_per_s = rate_per_s
+        self.burst = burst if burst is not None else max(1.0, rate_per_s or 1.0)
+        self.key_sources = [source.strip() for source in key_sources.split(",") if source.strip()]
+        self.store = store
+        self.max_clients = max_clients
+        self._clock = clock
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        rate = os.environ.get("RATE_LIMIT_PER_SECOND")
+        burst = os.environ.get("RATE_LIMIT_BURST")
+        return cls(
+            rate_per_s=float(rate) if rate else None,
+            burst=float(burst) if burst else None,
+            key_sources=os.environ.get("RATE_LIMIT_KEY", DEFAULT_KEY_SOURCES),
+            store=store_from_env() if rate else None,
+            max_clients=int(os.environ.get("RATE_LIMIT_MAX_CLIENTS", "10000")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rate_per_s)
+
+    def client_key(self, event: Mapping[str, Any]) -> str:
+        return client_key(event, self.key_sources)
+
+    def acquire(self, key: str) -> float:
+        """0 if the client may proceed, else seconds until its next token"""
+        if not self.enabled:
+            return 0.0
+        retry_after_s = self._take_local(key)
+        if retry_after_s:
+            _throttle_counter.add(1, {"source": key_source(key), "scope": "local"})
+            return retry_after_s
+        if self.store is None:
+            return 0.0
+        try:
+            retry_after_s = self.store.take(key, self.rate_per_s, self.burst)
+        except Exception as e:
+            logger.warning(f"Rate limit store unavailable, using the container's bucket only: {e}")
+            return 0.0
+        if retry_after_s:
+            _throttle_counter.add(1, {"source": key_source(key), "scope": "shared"})
+        return retry_after_s
+
+    def _take_local(self, key: str) -> float:
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_clients:
+                    # Evicting a bucket only forgets a client that was quiet for longest
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            tokens = _refill(bucket[0], bucket[1], now, self.rate_per_s, self.burst)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                return (1 - tokens) / self.rate_per_s
+            bucket[0] = tokens - 1
+            return 0.0
+
+
+def retry_after_header(retry_after_s: float) -> str:
+    """``Retry-After`` value in whole seconds, at least 1"""
+    return str(max(1, math.ceil(retry_after_s)))
@@ -0,0 +1,117 @@
+"""
+Remaining-time-aware record scheduling for the SQS worker.
+
+If a batch runs into the Lambda timeout, every record of it is retried and no
+telemetry is flushed. ``BatchScheduler`` learns how long records take, as an
+EWMA per message type, and reserves a flush budget at the end of the
+invocation. Before starting a record, the worker asks ``admit``. Once the
+projected finish of the next record passes the deadline, the remaining records
+are not started but returned as ``batchItemFailures``. They come back in a later
+invocation, so only those records are retried, and the flush still runs.
+
+The message type is the body field named by ``WORKER_MESSAGE_TYPE_FIELD``.
+Claim-check pointers are always their own type, because resolving the payload
+dominates their processing time.
+
+Configuration (environment variables):
+
+- ``WORKER_FLUSH_BUDGET_MS``: time kept free for the telemetry flush and batch bookkeeping (default 1500)
+- ``WORKER_DEFAULT_ESTIMATE_MS``: estimate for message types not seen yet (default 100)
+- ``WORKER_ESTIMATE_ALPHA``: EWMA weight of the newest observation (default 0.2)
+- ``WORKER_MESSAGE_TYPE_FIELD``: dotted body field giving the message type (e.g. ``data.priority``; optional)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from opentelemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+_meter = metrics.get_meter(__name__)
+_deferred_counter = _meter.create_counter(
+    "messaging.batch.deferred_records",
+    description="Records returned unstarted as batchItemFailures because the invocation would run out of time",
+)
+
+DEFAULT_TYPE = "default"
+CLAIM_CHECK_TYPE = "claim-check"
+
+
+class BatchScheduler:
+    def __init__(
+        self,
+        flush_budget_ms: float = 1500.0,
+        default_estimate_ms: float = 100.0,
+        alpha: float = 0.2,
+        type_field: Optional[str] = None,
+        max_types: int = 256,
+        clock=time.monotonic,
+    ):
+        self.flush_budget_ms = flush_budget_ms
+        self.default_estimate_ms = default_estimate_ms
+        self.alpha = alpha
+        self.type_field = type_field
+        self.max_types = max_types
+        self._clock = clock
+        self._estimates_ms: "OrderedDict[str, float]" = OrderedDict()
+        # The standalone consumer observes from several worker threads
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "BatchScheduler":
+        return cls(
+            flush_budget_ms=float(os.environ.get("WORKER_FLUSH_BUDGET_MS", "1500")),
+            default_estimate_ms=float(os.environ.get("WORKER_DEFAULT_ESTIMATE_MS", "100")),
+            alpha=float(os.environ.get("WORKER_ESTIMATE_ALPHA", "0.2")),
+            type_field=os.environ.get("WORKER_MESSAGE_TYPE_FIELD") or None,
+        )
+
+    def message_type(self, message_body: Any, claim_check: bool = False) -> str:
+        if claim_check:
+            return CLAIM_CHECK_TYPE
+        if not self.type_field:
+            return DEFAULT_TYPE
+        value = message_body
+        for part in self.type_field.split("."):
+            if not isinstance(value, dict):
+                return DEFAULT_TYPE
+            value = value.get(part)
+        return DEFAULT_TYPE if value is None else str(value)
+
+    def deadline(self, context) -> Optional[float]:
+        """Clock reading by which records must be finished; None without a Lambda deadline"""
+        get_remaining = getattr(context, "get_remaining_time_in_millis", None)
+        if get_remaining is None:
+            return None
+        return self._clock() + (get_remaining() - self.flush_budget_ms) / 1000
+
+    def estimate_ms(self, message_type: str) -> float:
+        return self._estimates_ms.get(message_type, self.default_estimate_ms)
+
+    def admit(self, message_type: str, deadline: Optional[float]) -> bool:
+        """Whether a record of this type is projected to finish before the deadline"""
+        if deadline is None:
+            return True
+        return self._clock() + self.estimate_ms(message_type) / 1000 <= deadline
+
+    def observe(self, message_type: str, elapsed_ms: float):
+        with self._lock:
+            previous = self._estimates_ms.pop(message_type, None)
+            if previous is None:
+                estimate = elapsed_ms
+                if len(self._estimates_ms) >= self.max_types:
+                    self._estimates_ms.popitem(last=False)
+            else:
+                estimate = self.alpha * elapsed_ms + (1 - self.alpha) * previous
+            self._estimates_ms[message_type] = estimate
+
+    def record_deferred(self, count: int, batch_size: int):
+        if not count:
+            return
+        logger.warning(f"Deferring {count} of {batch_size} records: not enough time left in this invocation")
+        _deferred_counter.add(count)
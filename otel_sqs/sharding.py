@@ -0,0 +1,183 @@
+"""
+Hash-sharded queues: spread the default lane over several SQS queues.
+
+One queue caps throughput: a FIFO queue at its per-queue send limits, and any
+queue at one hot tenant's backlog in front of everybody else. ``ShardRouter``
+sends each request to one of ``SQS_SHARD_QUEUE_URLS``, chosen by consistent
+hashing of a body field (``SQS_SHARD_KEY_FIELD``, by default the FIFO message
+group field). All requests of a key land on the same shard, which keeps FIFO
+groups in order and confines a hot tenant to one queue. Requests without the
+key are spread by request id.
+
+``HashRing`` places ``vnodes`` points per shard on a 64-bit ring, so keys split
+evenly. Adding a shard moves only about 1/N of the keys, and those all go to the
+new shard.
+
+All shards go through the caller's one SQS client. It keeps a connection pool
+per endpoint, and every queue of a region shares one endpoint. ``send_batch``
+groups bodies by shard and sends each group with ``SendMessageBatch``.
+
+Send latency is recorded per shard in ``messaging.sqs.shard.send.duration``, and
+``ApproximateNumberOfMessages`` in the ``messaging.sqs.shard.depth`` gauge. The
+gauge reports cached depths only (``otel_sqs.queue_depth``). lambda1 collects
+metrics on every request, so the callback must not call SQS. Depths older than
+``SQS_SHARD_DEPTH_REFRESH_SECONDS`` are refreshed on a background thread. On the worker side,
+``lanes_from_env`` attaches every shard as a lane of the standalone consumer. In
+Lambda, each shard has its own event source mapping.
+
+Configuration (environment variables):
+
+- ``SQS_SHARD_QUEUE_URLS``: comma-separated queue URLs of all shards (unset: ``SQS_QUEUE_URL`` only)
+- ``SQS_SHARD_KEY_FIELD``: dotted request body field hashed to pick the shard (default: ``SQS_MESSAGE_GROUP_FIELD``)
+- ``SQS_SHARD_VNODES``: ring points per shard (default 64)
+- ``SQS_SHARD_DEPTH_REFRESH_SECONDS``: how long a shard's depth is cached (default 30)
+"""
+
+import bisect
+import hashlib
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from opentelemetry import metrics
+from opentelemetry.metrics import Observation
+
+from otel_sqs.fifo import FifoAttributes, _field, send_batch
+from otel_sqs.queue_depth import QueueDepthCache
+
+logger = logging.getLogger(__name__)
+
+_meter = metrics.get_meter(__name__)
+_send_duration = _meter.create_histogram(
+    "messaging.sqs.shard.send.duration",
+    unit="ms",
+    description="SendMessage / SendMessageBatch latency per queue shard",
+)
+
+
+def shard_queue_urls_from_env() -> List[str]:
+    return [url.strip() for url in os.environ.get("SQS_SHARD_QUEUE_URLS", "").split(",") if url.strip()]
+
+
+def shard_name(queue_url: str) -> str:
+    return queue_url.rstrip("/").split("/")[-1]
+
+
+def _hash(value: str) -> int:
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes: Sequence[str], vnodes: int = 64):
+        if not nodes:
+            raise ValueError("HashRing needs at least one node")
+        self.nodes = list(nodes)
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: str) -> str:
+        """First node clockwise from the key's position on the ring"""
+        i = bisect.bisect(self._points, _hash(key))
+        return self._owners[i if i < len(self._owners) else 0]
+
+
+class ShardRouter:
+    def __init__(
+        self,
+        queue_urls: Sequence[str],
+        key_field: Optional[str] = None,
+        vnodes: int = 64,
+        sqs_client=None,
+        depth_refresh_s: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.queue_urls = list(OrderedDict.fromkeys(queue_urls))
+        self.key_field = key_field
+        self.ring = HashRing(self.queue_urls, vnodes)
+        self.sqs_client = sqs_client
+        self.depth_refresh_s = depth_refresh_s
+        self._depths = QueueDepthCache(sqs_client, depth_refresh_s, clock)
+        if self.enabled:
+            _active_routers.add(self)
+
+    @classmethod
+    def from_env(cls, default_queue_url: str, sqs_client=None) -> "ShardRouter":
+        return cls(
+            shard_queue_urls_from_env() or [default_queue_url],
+            key_field=os.environ.get("SQS_SHARD_KEY_FIELD") or os.environ.get("SQS_MESSAGE_GROUP_FIELD") or None,
+            vnodes=int(os.environ.get("SQS_SHARD_VNODES", "64")),
+            sqs_client=sqs_client,
+            depth_refresh_s=float(os.environ.get("SQS_SHARD_DEPTH_REFRESH_SECONDS", "30")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.queue_urls) > 1
+
+    def shard_key(self, body: Any, fallback_key: str) -> str:
+        value = _field(body, self.key_field)
+        return str(value) if value not in (None, "") else fallback_key
+
+    def route(self, body: Any, fallback_key: str) -> str:
+        """Queue URL of the shard a request body belongs to"""
+        if not self.enabled:
+            return self.queue_urls[0]
+        return self.ring.node_for(self.shard_key(body, fallback_key))
+
+    @contextmanager
+    def measure_send(self, queue_url: str) -> Iterator[None]:
+        """Record the duration of the send in the block against the shard"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                _send_duration.record((time.perf_counter() - start) * 1000, {"shard": shard_name(queue_url)})
+
+    def send_batch(self, bodies: Sequence[Any], fallback_keys: Sequence[str], fifo: Optional[FifoAttributes] = None) -> List[str]:
+        """Send JSON bodies grouped by shard, one SendMessageBatch per 10; message ids in input order"""
+        by_shard: "OrderedDict[str, List[int]]" = OrderedDict()
+        for i, (body, fallback_key) in enumerate(zip(bodies, fallback_keys)):
+            by_shard.setdefault(self.route(body, fallback_key), []).append(i)
+        message_ids: List[Optional[str]] = [None] * len(bodies)
+        for queue_url, indexes in by_shard.items():
+            with self.measure_send(queue_url):
+                sent = send_batch(self.sqs_client, queue_url, [bodies[i] for i in indexes], fifo)
+            for i, message_id in zip(indexes, sent):
+                message_ids[i] = message_id
+        return message_ids
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Cached ApproximateNumberOfMessages per shard; shards not read yet are left out"""
+        return {shard_name(queue_url): depth for queue_url, depth in self._depths.cached(self.queue_urls).items()}
+
+    def refresh_depths(self) -> Optional[threading.Thread]:
+        """Refresh stale shard depths on a background thread, off the request path"""
+        if self.sqs_client is None:
+            return None
+        return self._depths.refresh_in_background(self.queue_urls)
+
+
+_active_routers: "weakref.WeakSet[ShardRouter]" = weakref.WeakSet()
+
+
+def _observe_depth(options):
+    for router in list(_active_routers):
+        router.refresh_depths()
+        for shard, depth in router.queue_depths().items():
+            yield Observation(depth, {"shard": shard})
+
+
+_meter.create_observable_gauge(
+    "messaging.sqs.shard.depth",
+    callbacks=[_observe_depth],
+    unit="{message}",
+    description="Approximate number of visible messages per queue shard",
+)
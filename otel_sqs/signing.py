@@ -0,0 +1,161 @@
+"""
+SigV4 signing with cached signing keys and header fragments.
+
+botocore signs every request from scratch. It derives the signing key with
+four chained HMACs (date, region, service, ``aws4_request``), trims and joins
+every signed header, and normalizes the URL path. A warm lambda1 publishing to
+one queue repeats all of that for the same credentials, region, service, path
+and headers on every request. ``CachingSigV4Auth`` keeps the results:
+
+- signing keys per access key, secret, date, region and service, so one HMAC
+  signs a request instead of five
+- the canonical ``name:value`` lines of the headers that stay fixed for a
+  client (``host``, ``content-type``, ``x-amz-target``,
+  ``x-amz-security-token``), and the headers to sign between the canonical
+  request and the ``Authorization`` header, instead of selecting them twice
+- normalized URL paths
+
+Everything per request is still computed per request: the timestamp, the
+payload hash, the string to sign and the signature.
+
+botocore hands each request frozen credentials. The caches are keyed by the
+secret and the token, so refreshed credentials never meet a key or token line
+derived from the old ones. The caches are small LRUs, so old credentials and
+dates are evicted.
+
+``enable_signing_cache(client)`` switches a client's ``v4`` operations to
+``CachingSigV4Auth`` through botocore's ``choose-signer`` event. S3 (``s3v4``),
+presigning, operations with their own auth type (unsigned, unsigned-body,
+SigV4a, bearer) and the CRT signer, where installed, are left alone. ``create_client`` enables it unless ``AWS_CLIENT_SIGNING_CACHE`` is
+``false``.
+"""
+
+import hmac
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Hashable
+
+from botocore import auth
+from botocore.compat import ensure_unicode, quote
+from botocore.handlers import S3_SIGNING_NAMES
+from botocore.utils import normalize_url_path
+
+SIGNATURE_VERSION = "v4-cached"
+
+# Signed headers whose value stays the same for a client and its credentials
+FIXED_HEADERS = frozenset({"host", "content-type", "x-amz-target", "x-amz-security-token"})
+
+
+class _LRU:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value):
+        with self._lock:
+            self._items[key] = value
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+_signing_keys = _LRU(16)
+_header_lines = _LRU(256)
+_paths = _LRU(256)
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), sha256).digest()
+
+
+def signing_key(access_key: str, secret_key: str, date: str, region: str, service: str) -> bytes:
+    """Derived SigV4 key for ``date`` (YYYYMMDD), computed once per credentials, date, region and service"""
+    cache_key = (access_key, secret_key, date, region, service)
+    key = _signing_keys.get(cache_key)
+    if key is None:
+        key = _hmac(_hmac(_hmac(_hmac(f"AWS4{secret_key}".encode("utf-8"), date), region), service), "aws4_request")
+        _signing_keys.put(cache_key, key)
+    return key
+
+
+def clear_caches():
+    _signing_keys.clear()
+    _header_lines.clear()
+    _paths.clear()
+
+
+class CachingSigV4Auth(auth.SigV4Auth):
+    def add_auth(self, request):
+        # Re-signing (retries) must select the headers again
+        self._headers_to_sign = None
+        super().add_auth(request)
+
+    def headers_to_sign(self, request):
+        # Called for the canonical request and again for the Authorization header
+        headers = getattr(self, "_headers_to_sign", None)
+        if headers is None:
+            headers = self._headers_to_sign = super().headers_to_sign(request)
+        return headers
+
+    def canonical_headers(self, headers_to_sign):
+        lines = []
+        for name in sorted(set(headers_to_sign)):
+            values = headers_to_sign.get_all(name)
+            if name in FIXED_HEADERS and len(values) == 1:
+                line = _header_lines.get((name, values[0]))
+                if line is None:
+                    line = f"{name}:{ensure_unicode(self._header_value(values[0]))}"
+                    _header_lines.put((name, values[0]), line)
+            else:
+                line = f"{name}:{ensure_unicode(','.join(self._header_value(value) for value in values))}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def _normalize_url_path(self, path):
+        normalized = _paths.get(path)
+        if normalized is None:
+            normalized = quote(normalize_url_path(path), safe="/~")
+            _paths.put(path, normalized)
+        return normalized
+
+    def signature(self, string_to_sign, request):
+        key = signing_key(
+            self.credentials.access_key, self.credentials.secret_key,
+            request.context["timestamp"][0:8], self._region_name, self._service_name,
+        )
+        return hmac.new(key, string_to_sign.encode("utf-8"), sha256).hexdigest()
+
+
+def _choose_signer(signing_name=None, signature_version=None, context=None, **kwargs):
+    # Operations with their own auth type (none, v4-unsigned-body, v4a, bearer) keep botocore's choice
+    if context and context.get("auth_type"):
+        return None
+    if signature_version == "v4" and signing_name not in S3_SIGNING_NAMES:
+        return SIGNATURE_VERSION
+    return None
+
+
+def enable_signing_cache(client) -> bool:
+    """Sign the client's SigV4 operations with ``CachingSigV4Auth``; False if botocore uses another v4 signer"""
+    if auth.AUTH_TYPE_MAPS.get("v4") is not auth.SigV4Auth:
+        return False
+    auth.AUTH_TYPE_MAPS.setdefault(SIGNATURE_VERSION, CachingSigV4Auth)
+    # Ahead of botocore's operation-specific choice, which returns plain v4 for these
+    client.meta.events.register_first("choose-signer", _choose_signer, unique_id="otel-sqs-signing-cache")
+    return True
+
@@ -0,0 +1,317 @@
+"""
+Request body validation for the API handler.
+
+lambda1 used to enqueue any JSON body. A malformed one was only found in
+lambda2, after paying for the SQS send, the worker invocation and its retries.
+``RequestValidator`` checks the ``/process`` body against a declarative
+schema and rejects bad requests with 400 and the path of every error, e.g.
+``$.data.items[2].sku``.
+
+The schema is compiled once, at init, into nested closures: every keyword
+becomes one check, and every ``properties``/``items`` entry a child validator.
+A request then runs only those checks, with no dict lookups of schema keywords.
+Supported is the JSON Schema subset that payload checks need:
+
+- ``type`` (one or a list of ``object``, ``array``, ``string``, ``integer``,
+  ``number``, ``boolean``, ``null``), ``enum``, ``const``
+- objects: ``properties``, ``required``, ``additionalProperties`` (bool or schema),
+  ``minProperties``, ``maxProperties``
+- arrays: ``items``, ``minItems``, ``maxItems``
+- strings: ``minLength``, ``maxLength``, ``pattern``
+- numbers: ``minimum``, ``maximum``, ``exclusiveMinimum``, ``exclusiveMaximum``
+
+Annotations (``title``, ``description``, ...) are ignored. Any other keyword
+fails at compile time, so a schema is never silently only half enforced.
+
+Validation time goes to ``http.server.request.validation.duration``, and
+rejections to ``http.server.request.validation.rejected`` by the keyword of
+the first error.
+
+Configuration (environment variables):
+
+- ``REQUEST_SCHEMA_PATH``: JSON schema file, relative to the function's directory (unset: no validation)
+- ``REQUEST_SCHEMA``: the schema inline, as JSON
+- ``REQUEST_SCHEMA_MAX_ERRORS``: errors reported per request (default 10)
+"""
+
+import json
+import os
+import re
+import time
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional
+
+from opentelemetry import metrics
+
+_meter = metrics.get_meter(__name__)
+_validation_duration = _meter.create_histogram(
+    "http.server.request.validation.duration",
+    unit="ms",
+    description="Time spent validating API request bodies",
+)
+_rejected_counter = _meter.create_counter(
+    "http.server.request.validation.rejected",
+    description="API requests rejected with 400 by the keyword of their first error",
+)
+
+_ANNOTATIONS = {"$schema", "$id", "$comment", "title", "description", "default", "examples"}
+
+_TYPES: Dict[str, Callable[[Any], bool]] = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None,
+}
+
+
+class ValidationError(NamedTuple):
+    path: str
+    keyword: str
+    message: str
+
+    def as_dict(self) -> Dict[str, str]:
+        return {"path": self.path, "keyword": self.keyword, "message": self.message}
+
+
+class _TooManyErrors(Exception):
+    pass
+
+
+# A compiled validator appends errors for ``value`` found at ``path``
+Validator = Callable[[Any, str, List[ValidationError]], None]
+
+
+def _report(errors: List[ValidationError], limit: int, error: ValidationError):
+    errors.append(error)
+    if len(errors) >= limit:
+        raise _TooManyErrors()
+
+
+def compile_schema(schema: Mapping[str, Any], max_errors: int = 10) -> Validator:
+    """Turn a schema into a validator; raises ValueError for unsupported keywords"""
+    if not isinstance(schema, dict):
+        raise ValueError(f"Schema must be an object, got {type(schema).__name__}")
+    unsupported = set(schema) - _ANNOTATIONS - _KEYWORDS
+    if unsupported:
+        raise ValueError(f"Unsupported schema keywords: {', '.join(sorted(unsupported))}")
+
+    checks: List[Validator] = []
+    type_check = None
+    if "type" in schema:
+        names = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        try:
+            predicates = [_TYPES[name] for name in names]
+        except KeyError as e:
+            raise ValueError(f"Unknown type {e.args[0]!r}") from None
+        expected = " or ".join(names)
+
+        def type_check(value, path, errors):
+            for predicate in predicates:
+                if predicate(value):
+                    return True
+            _report(errors, max_errors, ValidationError(path, "type", f"expected {expected}"))
+            return False
+
+    for keyword, compile_keyword in _KEYWORD_COMPILERS:
+        if keyword in schema:
+            checks.append(compile_keyword(schema, max_errors))
+
+    if type_check is None:
+        def validate(value, path, errors):
+            for check in checks:
+                check(value, path, errors)
+    else:
+        def validate(value, path, errors):
+            # Keyword checks assume the declared type
+            if type_check(value, path, errors):
+                for check in checks:
+                    check(value, path, errors)
+
+    return validate
+
+
+def _equal(value: Any, expected: Any) -> bool:
+    # JSON has no booleans among its numbers: true is not 1
+    return value == expected and isinstance(value, bool) == isinstance(expected, bool)
+
+
+def _compile_enum(schema, max_errors):
+    allowed = schema["enum"]
+    message = f"must be one of {', '.join(json.dumps(item) for item in allowed)}"
+
+    def check(value, path, errors):
+        if not any(_equal(value, item) for item in allowed):
+            _report(errors, max_errors, ValidationError(path, "enum", message))
+
+    return check
+
+
+def _compile_const(schema, max_errors):
+    expected = schema["const"]
+    message = f"must be {json.dumps(expected)}"
+
+    def check(value, path, errors):
+        if not _equal(value, expected):
+            _report(errors, max_errors, ValidationError(path, "const", message))
+
+    return check
+
+
+def _compile_properties(schema, max_errors):
+    children = [(name, compile_schema(child, max_errors)) for name, child in schema["properties"].items()]
+
+    def check(value, path, errors):
+        if isinstance(value, dict):
+            for name, validate in children:
+                if name in value:
+                    validate(value[name], f"{path}.{name}", errors)
+
+    return check
+
+
+def _compile_required(schema, max_errors):
+    required = list(schema["required"])
+
+    def check(value, path, errors):
+        if isinstance(value, dict):
+            for name in required:
+                if name not in value:
+                    _report(errors, max_errors, ValidationError(f"{path}.{name}", "required", "is required"))
+
+    return check
+
+
+def _compile_additional_properties(schema, max_errors):
+    known = frozenset(schema.get("properties", {}))
+    additional = schema["additionalProperties"]
+    if additional is True:
+        return lambda value, path, errors: None
+    validate_extra = compile_schema(additional, max_errors) if isinstance(additional, dict) else None
+
+    def check(value, path, errors):
+        if isinstance(value, dict):
+            for name in value:
+                if name in known:
+                    continue
+                if validate_extra is None:
+                    _report(errors, max_errors, ValidationError(f"{path}.{name}", "additionalProperties", "is not allowed"))
+                else:
+                    validate_extra(value[name], f"{path}.{name}", errors)
+
+    return check
+
+
+def _compile_items(schema, max_errors):
+    validate_item = compile_schema(schema["items"], max_errors)
+
+    def check(value, path, errors):
+        if isinstance(value, list):
+            for i, item in enumerate(value):
+                validate_item(item, f"{path}[{i}]", errors)
+
+    return check
+
+
+def _compile_size(keyword: str, kind: type, minimum: bool, unit: str):
+    def compile_size(schema, max_errors):
+        bound = schema[keyword]
+        message = f"must have {'at least' if minimum else 'at most'} {bound} {unit}"
+
+        def check(value, path, errors):
+            if isinstance(value, kind) and (len(value) < bound if minimum else len(value) > bound):
+                _report(errors, max_errors, ValidationError(path, keyword, message))
+
+        return check
+
+    return compile_size
+
+
+def _compile_pattern(schema, max_errors):
+    regex = re.compile(schema["pattern"])
+    message = f"must match {schema['pattern']}"
+
+    def check(value, path, errors):
+        if isinstance(value, str) and regex.search(value) is None:
+            _report(errors, max_errors, ValidationError(path, "pattern", message))
+
+    return check
+
+
+def _compile_bound(keyword: str, fails: Callable[[float, float], bool], relation: str):
+    def compile_bound(schema, max_errors):
+        bound = schema[keyword]
+        message = f"must be {relation} {bound}"
+
+        def check(value, path, errors):
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and fails(value, bound):
+                _report(errors, max_errors, ValidationError(path, keyword, message))
+
+        return check
+
+    return compile_bound
+
+
+_KEYWORD_COMPILERS = [
+    ("enum", _compile_enum),
+    ("const", _compile_const),
+    ("required", _compile_required),
+    ("properties", _compile_properties),
+    ("additionalProperties", _compile_additional_properties),
+    ("minProperties", _compile_size("minProperties", dict, True, "properties")),
+    ("maxProperties", _compile_size("maxProperties", dict, False, "properties")),
+    ("items", _compile_items),
+    ("minItems", _compile_size("minItems", list, True, "items")),
+    ("maxItems", _compile_size("maxItems", list, False, "items")),
+    ("minLength", _compile_size("minLength", str, True, "characters")),
+    ("maxLength", _compile_size("maxLength", str, False, "characters")),
+    ("pattern", _compile_pattern),
+    ("minimum", _compile_bound("minimum", lambda value, bound: value < bound, ">=")),
+    ("maximum", _compile_bound("maximum", lambda value, bound: value > bound, "<=")),
+    ("exclusiveMinimum", _compile_bound("exclusiveMinimum", lambda value, bound: value <= bound, ">")),
+    ("exclusiveMaximum", _compile_bound("exclusiveMaximum", lambda value, bound: value >= bound, "<")),
+]
+_KEYWORDS = {"type"} | {keyword for keyword, _ in _KEYWORD_COMPILERS}
+
+
+class RequestValidator:
+    def __init__(self, schema: Optional[Mapping[str, Any]] = None, max_errors: int = 10):
+        self.schema = schema
+        self.max_errors = max_errors
+        self._validate = compile_schema(schema, max_errors) if schema is not None else None
+
+    @classmethod
+    def from_env(cls, base_dir: Optional[str] = None) -> "RequestValidator":
+        max_errors = int(os.environ.get("REQUEST_SCHEMA_MAX_ERRORS", "10"))
+        inline = os.environ.get("REQUEST_SCHEMA")
+        if inline:
+            return cls(json.loads(inline), max_errors)
+        path = os.environ.get("REQUEST_SCHEMA_PATH")
+        if path:
+            with open(os.path.join(base_dir or os.getcwd(), path)) as f:
+                return cls(json.load(f), max_errors)
+        return cls(None, max_errors)
+
+    @property
+    def enabled(self) -> bool:
+        return self._validate is not None
+
+    def validate(self, body: Any) -> List[ValidationError]:
+        """Errors in the request body, empty if it is valid (or validation is off)"""
+        if self._validate is None:
+            return []
+        start = time.perf_counter()
+        errors: List[ValidationError] = []
+        try:
+            self._validate(body, "$", errors)
+        except _TooManyErrors:
+            pass
+        _validation_duration.record((time.perf_counter() - start) * 1000)
+        if errors:
+            _rejected_counter.add(1, {"keyword": errors[0].keyword})
+        return errors
+
+    def record_malformed(self):
+        """Count a body that is not JSON at all"""
+        _rejected_counter.add(1, {"keyword": "json"})
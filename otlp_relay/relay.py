@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Local OTLP/HTTP batching relay, shipped as an external Lambda extension.
+
+Replaces the OTel Collector layer for the community configs: the function keeps
+exporting to ``localhost:4318`` (a loopback POST that returns immediately) and
+the relay merges those requests across invocations into large gzip batches.
+Batches are forwarded while the next invocation runs or on ``SHUTDOWN``, so the
+upstream round trip never sits in front of a function response.
+
+Only the standard library is used so the layer has no dependencies.
+
+Configuration (environment variables):
+
+- ``OTLP_RELAY_ENDPOINT``: upstream OTLP/HTTP base URL, e.g. ``https://otlp.eu01.nr-data.net``
+- ``OTLP_RELAY_HEADERS``: upstream headers as ``key1=value1,key2=value2``
+  (defaults to ``OTEL_EXPORTER_OTLP_HEADERS``)
+- ``OTLP_RELAY_PORT``: local listen port (default 4318)
+- ``OTLP_RELAY_MAX_BYTES``: forward once this much uncompressed data is buffered (default 1 MiB)
+- ``OTLP_RELAY_MAX_AGE_SECONDS``: forward once the oldest request is this old (default 30)
+- ``OTLP_RELAY_MEMORY_CAP_BYTES``: requests beyond this are rejected with 429 (default 16 MiB)
+- ``OTLP_RELAY_COMPRESSION_LEVEL``: gzip level for forwarded batches (default 6)
+- ``OTLP_RELAY_TIMEOUT_SECONDS``: upstream request timeout (default 10)
+"""
+
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+EXTENSION_NAME = "otlp-relay"
+SIGNAL_PATHS = ("/v1/traces", "/v1/metrics", "/v1/logs")
+PROTOBUF_CONTENT_TYPE = "application/x-protobuf"
+
+logger = logging.getLogger(EXTENSION_NAME)
+
+
+class BatchBuffer:
+    """Buffered OTLP request bodies per signal path
+
+    Every OTLP ``Export*ServiceRequest`` consists of a single repeated field, and
+    protobuf parses concatenated messages as one message with repeated fields
+    appended. Merging requests is therefore plain byte concatenation - no
+    decoding or re-encoding is needed.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 1024 * 1024,
+        max_age_s: float = 30.0,
+        memory_cap_bytes: int = 16 * 1024 * 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.memory_cap_bytes = memory_cap_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._chunks: Dict[str, List[bytes]] = {}
+        self._bytes = 0
+        self._oldest = 0.0
+
+        # Loss accounting
+        self.accepted_requests = 0
+        self.rejected_requests = 0
+        self.dropped_bytes = 0
+
+    @property
+    def buffered_bytes(self) -> int:
+        return self._bytes
+
+    def add(self, path: str, body: bytes) -> bool:
+        """Buffer one request body; False if it would exceed the memory cap"""
+        with self._lock:
+            if self._bytes + len(body) > self.memory_cap_bytes:
+                self.rejected_requests += 1
+                self.dropped_bytes += len(body)
+                return False
+            if not self._bytes:
+                self._oldest = self._clock()
+            self._chunks.setdefault(path, []).append(body)
+            self._bytes += len(body)
+            self.accepted_requests += 1
+            return True
+
+    def due(self) -> bool:
+        with self._lock:
+            if not self._bytes:
+                return False
+            return self._bytes >= self.max_bytes or self._clock() - self._oldest >= self.max_age_s
+
+    def drain(self) -> Dict[str, List[bytes]]:
+        """Take everything buffered, grouped by signal path"""
+        with self._lock:
+            chunks, self._chunks, self._bytes = self._chunks, {}, 0
+            return chunks
+
+    def restore(self, path: str, chunks: List[bytes]):
+        """Put back a batch whose forward failed, dropping it if the cap is reached"""
+        size = sum(len(chunk) for chunk in chunks)
+        with self._lock:
+            if self._bytes + size > self.memory_cap_bytes:
+                self.dropped_bytes += size
+                logger.warning(f"Dropping {size} bytes for {path}: buffer full after failed forward")
+                return
+            if not self._bytes:
+                self._oldest = self._clock()
+            self._chunks[path] = chunks + self._chunks.get(path, [])
+            self._bytes += size
+
+
+class Forwarder:
+    """Sends merged batches upstream as a single gzip request per signal"""
+
+    def __init__(self, endpoint: str, headers: Dict[str, str], timeout_s: float = 10.0, level: int = 6):
+        self.endpoint = endpoint.rstrip("/")
+        self.headers = dict(headers)
+        self.headers["Content-Type"] = PROTOBUF_CONTENT_TYPE
+        self.headers["Content-Encoding"] = "gzip"
+        self.timeout_s = timeout_s
+        self.level = level
+
+    def compress(self, chunks: List[bytes]) -> bytes:
+        # wbits=31 selects the gzip container; chunks are fed without joining first
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        parts = [compressor.compress(chunk) for chunk in chunks]
+        parts.append(compressor.flush())
+        return b"".join(parts)
+
+    def send(self, path: str, chunks: List[bytes]) -> bool:
+        body = self.compress(chunks)
+        request = urllib.request.Request(
+            self.endpoint + path, data=body, headers=self.headers, method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout_s) as response:
+                return 200 <= response.status < 300
+        except urllib.error.HTTPError as e:
+            logger.warning(f"Upstream rejected {path} batch: {e.code} {e.reason}")
+        except (urllib.error.URLError, OSError) as e:
+            logger.warning(f"Upstream {path} forward failed: {e}")
+        return False
+
+
+class Relay:
+    def __init__(self, buffer: BatchBuffer, forwarder: Forwarder):
+        self.buffer = buffer
+        self.forwarder = forwarder
+        self._flush_lock = threading.Lock()
+
+    def flush(self):
+        """Forward everything buffered; failed batches are kept for the next flush"""
+        with self._flush_lock:
+            for path, chunks in self.buffer.drain().items():
+                start = time.perf_counter()
+                if self.forwarder.send(path, chunks):
+                    logger.info(
+                        f"Forwarded {len(chunks)} requests to {path} "
+                        f"in {(time.perf_counter() - start) * 1000:.1f}ms"
+                    )
+                else:
+                    self.buffer.restore(path, chunks)
+
+    def flush_if_due(self):
+        if self.buffer.due():
+            self.flush()
+
+
+def make_request_handler(buffer: BatchBuffer):
+    class OTLPRequestHandler(BaseHTTPRequestHandler):
+        # Keep-alive so the exporter's requests.Session reuses one loopback connection
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path not in SIGNAL_PATHS:
+                return self._respond(404)
+            if not self.headers.get("Content-Type", "").startswith(PROTOBUF_CONTENT_TYPE):
+                return self._respond(415)
+
+            encoding = self.headers.get("Content-Encoding", "").lower()
+            try:
+                if encoding == "gzip":
+                    body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+                elif encoding == "deflate":
+                    body = zlib.decompress(body)
+            except zlib.error:
+                return self._respond(400)
+
+            # 429 is not retried by the OTLP exporter, so a full buffer never blocks the handler
+            self._respond(200 if buffer.add(self.path, body) else 429)
+
+        def _respond(self, status: int):
+            self.send_response(status)
+            self.send_header("Content-Type", PROTOBUF_CONTENT_TYPE)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            # Per-request access logs would end up in every invocation's log stream
+            pass
+
+    return OTLPRequestHandler
+
+
+class ExtensionsClient:
+    """Minimal client for the Lambda Extensions API"""
+
+    def __init__(self, runtime_api: str):
+        self.base_url = f"http://{runtime_api}/2020-01-01/extension"
+        self.extension_id: Optional[str] = None
+
+    def register(self, events: List[str]):
+        request = urllib.request.Request(
+            f"{self.base_url}/register",
+            data=json.dumps({"events": events}).encode(),
+            headers={"Lambda-Extension-Name": EXTENSION_NAME},
+            method="POST",
+        )
+        with urllib.request.urlopen(request) as response:
+            self.extension_id = response.headers["Lambda-Extension-Identifier"]
+
+    def next_event(self) -> dict:
+        request = urllib.request.Request(
+            f"{self.base_url}/event/next",
+            headers={"Lambda-Extension-Identifier": self.extension_id},
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+
+def run_extension(relay: Relay, client: ExtensionsClient):
+    client.register(["INVOKE", "SHUTDOWN"])
+    logger.info("Registered with the Extensions API")
+    forwarding: Optional[threading.Thread] = None
+    while True:
+        # Calling next lets the environment freeze, so never leave a forward half-sent
+        if forwarding is not None:
+            forwarding.join()
+            forwarding = None
+
+        event = client.next_event()
+        if event.get("eventType") == "SHUTDOWN":
+            relay.flush()
+            logger.info(
+                f"Shutdown: accepted={relay.buffer.accepted_requests}, "
+                f"rejected={relay.buffer.rejected_requests}, dropped_bytes={relay.buffer.dropped_bytes}"
+            )
+            return
+
+        # An invocation just started: forward earlier batches while the function runs
+        if relay.buffer.due():
+            forwarding = threading.Thread(target=relay.flush, daemon=True)
+            forwarding.start()
+
+
+def run_standalone(relay: Relay, stop: threading.Event):
+    """Outside Lambda there is no event loop; forward on the age threshold"""
+    while not stop.wait(1.0):
+        relay.flush_if_due()
+    relay.flush()
+
+
+def parse_headers(headers_str: str) -> Dict[str, str]:
+    headers = {}
+    for header in headers_str.split(","):
+        if "=" in header:
+            key, value = header.split("=", 1)
+            headers[key.strip()] = value.strip()
+    return headers
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format=f"[{EXTENSION_NAME}] %(message)s")
+
+    endpoint = os.environ.get("OTLP_RELAY_ENDPOINT")
+    if not endpoint:
+        logger.error("OTLP_RELAY_ENDPOINT is not set")
+        sys.exit(1)
+
+    buffer = BatchBuffer(
+        max_bytes=int(os.environ.get("OTLP_RELAY_MAX_BYTES", str(1024 * 1024))),
+        max_age_s=float(os.environ.get("OTLP_RELAY_MAX_AGE_SECONDS", "30")),
+        memory_cap_bytes=int(os.environ.get("OTLP_RELAY_MEMORY_CAP_BYTES", str(16 * 1024 * 1024))),
+    )
+    forwarder = Forwarder(
+        endpoint,
+        parse_headers(os.environ.get("OTLP_RELAY_HEADERS", os.environ.get("OTEL_EXPORTER_OTLP_HEADERS", ""))),
+        timeout_s=float(os.environ.get("OTLP_RELAY_TIMEOUT_SECONDS", "10")),
+        level=int(os.environ.get("OTLP_RELAY_COMPRESSION_LEVEL", "6")),
+    )
+    relay = Relay(buffer, forwarder)
+
+    port = int(os.environ.get("OTLP_RELAY_PORT", "4318"))
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_request_handler(buffer))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="otlp-relay-http", daemon=True).start()
+    logger.info(f"Listening on 127.0.0.1:{port}, forwarding to {forwarder.endpoint}")
+
+    runtime_api = os.environ.get("AWS_LAMBDA_RUNTIME_API")
+    if runtime_api:
+        run_extension(relay, ExtensionsClient(runtime_api))
+    else:
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+        run_standalone(relay, stop)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
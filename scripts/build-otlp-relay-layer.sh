@@ -0,0 +1,56 @@
+#!/bin/bash
+
+# Script to build the OTLP relay extension layer
+# Lightweight Python replacement for the OpenTelemetry Collector layer:
+# receives OTLP/HTTP on localhost:4318 and forwards merged gzip batches
+
+set -e
+
+LAYER_NAME="otlp-relay"
+REGION="eu-central-1"
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
+
+echo "Building OTLP relay layer..."
+
+# Copy the relay source (standard library only, no dependencies to install)
+mkdir -p build/opt/otlp_relay
+cp "$SCRIPT_DIR/../otlp_relay/relay.py" build/opt/otlp_relay/relay.py
+
+# Create launcher for Lambda extension (name has to match the filename)
+mkdir -p build/opt/extensions
+cat > build/opt/extensions/otlp-relay << 'EOF'
+#!/bin/bash
+
+# OTLP relay Lambda Extension
+exec python3 -u /opt/otlp_relay/relay.py
+EOF
+
+# Make launcher executable
+chmod +x build/opt/extensions/otlp-relay
+
+# Create zip file
+cd build
+zip -r ../otlp-relay-layer.zip opt
+
+cd ..
+echo "Layer zip created: otlp-relay-layer.zip"
+
+# Publish layer to AWS
+echo "Publishing relay layer to AWS..."
+LAYER_ARN=$(aws lambda publish-layer-version \
+    --layer-name $LAYER_NAME \
+    --zip-file fileb://otlp-relay-layer.zip \
+    --compatible-runtimes python3.9 python3.10 python3.11 python3.12 \
+    --compatible-architectures x86_64 arm64 \
+    --description "OTLP batching relay extension" \
+    --region $REGION \
+    --profile ProjectAdmin-339712788047 \
+    --query 'LayerVersionArn' \
+    --output text)
+
+echo "Layer published: $LAYER_ARN"
+
+# Clean up
+rm -rf build otlp-relay-layer.zip
+
+echo "Relay layer ARN: $LAYER_ARN"
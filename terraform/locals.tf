@@ -9,6 +9,9 @@ locals {
 
     community_otel_auto      = "arn:aws:lambda:eu-central-1:339712788047:layer:opentelemetry-python-auto:1"
     community_otel_collector = "arn:aws:lambda:eu-central-1:339712788047:layer:opentelemetry-collector:1"
+
+    # Lightweight Python OTLP relay extension (scripts/build-otlp-relay-layer.sh), alternative to the collector layer
+    community_otlp_relay = "arn:aws:lambda:eu-central-1:339712788047:layer:otlp-relay:1"
   }
 
   # Configuration-specific settings
@@ -71,6 +74,31 @@ locals {
       ]
     }
 
+    # Configuration 2b: community OpenTelemetry exporting to the OTLP relay extension on localhost,
+    # which batches across invocations and forwards to New Relic off the response path
+    newrelic_community_relay = {
+      layers = [local.layer_arns.community_otlp_relay]
+      environment_variables = {
+        OTEL_PYTHON_DISABLED_INSTRUMENTATIONS = ""
+        OTEL_PYTHON_LOG_CORRELATION           = "true"
+        OTEL_PROPAGATORS                      = "tracecontext,baggage"
+        OTEL_SERVICE_VERSION                  = "1.0.0"
+        OTEL_TRACES_EXPORTER                  = "otlp"
+        OTEL_METRICS_EXPORTER                 = "otlp"
+        OTEL_LOGS_EXPORTER                    = "otlp"
+        # Loopback export to the relay; the license key is only given to the relay
+        OTEL_EXPORTER_OTLP_ENDPOINT         = "http://localhost:4318"
+        OTEL_EXPORTER_OTLP_TRACES_ENDPOINT  = "http://localhost:4318/v1/traces"
+        OTEL_EXPORTER_OTLP_METRICS_ENDPOINT = "http://localhost:4318/v1/metrics"
+        OTEL_EXPORTER_OTLP_PROTOCOL         = "http/protobuf"
+        # Relay upstream (otlp_relay/relay.py)
+        OTLP_RELAY_ENDPOINT  = "https://otlp.eu01.nr-data.net"
+        OTLP_RELAY_HEADERS   = "api-key=${var.newrelic_license_key}"
+        NEW_RELIC_ACCOUNT_ID = var.newrelic_account_id
+      }
+      iam_permissions = []
+    }
+
     # Configuration 3: New Relic native Lambda layer (APM mode)
     newrelic_native = {
       layers = ["arn:aws:lambda:eu-central-1:451483290750:layer:NewRelicPython39:107"]
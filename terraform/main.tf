@@ -61,6 +61,38 @@ module "lambda_otel" {
   sqs_batch_size = 10
   api_stage_name = var.environment
 
+  # Claim check for oversized SQS payloads
+  enable_claim_check = var.enable_claim_check
+
+  # Persistent idempotency keys
+  enable_idempotency_table = var.enable_idempotency_table
+
+  # Per-priority queues, each with its own share of worker concurrency
+  priority_lanes = var.priority_lanes
+  priority_field = var.priority_field
+
+  # Refuse or degrade API requests once the worker falls too far behind
+  admission_control   = var.admission_control
+  admission_max_depth = var.admission_max_depth
+
+  # Per-client token buckets in the API handler
+  rate_limit_per_second    = var.rate_limit_per_second
+  rate_limit_burst         = var.rate_limit_burst
+  rate_limit_key           = var.rate_limit_key
+  enable_shared_rate_limit = var.enable_shared_rate_limit
+
+  # Validate /process bodies against a precompiled schema before enqueueing
+  request_schema_path = var.request_schema_path
+
+  # FIFO queues with ordered, group-parallel processing
+  fifo_queue               = var.fifo_queue
+  fifo_message_group_field = var.fifo_message_group_field
+  fifo_deduplication_field = var.fifo_deduplication_field
+
+  # Hash-shard the default lane over several queues
+  queue_shards    = var.queue_shards
+  shard_key_field = var.shard_key_field
+
   # IAM permissions from observability config
   additional_iam_permissions = local.current_config.iam_permissions
 
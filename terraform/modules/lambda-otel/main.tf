@@ -36,7 +36,7 @@ resource "aws_lambda_function" "lambda1" {
   }
 
   environment {
-    variables = var.lambda1_environment_variables
+    variables = merge(var.lambda1_environment_variables, local.claim_check_env_vars, local.idempotency_env_vars, local.priority_lane_env_vars, local.admission_env_vars, local.rate_limit_env_vars, local.request_validation_env_vars, local.fifo_env_vars, local.shard_env_vars)
   }
 
   tags = var.tags
@@ -61,7 +61,7 @@ resource "aws_lambda_function" "lambda2" {
   }
 
   environment {
-    variables = var.lambda2_environment_variables
+    variables = merge(var.lambda2_environment_variables, local.claim_check_env_vars, local.idempotency_env_vars, local.fifo_worker_env_vars)
   }
 
   tags = var.tags
@@ -84,19 +84,188 @@ resource "aws_cloudwatch_log_group" "lambda2_logs" {
 
 # SQS Queue for message processing
 resource "aws_sqs_queue" "message_queue" {
-  name                       = "${var.project_name}-${var.environment}-queue"
+  name                       = "${var.project_name}-${var.environment}-queue${local.queue_suffix}"
   visibility_timeout_seconds = var.sqs_visibility_timeout
 
+  # FIFO: order and deduplication per message group, with per-group throughput limits
+  fifo_queue            = var.fifo_queue ? true : null
+  deduplication_scope   = var.fifo_queue ? "messageGroup" : null
+  fifo_throughput_limit = var.fifo_queue ? "perMessageGroupId" : null
+
   tags = var.tags
 }
 
+# Priority lanes: one queue per lane besides the default queue
+resource "aws_sqs_queue" "lane_queue" {
+  for_each = var.priority_lanes
+
+  name                       = "${var.project_name}-${var.environment}-${each.key}${local.queue_suffix}"
+  visibility_timeout_seconds = var.sqs_visibility_timeout
+
+  fifo_queue            = var.fifo_queue ? true : null
+  deduplication_scope   = var.fifo_queue ? "messageGroup" : null
+  fifo_throughput_limit = var.fifo_queue ? "perMessageGroupId" : null
+
+  tags = var.tags
+}
+
+# Shards of the default lane besides message_queue; lambda1 picks one by consistent hashing
+resource "aws_sqs_queue" "shard_queue" {
+  count = var.queue_shards - 1
+
+  name                       = "${var.project_name}-${var.environment}-queue-${count.index + 1}${local.queue_suffix}"
+  visibility_timeout_seconds = var.sqs_visibility_timeout
+
+  fifo_queue            = var.fifo_queue ? true : null
+  deduplication_scope   = var.fifo_queue ? "messageGroup" : null
+  fifo_throughput_limit = var.fifo_queue ? "perMessageGroupId" : null
+
+  tags = var.tags
+}
+
+locals {
+  # SQS requires the .fifo suffix on FIFO queue names
+  queue_suffix = var.fifo_queue ? ".fifo" : ""
+
+  queue_arns = concat([aws_sqs_queue.message_queue.arn], [for queue in values(aws_sqs_queue.lane_queue) : queue.arn], aws_sqs_queue.shard_queue[*].arn)
+
+  shard_env_vars = var.queue_shards > 1 ? merge({
+    SQS_SHARD_QUEUE_URLS = join(",", concat([aws_sqs_queue.message_queue.url], aws_sqs_queue.shard_queue[*].url))
+  }, var.shard_key_field != "" ? {
+    SQS_SHARD_KEY_FIELD = var.shard_key_field
+  } : {}) : {}
+
+  priority_lane_env_vars = length(var.priority_lanes) > 0 ? {
+    SQS_PRIORITY_QUEUE_URLS = join(",", [for name, queue in aws_sqs_queue.lane_queue : "${name}=${queue.url}"])
+    SQS_PRIORITY_FIELD      = var.priority_field
+  } : {}
+
+  # Path inside the lambda1 package, e.g. request_schema.json
+  request_validation_env_vars = var.request_schema_path != "" ? {
+    REQUEST_SCHEMA_PATH = var.request_schema_path
+  } : {}
+
+  # lambda1 already has sqs:GetQueueAttributes on every queue it sends to
+  admission_env_vars = var.admission_control != "" ? {
+    ADMISSION_CONTROL   = var.admission_control
+    ADMISSION_MAX_DEPTH = tostring(var.admission_max_depth)
+  } : {}
+
+  # lambda1 sets MessageGroupId / MessageDeduplicationId only when sending to a .fifo queue
+  fifo_env_vars = var.fifo_queue ? merge({
+    SQS_MESSAGE_GROUP_FIELD = var.fifo_message_group_field
+  }, var.fifo_deduplication_field != "" ? {
+    SQS_DEDUPLICATION_FIELD = var.fifo_deduplication_field
+  } : {}) : {}
+
+  fifo_worker_env_vars = var.fifo_queue ? {
+    WORKER_FIFO_GROUP_CONCURRENCY = tostring(var.fifo_group_concurrency)
+  } : {}
+}
+
 # Dead Letter Queue
 resource "aws_sqs_queue" "dlq" {
-  name = "${var.project_name}-${var.environment}-dlq"
+  name = "${var.project_name}-${var.environment}-dlq${local.queue_suffix}"
+
+  # A FIFO queue's dead letter queue must be FIFO as well
+  fifo_queue = var.fifo_queue ? true : null
+
+  tags = var.tags
+}
+
+# S3 bucket for claim-check payloads (SQS bodies above 256 KB)
+resource "aws_s3_bucket" "claim_check" {
+  count         = var.enable_claim_check ? 1 : 0
+  bucket_prefix = "${var.project_name}-${var.environment}-claim-check-"
+  force_destroy = true
 
   tags = var.tags
 }
 
+# Safety net for objects of messages that were never processed successfully
+resource "aws_s3_bucket_lifecycle_configuration" "claim_check" {
+  count  = var.enable_claim_check ? 1 : 0
+  bucket = aws_s3_bucket.claim_check[0].id
+
+  rule {
+    id     = "expire-claim-checks"
+    status = "Enabled"
+
+    filter {}
+
+    expiration {
+      days = var.claim_check_expiration_days
+    }
+
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
+}
+
+locals {
+  claim_check_env_vars = var.enable_claim_check ? {
+    CLAIM_CHECK_BUCKET = aws_s3_bucket.claim_check[0].bucket
+  } : {}
+}
+
+# DynamoDB table for idempotency keys: processed SQS messages (worker) and
+# Idempotency-Key responses (API handler); expired keys are removed by TTL
+resource "aws_dynamodb_table" "idempotency" {
+  count        = var.enable_idempotency_table ? 1 : 0
+  name         = "${var.project_name}-${var.environment}-idempotency"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "id"
+
+  attribute {
+    name = "id"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = var.tags
+}
+
+locals {
+  idempotency_env_vars = var.enable_idempotency_table ? {
+    IDEMPOTENCY_TABLE = aws_dynamodb_table.idempotency[0].name
+  } : {}
+}
+
+# DynamoDB table for per-client token buckets shared by all lambda1 containers
+resource "aws_dynamodb_table" "rate_limit" {
+  count        = var.rate_limit_per_second > 0 && var.enable_shared_rate_limit ? 1 : 0
+  name         = "${var.project_name}-${var.environment}-rate-limit"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "id"
+
+  attribute {
+    name = "id"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = var.tags
+}
+
+locals {
+  rate_limit_env_vars = var.rate_limit_per_second > 0 ? merge({
+    RATE_LIMIT_PER_SECOND = tostring(var.rate_limit_per_second)
+    RATE_LIMIT_BURST      = tostring(var.rate_limit_burst > 0 ? var.rate_limit_burst : var.rate_limit_per_second)
+    RATE_LIMIT_KEY        = var.rate_limit_key
+  }, var.enable_shared_rate_limit ? {
+    RATE_LIMIT_TABLE = aws_dynamodb_table.rate_limit[0].name
+  } : {}) : {}
+}
+
 # API Gateway REST API
 resource "aws_api_gateway_rest_api" "api" {
   name        = "${var.project_name}-${var.environment}-api"
@@ -203,6 +372,39 @@ resource "aws_lambda_event_source_mapping" "sqs_trigger" {
   function_name    = aws_lambda_function.lambda2.arn
   batch_size       = var.sqs_batch_size
 
+  # Only the records in batchItemFailures are retried (failed or deferred ones), not the whole batch
+  function_response_types = ["ReportBatchItemFailures"]
+
+  depends_on = [aws_iam_role_policy.lambda2_policy]
+}
+
+# One mapping per priority lane; its maximum concurrency is the lane's share of worker invocations
+resource "aws_lambda_event_source_mapping" "lane_trigger" {
+  for_each = var.priority_lanes
+
+  event_source_arn = aws_sqs_queue.lane_queue[each.key].arn
+  function_name    = aws_lambda_function.lambda2.arn
+  batch_size       = var.sqs_batch_size
+
+  function_response_types = ["ReportBatchItemFailures"]
+
+  scaling_config {
+    maximum_concurrency = each.value
+  }
+
+  depends_on = [aws_iam_role_policy.lambda2_policy]
+}
+
+# Every shard feeds the same worker
+resource "aws_lambda_event_source_mapping" "shard_trigger" {
+  count = var.queue_shards - 1
+
+  event_source_arn = aws_sqs_queue.shard_queue[count.index].arn
+  function_name    = aws_lambda_function.lambda2.arn
+  batch_size       = var.sqs_batch_size
+
+  function_response_types = ["ReportBatchItemFailures"]
+
   depends_on = [aws_iam_role_policy.lambda2_policy]
 }
 
@@ -249,7 +451,7 @@ resource "aws_iam_role_policy" "lambda1_policy" {
           "sqs:SendMessage",
           "sqs:GetQueueAttributes"
         ]
-        Resource = aws_sqs_queue.message_queue.arn
+        Resource = local.queue_arns
       },
       {
         Effect = "Allow"
@@ -315,7 +517,112 @@ resource "aws_iam_role_policy" "lambda2_policy" {
           "sqs:DeleteMessage",
           "sqs:GetQueueAttributes"
         ]
-        Resource = aws_sqs_queue.message_queue.arn
+        Resource = local.queue_arns
+      }
+    ]
+  })
+}
+
+# Claim-check permissions: lambda1 uploads, lambda2 reads and deletes
+resource "aws_iam_role_policy" "lambda1_claim_check_policy" {
+  count = var.enable_claim_check ? 1 : 0
+  name  = "${var.project_name}-${var.environment}-lambda1-claim-check-policy"
+  role  = aws_iam_role.lambda1_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:PutObject",
+          "s3:AbortMultipartUpload"
+        ]
+        Resource = "${aws_s3_bucket.claim_check[0].arn}/*"
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy" "lambda2_claim_check_policy" {
+  count = var.enable_claim_check ? 1 : 0
+  name  = "${var.project_name}-${var.environment}-lambda2-claim-check-policy"
+  role  = aws_iam_role.lambda2_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject",
+          "s3:DeleteObject"
+        ]
+        Resource = "${aws_s3_bucket.claim_check[0].arn}/*"
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy" "lambda2_idempotency_policy" {
+  count = var.enable_idempotency_table ? 1 : 0
+  name  = "${var.project_name}-${var.environment}-lambda2-idempotency-policy"
+  role  = aws_iam_role.lambda2_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:BatchGetItem",
+          "dynamodb:BatchWriteItem",
+          "dynamodb:PutItem",
+          "dynamodb:DeleteItem"
+        ]
+        Resource = aws_dynamodb_table.idempotency[0].arn
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy" "lambda1_idempotency_policy" {
+  count = var.enable_idempotency_table ? 1 : 0
+  name  = "${var.project_name}-${var.environment}-lambda1-idempotency-policy"
+  role  = aws_iam_role.lambda1_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:BatchGetItem",
+          "dynamodb:BatchWriteItem",
+          "dynamodb:PutItem",
+          "dynamodb:DeleteItem"
+        ]
+        Resource = aws_dynamodb_table.idempotency[0].arn
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy" "lambda1_rate_limit_policy" {
+  count = length(aws_dynamodb_table.rate_limit)
+  name  = "${var.project_name}-${var.environment}-lambda1-rate-limit-policy"
+  role  = aws_iam_role.lambda1_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem"
+        ]
+        Resource = aws_dynamodb_table.rate_limit[0].arn
       }
     ]
   })
@@ -61,6 +61,16 @@ output "sqs_queue_url" {
   value       = aws_sqs_queue.message_queue.url
 }
 
+output "priority_lane_queue_urls" {
+  description = "URLs of the priority lane queues by lane name"
+  value       = { for name, queue in aws_sqs_queue.lane_queue : name => queue.url }
+}
+
+output "shard_queue_urls" {
+  description = "URLs of all default-lane shards, the main queue first"
+  value       = concat([aws_sqs_queue.message_queue.url], aws_sqs_queue.shard_queue[*].url)
+}
+
 output "sqs_dlq_arn" {
   description = "ARN of the SQS dead letter queue"
   value       = aws_sqs_queue.dlq.arn
@@ -111,3 +121,13 @@ output "lambda_functions_summary" {
     }
   }
 }
+
+output "claim_check_bucket" {
+  description = "Name of the claim-check S3 bucket (null if disabled)"
+  value       = var.enable_claim_check ? aws_s3_bucket.claim_check[0].bucket : null
+}
+
+output "idempotency_table" {
+  description = "Name of the idempotency DynamoDB table (null if disabled)"
+  value       = var.enable_idempotency_table ? aws_dynamodb_table.idempotency[0].name : null
+}
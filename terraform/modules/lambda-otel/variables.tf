@@ -91,6 +91,101 @@ variable "sqs_visibility_timeout" {
   default     = 300
 }
 
+variable "priority_lanes" {
+  description = "Priority lanes besides the default queue: lane name => maximum concurrent worker invocations for its queue (at least 2)"
+  type        = map(number)
+  default     = {}
+}
+
+variable "priority_field" {
+  description = "Dotted request body field whose value selects the priority lane"
+  type        = string
+  default     = "priority"
+}
+
+variable "admission_control" {
+  description = "API admission policy when the queue backlog reaches admission_max_depth: reject, shed, degrade or empty (off)"
+  type        = string
+  default     = ""
+
+  validation {
+    condition     = contains(["", "reject", "shed", "degrade"], var.admission_control)
+    error_message = "admission_control must be one of reject, shed, degrade or empty."
+  }
+}
+
+variable "admission_max_depth" {
+  description = "Queue backlog (ApproximateNumberOfMessages) at which admission_control applies"
+  type        = number
+  default     = 10000
+}
+
+variable "rate_limit_per_second" {
+  description = "Sustained API requests per second allowed per client (0 disables rate limiting)"
+  type        = number
+  default     = 0
+}
+
+variable "rate_limit_burst" {
+  description = "Token bucket size per client (0: same as rate_limit_per_second)"
+  type        = number
+  default     = 0
+}
+
+variable "rate_limit_key" {
+  description = "Comma-separated client key sources: api_key, source_ip, header:<name>"
+  type        = string
+  default     = "api_key,source_ip"
+}
+
+variable "enable_shared_rate_limit" {
+  description = "Keep token buckets in DynamoDB so the limit holds across lambda1 containers"
+  type        = bool
+  default     = false
+}
+
+variable "request_schema_path" {
+  description = "JSON schema file in the lambda1 source directory that /process bodies are validated against (empty disables validation)"
+  type        = string
+  default     = ""
+}
+
+variable "fifo_queue" {
+  description = "Create FIFO queues: ordered per message group, deduplicated, processed group-parallel by lambda2 (sqs_batch_size at most 10)"
+  type        = bool
+  default     = false
+}
+
+variable "fifo_message_group_field" {
+  description = "Dotted /process body field whose value is the SQS MessageGroupId (requests without it share one group)"
+  type        = string
+  default     = "customerId"
+}
+
+variable "fifo_deduplication_field" {
+  description = "Dotted /process body field whose value is the MessageDeduplicationId (empty: Idempotency-Key header, else a hash of the body)"
+  type        = string
+  default     = ""
+}
+
+variable "fifo_group_concurrency" {
+  description = "Message groups of one FIFO batch that lambda2 processes in parallel"
+  type        = number
+  default     = 4
+}
+
+variable "queue_shards" {
+  description = "Number of SQS queues the default lane is hash-sharded over (1: no sharding)"
+  type        = number
+  default     = 1
+}
+
+variable "shard_key_field" {
+  description = "Dotted /process body field hashed to pick a shard (empty: the FIFO message group field, else the request id)"
+  type        = string
+  default     = ""
+}
+
 variable "sqs_batch_size" {
   description = "SQS batch size for Lambda trigger"
   type        = number
@@ -110,3 +205,23 @@ variable "additional_iam_permissions" {
   type        = list(string)
   default     = []
 }
+
+# Claim-check Configuration
+variable "enable_claim_check" {
+  description = "Create an S3 bucket for offloading SQS message bodies above 256 KB (claim check)"
+  type        = bool
+  default     = false
+}
+
+variable "claim_check_expiration_days" {
+  description = "Days after which unprocessed claim-check objects are deleted"
+  type        = number
+  default     = 7
+}
+
+# Idempotency Configuration
+variable "enable_idempotency_table" {
+  description = "Create a DynamoDB table for idempotency keys (persistent dedup across containers)"
+  type        = bool
+  default     = false
+}
@@ -18,6 +18,16 @@ output "sqs_queue_arn" {
   value       = module.lambda_otel.sqs_queue_arn
 }
 
+output "priority_lane_queue_urls" {
+  description = "URLs of the priority lane queues"
+  value       = module.lambda_otel.priority_lane_queue_urls
+}
+
+output "shard_queue_urls" {
+  description = "URLs of the default-lane queue shards"
+  value       = module.lambda_otel.shard_queue_urls
+}
+
 output "lambda1_function_name" {
   description = "Lambda 1 (API Handler) function name"
   value       = module.lambda_otel.lambda1_function_name
@@ -56,8 +66,9 @@ output "configuration_summary" {
     description = {
       xray_adot = "X-Ray tracing with AWS Distro for OpenTelemetry (ADOT) layer"
 
-      newrelic_community = "New Relic monitoring with Community OpenTelemetry layer"
-      newrelic_native    = "New Relic monitoring with native Lambda layer (APM mode)"
+      newrelic_community       = "New Relic monitoring with Community OpenTelemetry layer"
+      newrelic_community_relay = "New Relic monitoring with Community OpenTelemetry via the OTLP relay extension"
+      newrelic_native          = "New Relic monitoring with native Lambda layer (APM mode)"
     }[var.observability_config]
     backend    = startswith(var.observability_config, "newrelic") ? "New Relic" : "AWS X-Ray"
     layer_type = endswith(var.observability_config, "adot") ? "AWS ADOT" : var.observability_config == "newrelic_native" ? "New Relic Native" : "Community OpenTelemetry"
@@ -48,10 +48,11 @@ variable "observability_config" {
   validation {
     condition = contains([
       "xray_adot",          # X-Ray with ADOT layer
-      "newrelic_community", # New Relic with community OTel
-      "newrelic_native"     # New Relic native layer
+      "newrelic_community",       # New Relic with community OTel
+      "newrelic_community_relay", # New Relic with community OTel via the OTLP relay extension
+      "newrelic_native"           # New Relic native layer
     ], var.observability_config)
-    error_message = "Observability config must be one of: xray_adot, newrelic_community, newrelic_native."
+    error_message = "Observability config must be one of: xray_adot, newrelic_community, newrelic_community_relay, newrelic_native."
   }
 }
 
@@ -91,3 +92,109 @@ variable "enable_newrelic_aws_integration" {
   type        = bool
   default     = false
 }
+
+variable "enable_claim_check" {
+  description = "Offload SQS message bodies above 256 KB to an S3 bucket (claim check)"
+  type        = bool
+  default     = false
+}
+
+variable "enable_idempotency_table" {
+  description = "Create a DynamoDB table so redelivered SQS messages are skipped across containers"
+  type        = bool
+  default     = false
+}
+
+variable "priority_lanes" {
+  description = "Extra SQS queues for priority lanes: lane name => maximum concurrent worker invocations, e.g. { high = 20 }"
+  type        = map(number)
+  default     = {}
+}
+
+variable "priority_field" {
+  description = "Request body field (dotted path) that selects the priority lane"
+  type        = string
+  default     = "priority"
+}
+
+variable "admission_control" {
+  description = "What the API does once the queue backlog reaches admission_max_depth: reject (429), shed (probabilistic 429), degrade (low lane) or empty for off"
+  type        = string
+  default     = ""
+
+  validation {
+    condition     = contains(["", "reject", "shed", "degrade"], var.admission_control)
+    error_message = "admission_control must be one of reject, shed, degrade or empty."
+  }
+}
+
+variable "admission_max_depth" {
+  description = "Queue backlog at which admission control applies"
+  type        = number
+  default     = 10000
+}
+
+variable "rate_limit_per_second" {
+  description = "Per-client API rate limit in requests per second (0 disables it)"
+  type        = number
+  default     = 0
+}
+
+variable "rate_limit_burst" {
+  description = "Requests a client may burst above its rate (0: one second's worth)"
+  type        = number
+  default     = 0
+}
+
+variable "rate_limit_key" {
+  description = "How clients are identified: comma-separated api_key, source_ip or header:<name>"
+  type        = string
+  default     = "api_key,source_ip"
+}
+
+variable "enable_shared_rate_limit" {
+  description = "Share token buckets across lambda1 containers through a DynamoDB table"
+  type        = bool
+  default     = false
+}
+
+variable "request_schema_path" {
+  description = "Schema for /process request bodies, relative to lambda1/; invalid requests get 400 instead of being enqueued (empty disables validation)"
+  type        = string
+  default     = "request_schema.json"
+}
+
+variable "fifo_queue" {
+  description = "Use FIFO queues: in order per message group and deduplicated; lambda2 processes different groups in parallel"
+  type        = bool
+  default     = false
+}
+
+variable "fifo_message_group_field" {
+  description = "Dotted /process body field that selects the message group (only with fifo_queue)"
+  type        = string
+  default     = "customerId"
+}
+
+variable "fifo_deduplication_field" {
+  description = "Dotted /process body field used as deduplication id (empty: Idempotency-Key header, else a hash of the body)"
+  type        = string
+  default     = ""
+}
+
+variable "queue_shards" {
+  description = "SQS queues the default lane is spread over by consistent hashing of shard_key_field; each gets its own worker trigger"
+  type        = number
+  default     = 1
+
+  validation {
+    condition     = var.queue_shards >= 1 && floor(var.queue_shards) == var.queue_shards
+    error_message = "queue_shards must be a whole number of at least 1."
+  }
+}
+
+variable "shard_key_field" {
+  description = "Dotted /process body field that keeps a tenant on one shard (empty: fifo_message_group_field with fifo_queue, else requests spread evenly)"
+  type        = string
+  default     = ""
+}